@@ -0,0 +1,119 @@
+"""广播基准：一个沙龙同时被 N 个旁观者订阅时，沙龙本身的耗时、请求数和旁观者收到的事件数。
+
+启动本地 mock provider，运行一个沙龙并把事件发布到 EventBus，N 个旁观者各自订阅并用 ChatRenderer
+渲染。其中每隔 slow_every 个旁观者每推送一帧就等待 slow_delay 秒，模拟网络慢的浏览器；另有一半的
+旁观者在沙龙进行到一半时才加入。报告沙龙的耗时与请求数（不应随 N 变化）、快/慢旁观者平均收到的
+事件数（慢的旁观者收到的是合并后的片段），并检查每个旁观者最终渲染的讨论记录与直接渲染原始事件流的
+结果完全一致。
+
+用法:
+    python benchmarks/bench_broadcast.py [--spectators 0 10 100 1000] [--rounds 2]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from dataclasses import replace
+
+from bench_e2e import mock_config, start_mock
+
+
+async def run(args, url: str, spectators: int) -> dict:
+    from broadcast import RESYNC, EventBus
+    from config import TranscriptConfig
+    from renderer import ChatRenderer
+    from salon import Salon
+    from utils import SSEClient
+
+    SSEClient.sem = asyncio.Semaphore(100_000)
+    config = replace(
+        mock_config(url, args.rounds), transcript=TranscriptConfig(enabled=False)
+    )
+    salon = Salon(config)
+    bus = EventBus(args.capacity)
+    reference = ChatRenderer(salon.rounds, 0)
+
+    async def produce():
+        start = time.perf_counter()
+        async for event_type, data in salon.chatting():
+            reference.handle(event_type, data)
+            bus.publish(event_type, data)
+        bus.close()
+        return time.perf_counter() - start
+
+    async def spectate(index: int):
+        slow = args.slow_every and index % args.slow_every == 0
+        if index % 2:
+            # 一半的旁观者中途加入
+            await asyncio.sleep(args.join_after)
+        renderer = ChatRenderer(salon.rounds, args.flush_interval)
+        received = 0
+        async for event_type, data in bus.subscribe():
+            received += 1
+            if event_type == RESYNC:
+                renderer = ChatRenderer(salon.rounds, args.flush_interval)
+            elif renderer.handle(event_type, data):
+                renderer.frame()
+                await asyncio.sleep(args.slow_delay if slow else 0)
+        return slow, received, renderer.frame()[0]
+
+    results = await asyncio.gather(
+        produce(), *(spectate(index) for index in range(spectators))
+    )
+    elapsed, watched = results[0], results[1:]
+    expected = reference.frame()[0]
+    fast = [received for slow, received, _ in watched if not slow]
+    slow = [received for slow, received, _ in watched if slow]
+    return {
+        "elapsed": elapsed,
+        "requests": len(salon.metrics.turns),
+        "published": bus.seq,
+        "fast": sum(fast) / len(fast) if fast else 0,
+        "slow": sum(slow) / len(slow) if slow else 0,
+        "mismatched": sum(history != expected for _, _, history in watched),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--spectators", type=int, nargs="+", default=[0, 10, 100, 1000])
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.1)
+    parser.add_argument("--token-rate", type=float, default=200)
+    parser.add_argument("--content-tokens", type=int, default=100)
+    parser.add_argument("--reasoning-tokens", type=int, default=40)
+    parser.add_argument("--capacity", type=int, default=4096)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    parser.add_argument("--slow-every", type=int, default=4)
+    parser.add_argument("--slow-delay", type=float, default=0.2)
+    parser.add_argument("--join-after", type=float, default=1.0)
+    args = parser.parse_args()
+    url = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    mock = start_mock(args)
+    try:
+        print(
+            f"{'spectators':>10} {'salon time':>11} {'requests':>9} {'events':>7} "
+            f"{'fast recv':>10} {'slow recv':>10} {'mismatched':>11}"
+        )
+        for spectators in args.spectators:
+            r = asyncio.run(run(args, url, spectators))
+            print(
+                f"{spectators:>10} {r['elapsed']:>10.2f}s {r['requests']:>9} "
+                f"{r['published']:>7} {r['fast']:>10.0f} {r['slow']:>10.0f} "
+                f"{r['mismatched']:>11}"
+            )
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    main()
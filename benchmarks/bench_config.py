@@ -0,0 +1,95 @@
+"""配置访问开销基准：Dynaconf 全局 settings 与不可变配置快照。
+
+旧版 Salon.chatting 在主持人的每个流式片段上都会读取 ``settings.show_hoster``，
+每轮还会读取 ``settings.rounds`` 和 ``settings.template.salon_cache``。
+本脚本模拟这些逐事件的读取，比较每个事件增加的开销。
+
+用法:
+    python benchmarks/bench_config.py [--events 200000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from config import load_config, settings  # noqa: E402
+
+
+def per_event_dynaconf(events: int) -> int:
+    shown = 0
+    for _ in range(events):
+        # 旧版：每个片段判断一次是否展示，再判断一次是否输出
+        if settings.show_hoster:
+            shown += 1
+        if settings.show_hoster:
+            shown += 1
+    return shown
+
+
+def per_event_snapshot(events: int, config) -> int:
+    shown = 0
+    for _ in range(events):
+        if config.show_hoster:
+            shown += 1
+        if config.show_hoster:
+            shown += 1
+    return shown
+
+
+def per_event_local(events: int, config) -> int:
+    # 新版：每个沙龙开始时读一次放进局部变量
+    shown = 0
+    show_hoster = config.show_hoster
+    for _ in range(events):
+        if show_hoster:
+            shown += 1
+        if show_hoster:
+            shown += 1
+    return shown
+
+
+def nested_lookups(events: int, root) -> int:
+    total = 0
+    for _ in range(events):
+        total += len(root.template.salon_cache.speaker) + root.rounds
+    return total
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=200_000)
+    args = parser.parse_args()
+    n = args.events
+
+    start = time.perf_counter()
+    config = load_config()
+    print(f"snapshot built once in {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+    rows = [
+        ("dynaconf settings.show_hoster", timed(per_event_dynaconf, n)),
+        ("snapshot config.show_hoster", timed(per_event_snapshot, n, config)),
+        ("snapshot hoisted to local", timed(per_event_local, n, config)),
+        ("dynaconf template/rounds", timed(nested_lookups, n, settings)),
+        ("snapshot template/rounds", timed(nested_lookups, n, config)),
+    ]
+    for name, elapsed in rows:
+        print(f"{name:<32} {elapsed / n * 1e9:>10.1f} ns/event")
+    print(
+        f"per-event overhead removed on the hoster stream: "
+        f"{(rows[0][1] - rows[2][1]) / n * 1e9:.1f} ns"
+    )
+
+
+if __name__ == "__main__":
+    main()
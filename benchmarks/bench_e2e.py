@@ -0,0 +1,172 @@
+"""端到端吞吐基准：本地 mock provider + 并发运行的完整沙龙。
+
+启动 ``src/mock_provider.py`` 子进程，把所有发言者和主持人指向它，
+然后分别以 1、10、100 个并发沙龙运行，报告 salons/min、events/sec、
+单次发言延迟的 p50/p99 以及进程峰值 RSS。每个并发级别在独立子进程中运行，
+以保证峰值 RSS 互不影响。
+
+用法:
+    python benchmarks/bench_e2e.py [--levels 1 10 100] [--rounds 3] [--ttft 0.2] [--token-rate 200]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+from dataclasses import replace
+from types import MappingProxyType
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(int(round(q / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def mock_config(url: str, rounds: int):
+    from config import ProviderConfig, get_config
+
+    base = get_config()
+    provider = ProviderConfig(
+        name="mock", url=url, api_key="mock", max_concurrency=100_000, pool_size=0
+    )
+    return replace(
+        base,
+        rounds=rounds,
+        providers=MappingProxyType({"mock": provider}),
+        chatters=tuple(replace(c, provider="mock") for c in base.chatters),
+        hoster=replace(base.hoster, provider="mock"),
+    )
+
+
+async def run_level(concurrency: int, url: str, rounds: int) -> dict:
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    from salon import Salon
+    from utils import SSEClient
+
+    config = mock_config(url, rounds)
+    SSEClient.sem = asyncio.Semaphore(100_000)
+    turn_latencies = []
+    counts = {"events": 0}
+
+    async def one_salon():
+        turn_start = None
+        async for event_type, _ in Salon(config).chatting():
+            counts["events"] += 1
+            if event_type in ("speaker_turn", "new_turn", "task_finish"):
+                now = time.perf_counter()
+                if turn_start is not None:
+                    turn_latencies.append(now - turn_start)
+                turn_start = now if event_type == "speaker_turn" else None
+        if turn_start is not None:
+            turn_latencies.append(time.perf_counter() - turn_start)
+
+    start = time.perf_counter()
+    async with SSEClient.pool():
+        await asyncio.gather(*(one_salon() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "salons_per_min": concurrency / elapsed * 60,
+        "events_per_sec": counts["events"] / elapsed,
+        "turn_p50": percentile(turn_latencies, 50),
+        "turn_p99": percentile(turn_latencies, 99),
+        # Linux 上 ru_maxrss 的单位是 KB
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def start_mock(args, *extra: str) -> subprocess.Popen:
+    """extra 为额外传给 mock_provider.py 的命令行参数"""
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(SRC_DIR, "mock_provider.py"),
+            "--port",
+            str(args.port),
+            "--ttft",
+            str(args.ttft),
+            "--token-rate",
+            str(args.token_rate),
+            "--content-tokens",
+            str(args.content_tokens),
+            "--reasoning-tokens",
+            str(args.reasoning_tokens),
+            "--complete-after",
+            "0",
+            *extra,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{args.port}/health", timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("mock provider did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-rate", type=float, default=200)
+    parser.add_argument("--content-tokens", type=int, default=60)
+    parser.add_argument("--reasoning-tokens", type=int, default=20)
+    parser.add_argument("--run-level", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    url = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+
+    if args.run_level:
+        result = asyncio.run(run_level(args.run_level, url, args.rounds))
+        print(json.dumps(result))
+        return
+
+    mock = start_mock(args)
+    try:
+        print(
+            f"{'salons':>7} {'salons/min':>11} {'events/s':>10} "
+            f"{'p50 turn':>9} {'p99 turn':>9} {'peak RSS':>9}"
+        )
+        for level in args.levels:
+            output = subprocess.run(
+                [sys.executable, __file__, "--run-level", str(level)]
+                + ["--rounds", str(args.rounds), "--port", str(args.port)],
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=SRC_DIR,
+            ).stdout
+            r = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{r['concurrency']:>7} {r['salons_per_min']:>11.1f} "
+                f"{r['events_per_sec']:>10.0f} {r['turn_p50']:>8.2f}s "
+                f"{r['turn_p99']:>8.2f}s {r['peak_rss_mb']:>7.1f}MB"
+            )
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""多端点路由基准：偶发慢请求下单端点、端点池与对冲请求的发言延迟。
+
+启动两个 mock provider 作为等价端点，两者都有 slow_rate 比例的请求首 token 延迟为 slow_ttft 秒。
+分别用单个端点、两个端点的池、以及开启 hedge_after 的池运行同样的一批并发沙龙，
+报告单次发言耗时的 p50/p99、最慢一轮的耗时以及对冲请求的次数与胜出次数。
+
+用法:
+    python benchmarks/bench_routing.py [--salons 20] [--rounds 3] [--slow-rate 0.1] [--hedge-after 1.0]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from dataclasses import replace
+
+from bench_e2e import SRC_DIR, mock_config, percentile
+
+
+def start_mock(port: int, seed: int, args) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(SRC_DIR, "mock_provider.py"),
+            "--port",
+            str(port),
+            "--ttft",
+            str(args.ttft),
+            "--token-rate",
+            str(args.token_rate),
+            "--content-tokens",
+            str(args.content_tokens),
+            "--complete-after",
+            "0",
+            "--slow-rate",
+            str(args.slow_rate),
+            "--slow-ttft",
+            str(args.slow_ttft),
+            "--seed",
+            str(seed),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("mock provider did not start")
+
+
+def routed_config(args, endpoints: int, hedge_after):
+    from config import TranscriptConfig
+
+    config = mock_config(
+        f"http://127.0.0.1:{args.port}/v1/chat/completions", args.rounds
+    )
+    provider = config.providers["mock"]
+    pool = tuple(
+        replace(
+            provider,
+            name=f"mock#{index}",
+            url=f"http://127.0.0.1:{args.port + index - 1}/v1/chat/completions",
+        )
+        for index in range(2, endpoints + 1)
+    )
+    provider = replace(provider, endpoints=pool, hedge_after=hedge_after)
+    return replace(
+        config,
+        providers={"mock": provider},
+        transcript=TranscriptConfig(enabled=False),
+    )
+
+
+async def run(args, endpoints: int, hedge_after) -> dict:
+    import router
+    from salon import Salon
+    from utils import SSEClient
+
+    # 每种配置从零开始估计端点延迟
+    router.router = router.Router()
+    SSEClient.sem = asyncio.Semaphore(100_000)
+    config = routed_config(args, endpoints, hedge_after)
+    hedges = router.HEDGES.value("mock")
+    wins = router.HEDGE_WINS.value("mock")
+
+    async def one_salon():
+        salon = Salon(config)
+        async for _ in salon.chatting():
+            pass
+        return salon.metrics
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one_salon() for _ in range(args.salons)))
+    elapsed = time.perf_counter() - start
+    turns = [turn.duration for metrics in results for turn in metrics.turns]
+    rounds = [duration for metrics in results for duration in metrics.rounds]
+    return {
+        "elapsed": elapsed,
+        "turn_p50": percentile(turns, 50),
+        "turn_p99": percentile(turns, 99),
+        "round_max": max(rounds),
+        "hedges": router.HEDGES.value("mock") - hedges,
+        "wins": router.HEDGE_WINS.value("mock") - wins,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--salons", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-rate", type=float, default=200)
+    parser.add_argument("--content-tokens", type=int, default=40)
+    parser.add_argument("--slow-rate", type=float, default=0.1)
+    parser.add_argument("--slow-ttft", type=float, default=5.0)
+    parser.add_argument("--hedge-after", type=float, default=1.0)
+    args = parser.parse_args()
+
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    mocks = [start_mock(args.port, 1, args), start_mock(args.port + 1, 2, args)]
+    try:
+        print(
+            f"{'setup':>22} {'elapsed':>8} {'p50 turn':>9} {'p99 turn':>9} "
+            f"{'max round':>10} {'hedges':>7} {'won':>5}"
+        )
+        for label, endpoints, hedge_after in (
+            ("single endpoint", 1, None),
+            ("2 endpoints", 2, None),
+            (f"2 endpoints, hedge {args.hedge_after}s", 2, args.hedge_after),
+        ):
+            r = asyncio.run(run(args, endpoints, hedge_after))
+            print(
+                f"{label:>22} {r['elapsed']:>7.1f}s {r['turn_p50']:>8.2f}s "
+                f"{r['turn_p99']:>8.2f}s {r['round_max']:>9.2f}s "
+                f"{r['hedges']:>7.0f} {r['wins']:>5.0f}"
+            )
+    finally:
+        for mock in mocks:
+            mock.terminate()
+            mock.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""发言调度基准：参与人数增加时每轮的请求数与 prompt token 数。
+
+启动本地 mock provider，用 N 个发言者（角色设定取自几类不同的主题）运行沙龙，比较各个调度策略下
+平均每轮的请求数、prompt token 数以及共享发言记录中尚未读完的记录数峰值。round_robin 的 prompt
+随 N 平方增长，限制每轮发言人数或分组之后应当接近线性。
+
+用法:
+    python benchmarks/bench_scheduler.py [--sizes 5 10 20 40] [--rounds 4] [--per-round 5]
+"""
+
+import argparse
+import asyncio
+import sys
+from dataclasses import replace
+
+from bench_e2e import mock_config, start_mock
+
+ROLES = [
+    "诗人，擅长意象与抒情，关注诗歌的情感与韵律",
+    "历史学者，研究河北的古城、长城与历史典故",
+    "旅行博主，熟悉周末出行路线、交通与美食",
+    "格律专家，审查平仄、韵脚与词牌格式",
+    "摄影师，关注山水风光、光影与画面构图",
+]
+
+
+def salon_config(url: str, rounds: int, size: int, policy: str, per_round: int):
+    from config import ChatterConfig, SchedulerConfig, TranscriptConfig
+
+    base = mock_config(url, rounds)
+    template: ChatterConfig = base.chatters[0]
+    chatters = tuple(
+        replace(
+            template,
+            name=f"发言者{i}",
+            system_prompt=f"你是{ROLES[i % len(ROLES)]}。",
+        )
+        for i in range(size)
+    )
+    names = [chatter.name for chatter in chatters]
+    if policy == "round_robin":
+        scheduler = SchedulerConfig()
+    elif policy == "groups":
+        groups = {
+            f"组{start // per_round}": tuple(names[start : start + per_round])
+            for start in range(0, size, per_round)
+        }
+        scheduler = SchedulerConfig(policy="groups", groups=groups)
+    else:
+        scheduler = SchedulerConfig(
+            policy=policy, speakers_per_round=per_round, max_unread=2 * per_round
+        )
+    return replace(
+        base,
+        chatters=chatters,
+        scheduler=scheduler,
+        transcript=TranscriptConfig(enabled=False),
+    )
+
+
+async def run(url: str, rounds: int, size: int, policy: str, per_round: int) -> dict:
+    from salon import Salon
+    from utils import SSEClient
+
+    SSEClient.sem = asyncio.Semaphore(100_000)
+    salon = Salon(salon_config(url, rounds, size, policy, per_round))
+    peak_log = 0
+    async for _ in salon.chatting():
+        peak_log = max(peak_log, len(salon.log))
+    turns = salon.metrics.turns
+    return {
+        "requests": len(turns) / rounds,
+        "prompt_tokens": sum(turn.prompt_tokens or 0 for turn in turns) / rounds,
+        "peak_log": peak_log,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 10, 20, 40])
+    parser.add_argument(
+        "--policies",
+        nargs="+",
+        default=["round_robin", "hoster_selected", "relevance", "groups"],
+    )
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--per-round", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.0)
+    parser.add_argument("--token-rate", type=float, default=0)
+    parser.add_argument("--content-tokens", type=int, default=60)
+    parser.add_argument("--reasoning-tokens", type=int, default=0)
+    args = parser.parse_args()
+    url = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    mock = start_mock(args)
+    try:
+        print(
+            f"{'policy':>16} {'chatters':>9} {'requests/round':>15} "
+            f"{'prompt tokens/round':>20} {'peak log':>9}"
+        )
+        for policy in args.policies:
+            for size in args.sizes:
+                r = asyncio.run(run(url, args.rounds, size, policy, args.per_round))
+                print(
+                    f"{policy:>16} {size:>9} {r['requests']:>15.1f} "
+                    f"{r['prompt_tokens']:>20.0f} {r['peak_log']:>9}"
+                )
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    main()
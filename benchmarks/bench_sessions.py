@@ -0,0 +1,205 @@
+"""多会话负载测试：一个 Gradio 进程同时为多个浏览器会话运行沙龙。
+
+启动本地 mock provider，并在子进程中启动 ``interface.launch()``（与客户端分开，避免争用 GIL），按 Gradio 的队列协议模拟 N 个独立会话同时点击“开始讨论”，
+其中每隔 stop_every 个会话在收到第一帧后点击“停止讨论”。报告 salons/min、首帧延迟、停止生效延迟，
+并检查停止只影响发起停止的会话。
+
+用法:
+    python benchmarks/bench_sessions.py [--sessions 32] [--rounds 3] [--stop-every 4]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from dataclasses import replace
+from typing import Dict, List, Tuple
+
+import aiohttp
+from bench_e2e import SRC_DIR, mock_config, percentile, start_mock
+
+STOPPED_TITLE = "# LLM 沙龙已停止"
+
+
+async def run_session(
+    http: aiohttp.ClientSession, url: str, fn_index: Dict[str, int], stop: bool
+) -> dict:
+    """按 Gradio 的 sse_v3 协议模拟一个浏览器会话：加入队列，从会话的数据流中读取输出"""
+    session_hash = uuid.uuid4().hex[:12]
+
+    async def join(api_name: str) -> str:
+        async with http.post(
+            f"{url}/gradio_api/queue/join",
+            json={
+                "data": [None],
+                "event_data": None,
+                "fn_index": fn_index[api_name],
+                "trigger_id": None,
+                "session_hash": session_hash,
+            },
+        ) as response:
+            return (await response.json())["event_id"]
+
+    start = time.perf_counter()
+    run_event = await join("run_salon_gradio")
+    first_frame = stop_sent = None
+    result = {"stop": stop, "error": None, "title": None}
+    async with http.get(
+        f"{url}/gradio_api/queue/data", params={"session_hash": session_hash}
+    ) as response:
+        async for line in response.content:
+            if not line.startswith(b"data:"):
+                continue
+            message = json.loads(line[5:])
+            if message.get("event_id") != run_event:
+                continue
+            if message["msg"] == "process_generating" and first_frame is None:
+                first_frame = time.perf_counter() - start
+                if stop:
+                    stop_sent = time.perf_counter()
+                    await join("stop_discussion")
+            elif message["msg"] == "process_completed":
+                if message.get("success"):
+                    result["title"] = message["output"]["data"][1]
+                else:
+                    result["error"] = message["output"].get("error")
+                break
+    end = time.perf_counter()
+    result.update(
+        first_frame=first_frame,
+        elapsed=end - start,
+        stop_latency=end - stop_sent if stop_sent else None,
+        stopped=result["title"] == STOPPED_TITLE,
+    )
+    return result
+
+
+async def run_sessions(args) -> Tuple[List[dict], float]:
+    url = f"http://127.0.0.1:{args.ui_port}"
+    timeout = aiohttp.ClientTimeout(total=None)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as http:
+        async with http.get(f"{url}/config") as response:
+            config = await response.json()
+        fn_index = {d["api_name"]: d["id"] for d in config["dependencies"]}
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                run_session(
+                    http,
+                    url,
+                    fn_index,
+                    args.stop_every > 0 and i % args.stop_every == 0,
+                )
+                for i in range(args.sessions)
+            )
+        )
+    return results, time.perf_counter() - start
+
+
+def serve(args):
+    sys.path.insert(0, SRC_DIR)
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    from config import TranscriptConfig, set_config
+
+    config = mock_config(
+        f"http://127.0.0.1:{args.port}/v1/chat/completions", args.rounds
+    )
+    set_config(
+        replace(
+            config,
+            transcript=TranscriptConfig(directory=tempfile.mkdtemp()),
+            metrics_port=0,
+            stream_flush_interval=args.flush_interval,
+            concurrency_limit=args.sessions,
+        )
+    )
+    from interface import launch
+
+    launch(server_port=args.ui_port, quiet=True)
+
+
+def wait_for(url: str, process: subprocess.Popen):
+    for _ in range(300):
+        if process.poll() is not None:
+            raise RuntimeError("UI server exited")
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("UI server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--stop-every", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ui-port", type=int, default=7861)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-rate", type=float, default=200)
+    parser.add_argument("--content-tokens", type=int, default=60)
+    parser.add_argument("--reasoning-tokens", type=int, default=20)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    mock = start_mock(args)
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", *sys.argv[1:]], cwd=SRC_DIR
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{args.ui_port}/config", server)
+        results, elapsed = asyncio.run(run_sessions(args))
+    finally:
+        for process in (server, mock):
+            process.terminate()
+            process.wait()
+
+    finished = [r for r in results if not r["stop"]]
+    stopped = [r for r in results if r["stop"]]
+    first_frames = [r["first_frame"] for r in results if r["first_frame"] is not None]
+    stop_latencies = [r["stop_latency"] for r in stopped if r["stop_latency"]]
+    print(f"{args.sessions} sessions in {elapsed:.1f}s")
+    print(f"salons/min (completed): {len(finished) / elapsed * 60:.1f}")
+    print(
+        f"first frame p50 {percentile(first_frames, 50):.2f}s, "
+        f"p99 {percentile(first_frames, 99):.2f}s"
+    )
+    if stop_latencies:
+        print(
+            f"stop latency p50 {percentile(stop_latencies, 50):.2f}s, "
+            f"max {max(stop_latencies):.2f}s"
+        )
+    # 停止只应影响发起停止的会话
+    errors = [r["error"] for r in results if r["error"]]
+    if errors:
+        print(f"{len(errors)} sessions failed, first error: {errors[0]}")
+    leaked = [r for r in finished if r["stopped"]]
+    not_stopped = [r for r in stopped if not r["stopped"]]
+    print(
+        f"isolation: {len(leaked)} unrelated sessions stopped, "
+        f"{len(not_stopped)} stop requests ignored"
+    )
+    if errors or leaked or not_stopped:
+        os._exit(1)
+
+
+if __name__ == "__main__":
+    main()
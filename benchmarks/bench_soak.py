@@ -0,0 +1,112 @@
+"""长时间运行基准：连续运行几百个沙龙，观察进程内存是否随完成的沙龙数增长。
+
+启动本地 mock provider，用 SalonSession 和 ChatRenderer 按界面的方式运行 salons 个沙龙，
+同时最多 concurrency 个。每完成 report_every 个沙龙，在 gc.collect() 之后打印当前 RSS、
+仍被会话持有的沙龙数，以及这一批沙龙结束时发言者历史实际占用的内存与每个历史各存一份完整文本时的对比。
+
+用法:
+    python benchmarks/bench_soak.py [--salons 300] [--concurrency 20] [--rounds 3]
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import time
+from dataclasses import replace
+
+from bench_e2e import mock_config, start_mock
+
+
+def current_rss_mb() -> float:
+    """当前（而不是峰值）RSS"""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+async def soak(args, url: str):
+    from config import TranscriptConfig
+    from renderer import ChatRenderer
+    from salon import Salon
+    from session import SalonSession, live_salon_ids
+    from utils import SSEClient
+
+    SSEClient.sem = asyncio.Semaphore(100_000)
+    config = replace(
+        mock_config(url, args.rounds),
+        transcript=TranscriptConfig(enabled=args.transcript),
+    )
+    sessions = [SalonSession() for _ in range(args.concurrency)]
+    queue = asyncio.Queue()
+    for index in range(args.salons):
+        queue.put_nowait(index)
+    reports = []
+    done = 0
+    start = time.perf_counter()
+
+    def report():
+        gc.collect()
+        held = sum(session.salon is not None for session in sessions)
+        history = sum(r["history_bytes"] for r in reports) / len(reports) / 1024
+        unshared = sum(r["unshared_bytes"] for r in reports) / len(reports) / 1024
+        print(
+            f"{done:>6} {time.perf_counter() - start:>7.1f}s {current_rss_mb():>7.1f} MB "
+            f"{held:>5} {len(live_salon_ids()):>5} {history:>9.1f} {unshared:>9.1f}",
+            flush=True,
+        )
+        reports.clear()
+
+    async def worker(session: SalonSession):
+        nonlocal done
+        while not queue.empty():
+            queue.get_nowait()
+            salon = Salon(config)
+            renderer = ChatRenderer(salon.rounds, args.flush_interval)
+            async for event_type, data in session.run(salon):
+                if renderer.handle(event_type, data):
+                    renderer.frame()
+            reports.append(salon.memory_report())
+            done += 1
+            if done % args.report_every == 0:
+                report()
+
+    print(
+        f"{'salons':>6} {'elapsed':>8} {'rss':>10} {'held':>5} {'live':>5} "
+        f"{'hist KiB':>9} {'dup KiB':>9}"
+    )
+    await asyncio.gather(*(worker(session) for session in sessions))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--salons", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--report-every", type=int, default=50)
+    parser.add_argument("--transcript", action="store_true")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=0)
+    parser.add_argument("--content-tokens", type=int, default=200)
+    parser.add_argument("--reasoning-tokens", type=int, default=40)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    args = parser.parse_args()
+    url = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    mock = start_mock(args)
+    try:
+        asyncio.run(soak(args, url))
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    main()
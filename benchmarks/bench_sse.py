@@ -0,0 +1,178 @@
+"""SSE 解析微基准：对比旧的逐行 decode/strip/json.loads 循环与 SSEParser。
+
+用法:
+    python benchmarks/bench_sse.py [--file recorded_stream.txt] [--repeat 200]
+
+``--file`` 指向一次 DeepSeek 流式响应的原始抓包（``curl -N`` 的输出即可）；
+不提供时使用按 DeepSeek 格式生成的流（reasoning + content + usage）。
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+import sse  # noqa: E402
+from sse import DONE, SSEParser  # noqa: E402
+
+
+def deepseek_stream(n_reasoning: int = 400, n_content: int = 800) -> bytes:
+    frames = []
+    base = {
+        "id": "5f3c1e0a-6d7b-4a4e-9f7e-0c1b2d3e4f50",
+        "object": "chat.completion.chunk",
+        "created": 1747000000,
+        "model": "deepseek-reasoner",
+        "system_fingerprint": "fp_5417b77867_prod0425fp8",
+    }
+    for i in range(n_reasoning):
+        delta = {
+            "role": "assistant",
+            "content": None,
+            "reasoning_content": "思考" * (i % 3 + 1),
+        }
+        frames.append(
+            {
+                **base,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": delta,
+                        "logprobs": None,
+                        "finish_reason": None,
+                    }
+                ],
+            }
+        )
+    for i in range(n_content):
+        delta = {"content": "江城子·周末到河北"[i % 8 : i % 8 + 2]}
+        frames.append(
+            {
+                **base,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": delta,
+                        "logprobs": None,
+                        "finish_reason": None,
+                    }
+                ],
+            }
+        )
+    frames.append(
+        {
+            **base,
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"content": ""},
+                    "logprobs": None,
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 1024,
+                "completion_tokens": 1200,
+                "total_tokens": 2224,
+            },
+        }
+    )
+    body = b"".join(
+        b"data: " + json.dumps(f, ensure_ascii=False).encode("utf-8") + b"\n\n"
+        for f in frames
+    )
+    return body + b"data: [DONE]\n\n"
+
+
+def split_network(raw: bytes, seed: int = 0):
+    """模拟网络分包：每个 TCP 读取 64~4096 字节"""
+    rnd = random.Random(seed)
+    chunks, i = [], 0
+    while i < len(raw):
+        n = rnd.randint(64, 4096)
+        chunks.append(raw[i : i + n])
+        i += n
+    return chunks
+
+
+def legacy_loop(chunks):
+    """复刻旧版 send_sse：aiohttp 按行切分后逐行 decode/strip/json.loads"""
+    pieces = 0
+    pending = b""
+    for chunk in chunks:
+        data = pending + chunk
+        lines = data.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if not line:
+                continue
+            decoded_line = line.decode("utf-8").strip()
+            if not decoded_line.startswith("data:"):
+                continue
+            json_data_str = decoded_line[len("data:") :].strip()
+            if json_data_str == "[DONE]":
+                return pieces
+            chunk_obj = json.loads(json_data_str)
+            if "choices" in chunk_obj and chunk_obj["choices"]:
+                pieces += 1
+    return pieces
+
+
+def parser_loop(chunks):
+    pieces = 0
+    parser = SSEParser()
+    for chunk in chunks:
+        for event in parser.feed(chunk):
+            if event.data == DONE:
+                return pieces
+            if event.json().get("choices"):
+                pieces += 1
+    return pieces
+
+
+def bench(name, fn, chunks, repeat):
+    fn(chunks)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pieces = fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<24} {pieces:>6} chunks  {pieces / best:>12,.0f} chunks/sec")
+    return pieces / best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", help="recorded raw SSE stream")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            raw = f.read()
+    else:
+        raw = deepseek_stream()
+    chunks = split_network(raw)
+    print(f"stream: {len(raw)} bytes in {len(chunks)} network reads")
+
+    baseline = bench("legacy line loop", legacy_loop, chunks, args.repeat)
+    orig_loads = sse.loads
+    try:
+        sse.loads = lambda data: json.loads(data.decode("utf-8"))
+        fast_json = bench("SSEParser + json", parser_loop, chunks, args.repeat)
+    finally:
+        sse.loads = orig_loads
+    print(f"{'':<24} speedup x{fast_json / baseline:.2f}")
+    if getattr(orig_loads, "__module__", None) == "orjson":
+        fast_orjson = bench("SSEParser + orjson", parser_loop, chunks, args.repeat)
+        print(f"{'':<24} speedup x{fast_orjson / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""启动基准：模块导入时间，以及无界面和网页界面两条路径从启动进程到第一次请求的时间。
+
+每项测量都在新的子进程中进行，取 repeat 次的中位数：
+  * import：导入 config、salon（引擎）和 interface（网页界面）的耗时，以及导入后是否已经加载了
+    gradio、aiohttp、dynaconf、rich 这些重量级的依赖；
+  * headless：启动 Python 进程、导入引擎、创建沙龙，直到收到 mock provider 的第一个 token；
+  * ui：启动网页界面直到 /config 可以访问，再按 Gradio 的队列协议开始一次讨论直到收到第一帧。
+
+用法:
+    python benchmarks/bench_startup.py [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import replace
+
+import aiohttp
+from bench_e2e import SRC_DIR, mock_config, start_mock
+from bench_sessions import run_session, wait_for
+
+HEAVY = ("gradio", "aiohttp", "dynaconf", "rich")
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, *[name for name in {heavy!r} if name in sys.modules])
+"""
+
+
+def measure_import(module: str) -> tuple:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT.format(module=module, heavy=HEAVY)],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    return float(output[0]), output[1:]
+
+
+def headless(args):
+    """子进程：收到第一个 token 时打印一行"""
+    from config import TranscriptConfig
+    from salon import Salon
+
+    config = replace(
+        mock_config(f"http://127.0.0.1:{args.port}/v1/chat/completions", 1),
+        transcript=TranscriptConfig(enabled=False),
+    )
+
+    async def first_token():
+        async for event_type, _ in Salon(config).chatting():
+            if event_type == "content_piece":
+                return
+
+    asyncio.run(first_token())
+    print("first token", flush=True)
+
+
+def measure_headless(args) -> float:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--headless", "--port", str(args.port)],
+        cwd=SRC_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    line = process.stdout.readline()
+    elapsed = time.perf_counter() - start
+    process.wait()
+    if not line:
+        raise RuntimeError("headless salon failed")
+    return elapsed
+
+
+async def first_frame(url: str) -> float:
+    async with aiohttp.ClientSession() as http:
+        async with http.get(f"{url}/config") as response:
+            config = await response.json()
+        fn_index = {d["api_name"]: d["id"] for d in config["dependencies"]}
+        result = await run_session(http, url, fn_index, stop=True)
+    return result["first_frame"]
+
+
+def measure_ui(args) -> tuple:
+    url = f"http://127.0.0.1:{args.ui_port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "bench_sessions.py"
+            ),
+            "--serve",
+            "--sessions",
+            "1",
+            "--rounds",
+            "1",
+            "--port",
+            str(args.port),
+            "--ui-port",
+            str(args.ui_port),
+        ],
+        cwd=SRC_DIR,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(f"{url}/config", server)
+        ready = time.perf_counter() - start
+        return ready, ready + asyncio.run(first_frame(url))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ui-port", type=int, default=7862)
+    parser.add_argument("--headless", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.headless:
+        headless(args)
+        return
+
+    for module in ("config", "salon", "interface"):
+        samples = [measure_import(module) for _ in range(args.repeat)]
+        seconds = statistics.median(elapsed for elapsed, _ in samples)
+        loaded = ", ".join(samples[0][1]) or "-"
+        print(f"import {module:<10} {seconds * 1e3:>7.0f} ms   loads: {loaded}")
+
+    # mock 的首 token 延迟为 0，测到的都是启动开销
+    args.ttft = args.token_rate = 0
+    args.content_tokens, args.reasoning_tokens = 20, 0
+    mock = start_mock(args)
+    try:
+        samples = [measure_headless(args) for _ in range(args.repeat)]
+        print(f"headless first token  {statistics.median(samples):>6.2f} s")
+        samples = [measure_ui(args) for _ in range(args.repeat)]
+        print(
+            f"ui ready              {statistics.median(s[0] for s in samples):>6.2f} s"
+        )
+        print(
+            f"ui first frame        {statistics.median(s[1] for s in samples):>6.2f} s"
+        )
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""token 计数基准：沙龙 token 预算对停不下来的发言者的约束，以及本地预测 prompt 大小的误差。
+
+启动本地 mock provider，其中 runaway_rate 比例的回复正文长达 runaway_tokens 个 token（mock 遵守
+max_tokens，超出时截断）。分别在不设限制和设置 salon_budget 的情况下并发运行同样的一批沙龙，报告：
+
+  * 每个沙龙用掉的 token（平均/最大）与预算的比较，完成的轮数；
+  * 单次发言输出 token 数的最大值，以及因 max_tokens 被截断的发言数；
+  * 本地预测的 prompt token 数与 mock 返回的 usage 的平均相对误差，分别统计第一轮
+    （尚未校准）和最后一轮（按实际用量校准之后）。
+
+另外报告本地分词器对一段典型历史计数的耗时，以及消息上的计数缓存生效后的耗时。
+
+用法:
+    python benchmarks/bench_tokens.py [--salons 10] [--rounds 5] [--budget 12000] [--runaway-rate 0.2]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from dataclasses import replace
+
+from bench_e2e import mock_config, start_mock
+
+
+def relative_error(turns) -> float:
+    turns = [t for t in turns if t.prompt_tokens and t.predicted_prompt_tokens]
+    if not turns:
+        return 0.0
+    return sum(
+        abs(t.predicted_prompt_tokens - t.prompt_tokens) / t.prompt_tokens
+        for t in turns
+    ) / len(turns)
+
+
+async def run(args, url: str, budget) -> dict:
+    import chatter
+    import tokens
+    from config import TokensConfig, TranscriptConfig
+    from salon import Salon
+    from utils import SSEClient
+
+    # 每种配置从未校准的状态开始；chatter 导入的是同一个对象的引用，一并替换
+    chatter.calibration = tokens.calibration = tokens.Calibration()
+    SSEClient.sem = asyncio.Semaphore(100_000)
+    base = mock_config(url, args.rounds)
+    config = replace(
+        base,
+        transcript=TranscriptConfig(enabled=False),
+        tokens=TokensConfig(salon_budget=budget),
+    )
+
+    async def one_salon():
+        salon = Salon(config)
+        rounds = 0
+        async for event_type, _ in salon.chatting():
+            rounds += event_type == "new_turn"
+        return salon, rounds
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one_salon() for _ in range(args.salons)))
+    elapsed = time.perf_counter() - start
+    used = [salon.token_budget.used for salon, _ in results]
+    turns = [turn for salon, _ in results for turn in salon.metrics.turns]
+    return {
+        "elapsed": elapsed,
+        "used_avg": sum(used) / len(used),
+        "used_max": max(used),
+        "rounds": sum(rounds for _, rounds in results) / len(results),
+        "output_max": max(turn.completion_tokens or 0 for turn in turns),
+        "truncated": sum(
+            bool(turn.max_tokens and turn.completion_tokens == turn.max_tokens)
+            for turn in turns
+        ),
+        "error_first": relative_error(t for t in turns if t.round == 0),
+        "error_last": relative_error(t for t in turns if t.round == args.rounds - 1),
+    }
+
+
+def count_speed(args):
+    """对一段 rounds 轮的典型历史计数 1000 次：每次重新分词，和消息上的缓存生效之后"""
+    from messages import Message
+    from mock_provider import WORDS
+    from tokens import APPROXIMATE, count_message_tokens
+
+    text = "".join(WORDS[i % len(WORDS)] for i in range(args.content_tokens))
+    history = [Message("user" if i % 2 else "assistant", text) for i in range(40)]
+    dicts = [message.as_dict() for message in history]
+    results = {}
+    for label, messages in (("uncached", dicts), ("cached", history)):
+        start = time.perf_counter()
+        for _ in range(1000):
+            count_message_tokens(messages, APPROXIMATE)
+        results[label] = (time.perf_counter() - start) * 1e3
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--salons", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--budget", type=int, default=12000)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=0)
+    parser.add_argument("--content-tokens", type=int, default=100)
+    parser.add_argument("--reasoning-tokens", type=int, default=0)
+    parser.add_argument("--runaway-rate", type=float, default=0.2)
+    parser.add_argument("--runaway-tokens", type=int, default=2000)
+    args = parser.parse_args()
+    url = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    mock = start_mock(
+        args,
+        "--runaway-rate",
+        str(args.runaway_rate),
+        "--runaway-tokens",
+        str(args.runaway_tokens),
+    )
+    try:
+        print(
+            f"{'setup':>14} {'elapsed':>8} {'avg used':>9} {'max used':>9} "
+            f"{'rounds':>7} {'max out':>8} {'capped':>7} {'err r1':>7} {'err rN':>7}"
+        )
+        for label, budget in (
+            ("no budget", None),
+            (f"budget {args.budget}", args.budget),
+        ):
+            r = asyncio.run(run(args, url, budget))
+            print(
+                f"{label:>14} {r['elapsed']:>7.1f}s {r['used_avg']:>9.0f} "
+                f"{r['used_max']:>9} {r['rounds']:>7.1f} {r['output_max']:>8} "
+                f"{r['truncated']:>7} {r['error_first']:>7.1%} {r['error_last']:>7.1%}"
+            )
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    speed = count_speed(args)
+    print(
+        f"counting a 40-message history 1000 times: {speed['uncached']:.1f} ms "
+        f"uncached, {speed['cached']:.1f} ms with per-message cache"
+    )
+
+
+if __name__ == "__main__":
+    main()
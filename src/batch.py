@@ -0,0 +1,180 @@
+"""无界面批量运行沙龙。
+
+从 JSONL 文件读取沙龙任务，每行一个 JSON 对象，字段均可省略（省略时使用 settings.yaml）::
+
+    {"id": "poem-1", "topic": "...", "rounds": 5,
+     "chatters": {"学生": {"provider": "deepseek", "model_name": "...", "system_prompt": "..."}},
+     "hoster": {"name": "主持人", "provider": "deepseek", "model_name": "...", "system_prompt": "..."}}
+
+在同一个事件循环中并发运行，每完成一个沙龙就向输出 JSONL 追加一行讨论记录::
+
+    python batch.py jobs.jsonl -o transcripts.jsonl --concurrency 8 --provider-limit deepseek=16
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import replace
+from typing import Dict, List, Optional
+
+from cache import get_response_cache
+from config import CACHE_MODES, get_config
+from salon import Salon
+from utils import SSEClient, logger
+
+
+def load_jobs(path: str) -> List[Dict]:
+    jobs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            job.setdefault("id", index)
+            jobs.append(job)
+    return jobs
+
+
+async def run_job(job: Dict, cache_mode: Optional[str] = None) -> Dict:
+    config = get_config().override(
+        topic=job.get("topic"),
+        rounds=job.get("rounds"),
+        chatters=job.get("chatters"),
+        hoster=job.get("hoster"),
+    )
+    if cache_mode:
+        config = replace(config, cache=replace(config.cache, mode=cache_mode))
+    salon = Salon(config)
+    transcript: List[Dict] = []
+    # 每位发言者当前这次发言在 transcript 中的位置，兼容并行发言模式
+    utterances: Dict[str, Dict] = {}
+    current_speaker = None
+    current_round = 0
+    task_completed = False
+    # 因 token 预算或上下文窗口提前停止时为 token_limit 事件的数据
+    token_limit = None
+    start = time.perf_counter()
+
+    async for event_type, data in salon.chatting():
+        if event_type == "new_turn":
+            current_round = data
+        elif event_type == "speaker_turn":
+            current_speaker = data
+            utterances[data] = {
+                "round": current_round,
+                "speaker": data,
+                "content": [],
+                "reasoning": [],
+            }
+            transcript.append(utterances[data])
+        elif event_type == "content_piece":
+            utterances[current_speaker]["content"].append(data)
+        elif event_type == "reasoning_piece":
+            utterances[current_speaker]["reasoning"].append(data)
+        elif event_type == "speaker_content_piece":
+            utterances[data[0]]["content"].append(data[1])
+        elif event_type == "speaker_reasoning_piece":
+            utterances[data[0]]["reasoning"].append(data[1])
+        elif event_type == "speaker_restart":
+            utterances[data]["content"].clear()
+            utterances[data]["reasoning"].clear()
+        elif event_type == "task_finish":
+            task_completed = True
+        elif event_type == "token_limit":
+            token_limit = data
+
+    for utterance in transcript:
+        utterance["content"] = "".join(utterance["content"])
+        utterance["reasoning"] = "".join(utterance["reasoning"])
+    return {
+        "id": job["id"],
+        "salon_id": salon.salon_id,
+        "topic": salon.topic,
+        "rounds": current_round + 1,
+        "task_completed": task_completed,
+        "token_limit": token_limit,
+        "elapsed": round(time.perf_counter() - start, 3),
+        "metrics": salon.metrics.summary(),
+        "memory": salon.memory_report(),
+        "tokens_used": salon.token_budget.used,
+        "transcript": transcript,
+    }
+
+
+async def run_batch(
+    jobs: List[Dict], output: str, concurrency: int, cache_mode: Optional[str] = None
+):
+    sem = asyncio.Semaphore(concurrency)
+    finished = 0
+
+    async def guarded(job: Dict) -> Dict:
+        async with sem:
+            try:
+                return await run_job(job, cache_mode)
+            except Exception as e:
+                logger.error(f"salon {job['id']} failed: {e}")
+                return {"id": job["id"], "error": str(e)}
+
+    start = time.perf_counter()
+    # 所有沙龙共享同一组 provider 连接池
+    async with SSEClient.pool():
+        with open(output, "a", encoding="utf-8") as f:
+            for result in asyncio.as_completed([guarded(job) for job in jobs]):
+                result = await result
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+                f.flush()
+                finished += 1
+                logger.info(f"salon {result['id']} done ({finished}/{len(jobs)})")
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"finished {finished} salons in {elapsed:.1f}s "
+        f"({finished / elapsed * 60:.1f} salons/min)"
+    )
+    for provider, stats in SSEClient.stats().items():
+        logger.info(
+            f"{provider}: {stats['requests']} requests, {stats['retries']} retries, "
+            f"{stats['resumes']} resumes, {stats['failures']} failures, "
+            f"waited {stats['retry_wait']:.1f}s on backoff, "
+            f"{stats['rate_limit_wait']:.1f}s on rate limits"
+        )
+    cache_config = get_config().cache
+    if (cache_mode or cache_config.mode) != "off":
+        cache = get_response_cache(cache_config)
+        logger.info(f"response cache: {cache.hits} hits, {cache.misses} misses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many LLM salons without the UI")
+    parser.add_argument("jobs", help="JSONL file with one salon spec per line")
+    parser.add_argument("-o", "--output", default="transcripts.jsonl")
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=4, help="salons running at once"
+    )
+    parser.add_argument(
+        "--provider-limit",
+        action="append",
+        default=[],
+        metavar="PROVIDER=N",
+        help="max in-flight requests per provider, overrides max_concurrency",
+    )
+    parser.add_argument(
+        "--cache",
+        choices=CACHE_MODES,
+        help="response cache mode, overrides cache.mode in settings.yaml; "
+        "run once with record, then with replay for offline regression runs",
+    )
+    args = parser.parse_args()
+
+    for item in args.provider_limit:
+        provider, limit = item.split("=", 1)
+        SSEClient.set_provider_limit(provider, int(limit))
+
+    asyncio.run(
+        run_batch(load_jobs(args.jobs), args.output, args.concurrency, args.cache)
+    )
+
+
+if __name__ == "__main__":
+    main()
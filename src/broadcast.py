@@ -0,0 +1,150 @@
+"""一个沙龙的事件流广播给多个订阅者。
+
+Salon.chatting 只能被一个调用方迭代。EventBus 把它产出的事件写入有界的环形缓冲区，每个事件带有
+递增的序号，任意多个订阅者各自按游标读取，发布事件从不等待订阅者：
+
+* 中途加入的订阅者先收到到目前为止的全部内容，同一发言者连续的片段合并成一个事件；
+* 读得慢的订阅者下次读取时拿到积压的所有事件，连续的片段同样合并后再交给它，
+  不会拖慢沙龙本身，也不必逐个处理积压的片段；
+* 落后超过缓冲区容量的订阅者先收到 RESYNC 事件，再从头收到合并后的全部内容。
+
+合并只拼接片段的文本，用 ChatRenderer 渲染的结果与逐个处理原始事件相同。
+"""
+
+import asyncio
+from collections import deque
+from itertools import islice
+from typing import Any, AsyncGenerator, Deque, Iterable, List, Optional, Tuple
+
+from metrics import Counter
+
+# 订阅者落后太多、缓冲区中的事件已被覆盖时发出，之后是从头开始的完整内容
+RESYNC = "resync"
+
+_PIECES = ("content_piece", "reasoning_piece")
+_SPEAKER_PIECES = ("speaker_content_piece", "speaker_reasoning_piece")
+
+COALESCED = Counter(
+    "salon_broadcast_coalesced_events_total",
+    "Stream pieces merged into a preceding piece before reaching a subscriber",
+)
+RESYNCS = Counter(
+    "salon_broadcast_resyncs_total",
+    "Subscribers that fell behind the ring buffer and restarted from a snapshot",
+)
+
+
+class _Run:
+    """连续的同类片段（同一发言者的正文或推理过程），或者一个不能合并的事件"""
+
+    __slots__ = ("event_type", "data", "key", "parts")
+
+    def __init__(self, event_type: str, data: Any):
+        self.event_type = event_type
+        self.data = data
+        self.key = None
+        self.parts: Optional[List[str]] = None
+        if event_type in _PIECES:
+            self.key, self.parts = (event_type, None), [data]
+        elif event_type in _SPEAKER_PIECES:
+            self.key, self.parts = (event_type, data[0]), [data[1]]
+
+    def event(self) -> Tuple[str, Any]:
+        if self.parts is None:
+            return self.event_type, self.data
+        text = "".join(self.parts)
+        speaker = self.key[1]
+        return self.event_type, text if speaker is None else (speaker, text)
+
+
+def _extend(runs: List[_Run], events: Iterable[Tuple[str, Any]]) -> int:
+    """把事件追加到 runs 的末尾，能与上一个合并的就合并，返回合并掉的事件数"""
+    merged = 0
+    for event_type, data in events:
+        run = _Run(event_type, data)
+        last = runs[-1] if runs else None
+        if run.key is not None and last is not None and last.key == run.key:
+            last.parts.extend(run.parts)
+            merged += 1
+            continue
+        if last is not None and last.parts is not None and len(last.parts) > 1:
+            # 这一段已经结束，拼成一个字符串，不再保留大量小片段
+            last.parts = ["".join(last.parts)]
+        runs.append(run)
+    return merged
+
+
+class EventBus:
+    def __init__(self, capacity: int = 4096):
+        # (序号, 事件类型, 数据)，只保留最近 capacity 个事件
+        self._ring: Deque[Tuple[int, str, Any]] = deque(maxlen=capacity)
+        # 已发布的全部事件合并后的结果，供中途加入和落后太多的订阅者追赶
+        self._history: List[_Run] = []
+        # 下一个事件的序号，也就是已发布的事件数
+        self._seq = 0
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._wakeup = asyncio.Event()
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def publish(self, event_type: str, data: Any):
+        """发布一个事件，不等待任何订阅者"""
+        if self._closed:
+            raise RuntimeError("publish on a closed EventBus")
+        self._ring.append((self._seq, event_type, data))
+        self._seq += 1
+        _extend(self._history, ((event_type, data),))
+        self._notify()
+
+    def close(self, error: Optional[BaseException] = None):
+        """事件流结束；error 不为空时，订阅者读完剩余的事件后抛出它"""
+        if not self._closed:
+            self._closed, self._error = True, error
+            self._notify()
+
+    def _notify(self):
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    def _snapshot(self) -> List[Tuple[str, Any]]:
+        return [run.event() for run in self._history]
+
+    async def subscribe(self) -> AsyncGenerator[Tuple[str, Any], None]:
+        """从头产出事件流，直到它结束；与 Salon.chatting 产出的事件相同，只是片段可能被合并"""
+        batch, cursor = self._snapshot(), self._seq
+        while True:
+            for event in batch:
+                yield event
+            if cursor < self._seq:
+                oldest = self._ring[0][0]
+                if cursor < oldest:
+                    RESYNCS.inc()
+                    batch, cursor = [(RESYNC, None), *self._snapshot()], self._seq
+                    continue
+                runs: List[_Run] = []
+                merged = _extend(
+                    runs,
+                    (
+                        (event_type, data)
+                        for _, event_type, data in islice(
+                            self._ring, cursor - oldest, None
+                        )
+                    ),
+                )
+                if merged:
+                    COALESCED.inc(merged)
+                batch, cursor = [run.event() for run in runs], self._seq
+                continue
+            if self._closed:
+                if self._error is not None:
+                    raise self._error
+                return
+            batch = ()
+            await self._wakeup.wait()
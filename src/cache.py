@@ -0,0 +1,259 @@
+"""按请求内容寻址的响应缓存。
+
+以规范化后的 payload（连同 provider 的 url）的 sha256 为键，把 SSEClient.send_sse
+产出的完整 chunk 流连同相对时间戳存到磁盘。命中时可以立即回放，也可以按录制时的节奏回放。
+
+缓存模式（settings.yaml 中的 ``cache.mode``）:
+
+* ``off``: 不使用缓存
+* ``read_write``: 命中则回放，未命中则请求 provider 并写入缓存
+* ``record``: 总是请求 provider，并覆盖写入缓存
+* ``replay``: 只从缓存回放，未命中时抛出 CacheMiss，适合回归测试与离线演示
+
+存储后端由 ``cache.backend`` 选择，内置 ``disk``；其他后端用 register_cache_backend 注册。
+后端的 get/put 在单独的缓存线程上执行，不阻塞事件循环。
+"""
+
+import abc
+import asyncio
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from typing import AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+from config import CacheConfig, ProviderConfig
+from router import send_routed
+from streaming import StopStream, stop_stream
+from utils import logger
+
+# 每行一个 chunk: [相对首个请求的秒数, chunk]
+Recording = List[Tuple[float, Dict]]
+
+
+class CacheMiss(Exception):
+    """replay 模式下请求的响应不在缓存中"""
+
+
+def cache_key(provider: ProviderConfig, payload: Dict, client: Dict = None) -> str:
+    """client 为客户端停止条件等影响缓存内容、但不发送给 provider 的参数"""
+    key = {"url": provider.url, "payload": payload}
+    if client:
+        key["client"] = client
+    canonical = json.dumps(
+        key,
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(abc.ABC):
+    """响应缓存的接口，可以替换为其他存储后端；后端缺少 get/put 时在创建时就会报错。
+
+    get/put 总在同一个缓存线程上依次调用，后端不需要自己加锁。
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Recording]:
+        """未命中时返回 None"""
+
+    @abc.abstractmethod
+    def put(self, key: str, recording: List[str]):
+        """recording 为已序列化的行，避免调用方之后修改 chunk 影响缓存内容"""
+
+
+class DiskCache(ResponseCache):
+    """每个响应一个 JSONL 文件，按最近访问时间做 LRU 淘汰，总大小不超过 max_bytes"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        super().__init__()
+        self._directory = directory
+        self._max_bytes = max_bytes
+        # key -> (文件大小, 最近访问时间)
+        self._index: Dict[str, Tuple[int, float]] = {}
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(".jsonl"):
+                    stat = os.stat(os.path.join(root, name))
+                    self._index[name[: -len(".jsonl")]] = (stat.st_size, stat.st_mtime)
+                    self._total += stat.st_size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key[:2], f"{key}.jsonl")
+
+    def get(self, key: str) -> Optional[Recording]:
+        if key not in self._index:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                recording = [tuple(json.loads(line)) for line in f]
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"dropping unreadable cache entry {key}: {e}")
+            self._remove(key)
+            return None
+        now = time.time()
+        os.utime(path, (now, now))
+        self._index[key] = (self._index[key][0], now)
+        return recording
+
+    def put(self, key: str, recording: List[str]):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = "".join(line + "\n" for line in recording).encode("utf-8")
+        # 先写临时文件再原子替换，进程中断时不会留下半个条目
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        if key in self._index:
+            self._total -= self._index[key][0]
+        self._index[key] = (len(data), time.time())
+        self._total += len(data)
+        self._evict()
+
+    def _remove(self, key: str):
+        size, _ = self._index.pop(key)
+        self._total -= size
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        if self._total <= self._max_bytes:
+            return
+        for key, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total <= self._max_bytes:
+                break
+            self._remove(key)
+            logger.debug(f"evicted cache entry {key}")
+
+
+# 所有缓存后端共用一个 IO 线程，读写文件不阻塞事件循环，DiskCache 的 LRU 索引也只在这个线程上修改
+_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-io")
+
+
+async def _run_io(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_io, fn, *args)
+
+
+def _disk_cache(config: CacheConfig) -> ResponseCache:
+    return DiskCache(config.directory, int(config.max_size_mb * 1024 * 1024))
+
+
+# cache.backend -> 由 CacheConfig 创建后端实例的工厂
+CACHE_BACKENDS: Dict[str, Callable[[CacheConfig], ResponseCache]] = {
+    "disk": _disk_cache,
+}
+
+
+def register_cache_backend(name: str, factory: Callable[[CacheConfig], ResponseCache]):
+    """注册一个存储后端，之后在 settings.yaml 中以 ``cache.backend: <name>`` 选用"""
+    CACHE_BACKENDS[name] = factory
+
+
+_caches: Dict[Tuple[str, str], ResponseCache] = {}
+
+
+def get_response_cache(config: CacheConfig) -> ResponseCache:
+    """同一后端与目录在进程内共享一个缓存实例，多个沙龙共用同一份 LRU 索引"""
+    key = (config.backend, config.directory)
+    cache = _caches.get(key)
+    if cache is None:
+        factory = CACHE_BACKENDS.get(config.backend)
+        if factory is None:
+            raise ValueError(
+                f"unknown cache backend: {config.backend}, "
+                f"expected one of {tuple(CACHE_BACKENDS)}"
+            )
+        cache = _caches[key] = factory(config)
+    return cache
+
+
+async def replay(recording: Recording, timing: str) -> AsyncGenerator[Dict, None]:
+    start = time.monotonic()
+    for offset, chunk in recording:
+        if timing == "recorded":
+            delay = offset - (time.monotonic() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield chunk
+
+
+async def send_cached(
+    provider: ProviderConfig,
+    payload: Dict,
+    config: CacheConfig,
+    client: Dict = None,
+) -> AsyncGenerator[Dict, None]:
+    """与 SSEClient.send_sse 相同的接口，按 config.mode 读写响应缓存；
+    provider 声明了多个端点时经 router 选择端点。
+
+    调用方 athrow(StopStream()) 时结束请求；已消费的部分会写入缓存，回放时在同一处停止。
+    真实请求停止时，athrow 返回这次请求的 stats chunk，回放时返回 None。
+    client 为调用方的停止条件，参与计算缓存键。
+    """
+    stats = None
+    if config.mode == "off":
+        async with aclosing(send_routed(provider, payload)) as stream:
+            try:
+                async for chunk in stream:
+                    yield chunk
+            except StopStream:
+                stats = await stop_stream(stream)
+        if stats is not None:
+            yield stats
+        return
+
+    # DiskCache 创建时会遍历缓存目录，同样放到缓存线程上
+    cache = await _run_io(get_response_cache, config)
+    key = cache_key(provider, payload, client)
+    if config.mode in ("read_write", "replay"):
+        recording = await _run_io(cache.get, key)
+        if recording is not None:
+            cache.hits += 1
+            try:
+                async for chunk in replay(recording, config.timing):
+                    yield chunk
+            except StopStream:
+                pass
+            return
+        cache.misses += 1
+        if config.mode == "replay":
+            raise CacheMiss(f"no cached response for {payload.get('model')} ({key})")
+
+    lines: List[str] = []
+    start = time.monotonic()
+    async with aclosing(send_routed(provider, payload)) as stream:
+        try:
+            async for chunk in stream:
+                # 请求计时只对这一次真实请求有意义，不写入缓存；
+                # 流断开后重新生成时，之前录下的部分已被丢弃
+                if chunk["type"] == "restart":
+                    lines.clear()
+                elif chunk["type"] != "stats":
+                    lines.append(
+                        json.dumps(
+                            [round(time.monotonic() - start, 4), chunk],
+                            ensure_ascii=False,
+                        )
+                    )
+                yield chunk
+        except StopStream:
+            stats = await stop_stream(stream)
+    # 只缓存完整或按停止条件结束的响应：请求失败或调用方中途放弃时不会走到这里
+    await _run_io(cache.put, key, lines)
+    # 停止时请求的 stats 在写入缓存之后交回，调用方随即关闭流也不会丢掉这次写入
+    if stats is not None:
+        yield stats
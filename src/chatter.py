@@ -1,44 +1,85 @@
-from typing import AsyncGenerator, Dict, List
+import math
+from contextlib import aclosing, nullcontext
+from typing import (AsyncGenerator, Callable, Dict, List, Optional, Sequence,
+                    Tuple)
 
-from rich.markdown import Markdown
-
-from config import settings
+from cache import send_cached
+from config import ChatterConfig, ProviderConfig, SalonConfig
+from context import ContextWindow
+from messages import Message, MessageLog, UserTurn
+from streaming import StopMatcher, ToolCall, ToolCallAccumulator, stop_stream
+from tokens import (OVERFLOWS, PREDICTED_TOKENS, TokenBudget,
+                    TokenLimitExceeded, calibration, count_message_tokens,
+                    count_tools_tokens, get_tokenizer)
 from utils import SSEClient, logger
 
 
+def _markdown(text: str):
+    """rich 只在日志真正输出时才导入"""
+    from rich.markdown import Markdown
+
+    return Markdown(text)
+
+
 class Chatter:
     def __init__(
         self,
-        provider: str,
-        model_name: str,
+        cfg: ChatterConfig,
         system_prompt: str,
-        temperature: float = 0.7,
-        top_p: float = 1.0,
-        max_tokens: int = None,
-        *args,
-        **kwargs,
+        config: SalonConfig,
+        log: Optional[MessageLog] = None,
+        budget: Optional[TokenBudget] = None,
     ):
-        self._provider = settings.providers[provider]
-        self._model_name = model_name
+        """log 为沙龙内共享的发言记录，为空时使用自己的记录；budget 为沙龙的 token 预算"""
+        self._name = cfg.name
+        self._provider = config.providers[cfg.provider]
+        self._model_name = cfg.model_name
         self._system_prompt = system_prompt
-        self._temperature = temperature
-        self._top_p = top_p
-        self._max_tokens = max_tokens
-        self._history: List[Dict[str, str]] = [
-            {"role": "system", "content": system_prompt}
-        ]
+        self._temperature = cfg.temperature
+        self._top_p = cfg.top_p
+        self._max_tokens = cfg.max_tokens
+        self._stop = cfg.stop
+        self._max_chars = cfg.max_chars
+        self._formatter = config.template.formatter
+        self._cache = config.cache
+        self._tokenizer = get_tokenizer(config.tokens.tokenizer_for(cfg.model_name))
+        self._context_window = config.tokens.context_windows.get(cfg.model_name)
+        self._min_completion = config.tokens.min_completion
+        self._margin = config.tokens.margin
+        self._budget = budget
+        self._history: List[Message] = [Message("system", system_prompt)]
 
-        self._salon_cache: List[Dict[str, str]] = []
+        self._log = log if log is not None else MessageLog()
+        self._log.subscribe(self._name)
+        self._max_unread = config.scheduler.max_unread
         self._function_calling: List[Dict] = []
-        logger.info(
-            f"initialized chatter with system prompt:\n{system_prompt}",
-            rich=Markdown(system_prompt),
+        self._context = ContextWindow(
+            budget=config.context.budgets.get(cfg.model_name),
+            policy=config.context.policy,
+            keep_last=config.context.keep_last,
+            summary_prefix=config.template.formatter.summary_prefix,
+            evict_to=config.context.evict_to if config.context.prefix_stable else None,
+            tokenizer=self._tokenizer,
+        )
+        # 只有存在 INFO 级别的 sink 时才格式化并构建 Markdown
+        logger.opt(lazy=True).info(
+            "initialized chatter with system prompt:\n{}",
+            lambda: system_prompt,
+            rich=lambda: _markdown(system_prompt),
         )
 
     @property
-    def provider(self) -> Dict[str, str]:
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def provider(self) -> ProviderConfig:
         return self._provider
 
+    @property
+    def provider_name(self) -> str:
+        return self._provider.name
+
     @property
     def model_name(self) -> str:
         return self._model_name
@@ -49,91 +90,330 @@ class Chatter:
 
     @property
     def history(self) -> List[Dict[str, str]]:
+        """历史消息的快照，与发送给 API 的格式相同"""
+        return [message.as_dict() for message in self._history]
+
+    @property
+    def messages(self) -> List[Message]:
+        """历史中的消息对象本身，其中的发言文本与其他发言者共享"""
         return self._history
 
     @property
-    def salon_cache(self) -> List[Dict[str, str]]:
-        return self._salon_cache
+    def last_utterance(self) -> str:
+        """最近一次发言的正文，广播给其他人时共享同一个字符串"""
+        for message in reversed(self._history):
+            if message.role == "assistant":
+                return message.content
+        return ""
+
+    @property
+    def context(self) -> ContextWindow:
+        return self._context
+
+    @property
+    def salon_cache(self) -> List[Tuple[str, str]]:
+        """上次发言以来听到的发言"""
+        return self._log.peek(self._name)
 
     def add_salon_cache(self, speaker: str, message: str):
-        self.salon_cache.append((speaker, message))
+        """只让自己听到一条发言；沙龙内的广播直接写入共享的发言记录"""
+        self._log.append(speaker, message, audience=(self._name,))
 
     def _add_assistant_message(self, message: str):
-        self.history.append({"role": "assistant", "content": message})
+        self._history.append(Message("assistant", message))
 
     def _add_user_message(self, current_round: int, total_rounds: int):
-        self.history.append(
-            {
-                "role": "user",
-                "content": self.get_salon_cache(current_round, total_rounds),
-            }
+        turn = UserTurn(
+            tuple(self._log.read(self._name, self._max_unread)),
+            current_round + 1,
+            total_rounds,
+            self._formatter,
+        )
+        self._history.append(turn)
+        logger.opt(lazy=True).info(
+            "salon cache:\n{}",
+            lambda: turn.content,
+            rich=lambda: _markdown(turn.content),
         )
 
     @property
     def url(self) -> str:
-        return self.provider["url"]
-
-    def get_salon_cache(self, current_round: int, total_rounds: int) -> str:
-        salon_cache_template = settings.template.salon_cache
-        message_str = salon_cache_template.prefix
-        for speaker, message in self._salon_cache:
-            message_str += salon_cache_template.speaker.format(
-                speaker=speaker, message=message
+        return self.provider.url
+
+    def _predict_prompt(
+        self, messages: Sequence[Message], tools: Optional[List[Dict]]
+    ) -> Tuple[int, int]:
+        """返回本地分词器的计数，以及按这个模型以往的实际用量修正后的预测"""
+        counted = count_message_tokens(messages, self._tokenizer) + count_tools_tokens(
+            tools, self._tokenizer
+        )
+        return counted, calibration.correct(self.model_name, counted)
+
+    def _prompt_size(self, predicted: int) -> int:
+        # 为分词误差留出余量
+        return math.ceil(predicted * (1 + self._margin))
+
+    def _fit_window(
+        self,
+        messages: List[Message],
+        tools: Optional[List[Dict]],
+        counted: int,
+        predicted: int,
+    ) -> Tuple[List[Message], int, int]:
+        """prompt 之后放不下 min_completion 个输出 token 时，用滑动窗口裁掉这次请求中最早的消息；
+        裁剪后仍然放不下时抛出 TokenLimitExceeded，不发送注定被截断或拒绝的请求"""
+        if not self._context_window:
+            return messages, counted, predicted
+        limit = self._context_window - self._min_completion
+        prompt_tokens = self._prompt_size(predicted)
+        if prompt_tokens <= limit:
+            return messages, counted, predicted
+        OVERFLOWS.inc(1, self.model_name)
+        # 按发送时与本地计数之比，把窗口换算为本地分词器的预算
+        budget = int(limit * counted / prompt_tokens) - count_tools_tokens(
+            tools, self._tokenizer
+        )
+        fitted = self._context.fit(messages, budget)
+        counted, predicted = self._predict_prompt(fitted, tools)
+        if self._prompt_size(predicted) > limit:
+            raise TokenLimitExceeded(
+                f"{self.name}: prompt of ~{self._prompt_size(predicted)} tokens leaves "
+                f"less than {self._min_completion} of the {self._context_window}-token "
+                f"context window for {self.model_name}",
+                "context_window",
             )
-        message_str += salon_cache_template.suffix
-        message_str += salon_cache_template.round_index.format(
-            current_round=current_round + 1, total_rounds=total_rounds
+        logger.warning(
+            f"{self.name}: prompt of ~{prompt_tokens} tokens overflows the "
+            f"{self._context_window}-token context window for {self.model_name}, "
+            f"dropped the {len(messages) - len(fitted)} oldest messages"
         )
+        return fitted, counted, predicted
+
+    def _size_completion(self, predicted: int, turn: bool = True) -> Optional[int]:
+        """本次请求的 max_tokens：配置的上限、上下文窗口在 prompt 之后剩余的空间、
+        沙龙预算中本次发言的份额减去 prompt（不少于 min_completion），三者取最小，
+        并且不超过预算的剩余部分；都没有时为 None。turn 为 False 时（生成摘要）不按份额限制。
 
-        self._salon_cache.clear()
-        logger.info(f"salon cache:\n{message_str}", rich=Markdown(message_str))
-        return message_str
+        剩余的预算放不下 prompt 加 min_completion 时抛出 TokenLimitExceeded。
+        """
+        prompt_tokens = self._prompt_size(predicted)
+        limits = [self._max_tokens] if self._max_tokens else []
+        if self._context_window:
+            limits.append(self._context_window - prompt_tokens)
+        remaining = self._budget.remaining if self._budget else None
+        if remaining is not None:
+            room = remaining - prompt_tokens
+            if room < self._min_completion:
+                raise TokenLimitExceeded(
+                    f"{self.name}: {remaining} tokens left in the salon budget, "
+                    f"~{prompt_tokens} prompt + {self._min_completion} completion needed",
+                    "budget",
+                )
+            if turn:
+                limits.append(
+                    max(self._budget.share() - prompt_tokens, self._min_completion)
+                )
+            limits.append(room)
+        if not limits:
+            return None
+        return min(limits)
+
+    def _reserve(self, predicted: int, max_tokens: Optional[int]):
+        """请求进行期间在沙龙预算中预留 prompt 与 max_tokens"""
+        if not self._budget or self._budget.total is None:
+            return nullcontext()
+        return self._budget.reserve(self._prompt_size(predicted) + max_tokens)
+
+    @staticmethod
+    def _annotate_stats(chunk: Dict, predicted: int, max_tokens: Optional[int]) -> Dict:
+        """在请求的 stats 中补上发送前的 prompt 预测与 max_tokens，供 Salon 汇总指标"""
+        stats = chunk["data"]
+        stats["predicted_prompt_tokens"] = predicted
+        stats["max_tokens"] = max_tokens
+        return stats
+
+    def _charge(
+        self,
+        counted: int,
+        predicted: int,
+        stats: Optional[Dict],
+        output: str,
+        turn: bool,
+    ):
+        """用 usage 中的实际用量校准预测，并从沙龙预算中扣除；提前结束的请求没有 usage，按预测和本地计数"""
+        stats = stats or {}
+        PREDICTED_TOKENS.inc(predicted, self.model_name)
+        calibration.observe(self.model_name, counted, stats.get("prompt_tokens"))
+        if self._budget:
+            self._budget.charge(
+                (stats.get("prompt_tokens") or predicted)
+                + (stats.get("completion_tokens") or self._tokenizer.count(output)),
+                turn,
+            )
+
+    def state(self) -> Dict:
+        """可 JSON 序列化的发言者状态快照，用于写入检查点"""
+        return {
+            "history": self.history,
+            "salon_cache": self.salon_cache,
+            "function_calling": self._function_calling or None,
+            "context": self._context.state(),
+        }
+
+    def restore(self, state: Dict):
+        self._history = [
+            Message(message["role"], message["content"]) for message in state["history"]
+        ]
+        self._log.reset(self._name, [tuple(item) for item in state["salon_cache"]])
+        function_calling = state["function_calling"] or []
+        # 旧检查点只保存了单个工具调用
+        if isinstance(function_calling, dict):
+            function_calling = [function_calling]
+        self._function_calling = function_calling
+        self._context.restore(state["context"])
 
     async def speaking(
-        self, current_round: int, total_rounds: int, if_hoster: bool = False
+        self,
+        current_round: int,
+        total_rounds: int,
+        if_hoster: bool = False,
+        stop_when: Callable[[List[ToolCall]], bool] = None,
+        extra_tools: Sequence[Dict] = (),
     ) -> AsyncGenerator[str, None]:
+        """stop_when 在工具调用有新参数字段到达时调用，返回 True 时立即结束请求；
+        extra_tools 是主持人在结束讨论之外额外可用的工具"""
         self._add_user_message(current_round, total_rounds)
+        messages, saved_tokens = await self._context.compact(self._history)
+        if saved_tokens:
+            logger.info(
+                f"context window ({self._context.policy}) saved {saved_tokens} prompt tokens "
+                f"for {self.model_name}, {self._context.saved_tokens} in total"
+            )
+        tools = [*SSEClient.tools, *extra_tools] if if_hoster else None
+        counted, predicted = self._predict_prompt(messages, tools)
+        messages, counted, predicted = self._fit_window(
+            messages, tools, counted, predicted
+        )
+        max_tokens = self._size_completion(predicted)
         payload = {
             "model": self.model_name,
-            "messages": self.history,
+            "messages": [message.as_dict() for message in messages],
             "temperature": self._temperature,
             "top_p": self._top_p,
-            "max_tokens": self._max_tokens,
+            "max_tokens": max_tokens,
             "stream": True,
-            "tools": SSEClient.tools if if_hoster else None,
+            "tools": tools,
         }
         content_response = []
         reasoning_response = []
-        tool_calls_response: Dict = None
-
-        async for chunk in SSEClient.send_sse(
-            url=self.url,
-            payload=payload,
-            api_key=self.provider["api_key"],
-        ):
-            if chunk["type"] == "content":
-                content_response.append(chunk["data"])
-            elif chunk["type"] == "reasoning":
-                reasoning_response.append(chunk["data"])
-            elif chunk["type"] == "tool_calls":
-                if not tool_calls_response:
-                    tool_calls_response = chunk["data"][0]
-                else:
-                    tool_calls_response["function"]["arguments"] = tool_calls_response[
-                        "function"
-                    ].get("arguments", "") + chunk["data"][0]["function"].get(
-                        "arguments", ""
-                    )
-            yield chunk
-
-        if tool_calls_response:
-            self._function_calling = tool_calls_response
+        stats = None
+        tool_calls = ToolCallAccumulator()
+        self._function_calling = []
+        # 停止条件只用于普通发言者，主持人的发言需要完整地交给工具调用判断
+        matcher = client = None
+        if not if_hoster and (self._stop or self._max_chars):
+            matcher = StopMatcher(self._stop, self._max_chars)
+            client = {"stop": list(self._stop), "max_chars": self._max_chars}
+
+        # 预留在请求结束前一直有效，并行的发言看到的剩余预算已经扣除了这次请求
+        with self._reserve(predicted, max_tokens):
+            async with aclosing(
+                send_cached(self.provider, payload, self._cache, client)
+            ) as stream:
+                stopped = False
+                async for chunk in stream:
+                    if chunk["type"] == "content":
+                        if matcher:
+                            piece = matcher.feed(chunk["data"])
+                            stopped = matcher.stopped
+                            if not piece:
+                                if stopped:
+                                    break
+                                continue
+                            chunk = {"type": "content", "data": piece}
+                        content_response.append(chunk["data"])
+                    elif chunk["type"] == "reasoning":
+                        reasoning_response.append(chunk["data"])
+                    elif chunk["type"] == "stats":
+                        stats = self._annotate_stats(chunk, predicted, max_tokens)
+                    elif chunk["type"] == "restart":
+                        # 流断开后从头重新生成，已输出的部分作废
+                        content_response.clear()
+                        reasoning_response.clear()
+                        tool_calls = ToolCallAccumulator()
+                        if matcher:
+                            matcher = StopMatcher(self._stop, self._max_chars)
+                    elif chunk["type"] == "tool_calls":
+                        updated = tool_calls.feed(chunk["data"])
+                        stopped = bool(
+                            updated and stop_when and stop_when(tool_calls.calls)
+                        )
+                    yield chunk
+                    if stopped:
+                        break
+                if stopped:
+                    # 请求在停止时才产出 stats，同样交给 Salon 记录本次发言的指标
+                    chunk = await stop_stream(stream)
+                    if chunk is not None and chunk["type"] == "stats":
+                        stats = self._annotate_stats(chunk, predicted, max_tokens)
+                        yield chunk
+                elif matcher:
+                    tail = matcher.flush()
+                    if tail:
+                        content_response.append(tail)
+                        yield {"type": "content", "data": tail}
+
+        self._function_calling = tool_calls.as_dicts()
 
         # 更新历史记录
-        assistant_message = "".join(content_response)
-        self._history.append(
-            {
-                "role": "assistant",
-                "content": assistant_message,
-            }
+        self._add_assistant_message("".join(content_response))
+        self._charge(
+            counted,
+            predicted,
+            stats,
+            "".join(reasoning_response) + self.last_utterance,
+            turn=True,
+        )
+
+    async def summarize(self, messages: List[Message], speaker: str) -> str:
+        """由当前 Chatter（通常是主持人）将一段历史压缩为摘要"""
+        transcript = "\n".join(
+            (
+                f"{speaker} 说:\n{message.content}"
+                if message.role == "assistant"
+                else message.content
+            )
+            for message in messages
         )
+        payload = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {
+                    "role": "user",
+                    "content": self._formatter.summary_prompt.render(
+                        history=transcript
+                    ),
+                },
+            ],
+            "temperature": self._temperature,
+            "top_p": self._top_p,
+            "stream": True,
+        }
+        counted, predicted = self._predict_prompt(payload["messages"], None)
+        max_tokens = self._size_completion(predicted, turn=False)
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        summary = []
+        stats = None
+        with self._reserve(predicted, max_tokens):
+            async for chunk in send_cached(self.provider, payload, self._cache):
+                if chunk["type"] == "content":
+                    summary.append(chunk["data"])
+                elif chunk["type"] == "restart":
+                    summary.clear()
+                elif chunk["type"] == "stats":
+                    stats = chunk["data"]
+        summary = "".join(summary)
+        self._charge(counted, predicted, stats, summary, turn=False)
+        return summary
@@ -1,15 +1,485 @@
 import os.path as osp
+import time
+from dataclasses import dataclass, field, fields, replace
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 
-from dynaconf import Dynaconf
+from loguru import logger
+
+from prompts import PromptFormatter
 
 PROJECT_ROOT = osp.dirname(osp.dirname(osp.abspath(__file__)))
 
 SETTING_PATH = osp.join(PROJECT_ROOT, "src/settings.yaml")
 
-settings = Dynaconf(
-    envvar_prefix="DYNACONF",
-    settings_files=[SETTING_PATH],
-)
+# Dynaconf 只作为加载器使用：YAML 读入后转换为下面这些不可变的配置快照，
+# 显式传给 Salon / Chatter / SSEClient，运行时的热路径不再访问 Dynaconf。
+# 导入本模块没有副作用，Dynaconf 在第一次读取配置时才导入和创建。
+_settings = None
+
+
+def get_settings():
+    global _settings
+    if _settings is None:
+        from dynaconf import Dynaconf
+
+        # `envvar_prefix` = export envvars with `export DYNACONF_FOO=bar`.
+        # `settings_files` = Load these files in the order.
+        _settings = Dynaconf(
+            envvar_prefix="DYNACONF",
+            settings_files=[SETTING_PATH],
+        )
+    return _settings
+
+
+def __getattr__(name: str):
+    # 兼容 `from config import settings`
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@dataclass(frozen=True, slots=True)
+class ProviderConfig:
+    name: str
+    url: str
+    api_key: str
+    max_concurrency: int
+    pool_size: int = 10
+    keepalive_timeout: float = 60
+    connect_timeout: float = 10
+    read_timeout: float = 300
+    dns_cache_ttl: int = 300
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+    max_retries: int = 3
+    retry_base_delay: float = 1.0
+    retry_max_delay: float = 30.0
+    # 流中途断开时用 DeepSeek beta 的 prefix 续写接着已输出的部分写；
+    # 不支持的 provider 保持 False，重新发起请求并丢弃已输出的部分
+    prefix_completion: bool = False
+    # 流式请求带上 stream_options.include_usage，让 provider 在流的末尾返回 usage；
+    # 不认识这个参数的 provider 设为 False
+    stream_usage: bool = True
+    # 端点使用的模型名，为空时使用发言者的 model_name
+    model_name: Optional[str] = None
+    # 与本端点等价的其他端点，按偏好排列；每个请求发给估计最快的健康端点
+    endpoints: Tuple["ProviderConfig", ...] = ()
+    # 超过这么多秒还没有收到第一个 token 时，向下一个端点发出对冲请求，None 表示不对冲
+    hedge_after: Optional[float] = None
+
+    def __post_init__(self):
+        if self.hedge_after is not None and self.hedge_after <= 0:
+            raise ValueError(f"hedge_after must be positive, got {self.hedge_after}")
+        names = [endpoint.name for endpoint in self.pool]
+        if len(set(names)) != len(names):
+            raise ValueError(
+                f"duplicate endpoint names in provider {self.name}: {names}"
+            )
+
+    @property
+    def pool(self) -> Tuple["ProviderConfig", ...]:
+        """自身和所有等价端点"""
+        return (self, *self.endpoints)
+
+    @classmethod
+    def from_dict(cls, name: str, data: Mapping, semaphore: int) -> "ProviderConfig":
+        data = dict(data)
+        endpoints = data.pop("endpoints", None) or ()
+        data.setdefault("max_concurrency", semaphore)
+        # 端点继承 provider 的所有设置，只需写出不同的部分
+        inherited = {k: v for k, v in data.items() if k != "hedge_after"}
+        return cls(
+            name=name,
+            endpoints=tuple(
+                cls(
+                    **{
+                        **inherited,
+                        "name": f"{name}#{index}",
+                        **endpoint,
+                    }
+                )
+                for index, endpoint in enumerate(endpoints, start=2)
+            ),
+            **data,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class ChatterConfig:
+    name: str
+    provider: str
+    model_name: str
+    system_prompt: str
+    temperature: float = 0.7
+    top_p: float = 1.0
+    max_tokens: Optional[int] = None
+    # 客户端停止条件：正文出现任一停止字符串或超过 max_chars 个字符时提前结束请求
+    stop: Tuple[str, ...] = ()
+    max_chars: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, name: str, data: Mapping) -> "ChatterConfig":
+        data = {k: v for k, v in data.items() if k != "name"}
+        if "stop" in data:
+            stop = data["stop"]
+            data["stop"] = (stop,) if isinstance(stop, str) else tuple(stop or ())
+        return cls(name=name, **data)
+
+
+@dataclass(frozen=True, slots=True)
+class SalonCacheTemplate:
+    prefix: str
+    speaker: str
+    suffix: str
+    round_index: str
+
+
+@dataclass(frozen=True, slots=True)
+class PromptTemplate:
+    prefix: str
+    chatter: str
+    suffix: str
+
+
+@dataclass(frozen=True, slots=True)
+class SummaryTemplate:
+    prompt: str
+    prefix: str
+
+
+@dataclass(frozen=True, slots=True)
+class TemplateConfig:
+    salon_cache: SalonCacheTemplate
+    system_prompt: PromptTemplate
+    hoster_prompt: PromptTemplate
+    summary: SummaryTemplate
+    # 预编译的模板，随快照构建一次，模板中的未知字段在加载配置时报错
+    formatter: PromptFormatter = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "formatter", PromptFormatter(self))
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "TemplateConfig":
+        return cls(
+            salon_cache=SalonCacheTemplate(**data["salon_cache"]),
+            system_prompt=PromptTemplate(**data["system_prompt"]),
+            hoster_prompt=PromptTemplate(**data["hoster_prompt"]),
+            summary=SummaryTemplate(**data["summary"]),
+        )
+
+
+CONTEXT_POLICIES = ("none", "sliding_window", "summary")
+
+
+@dataclass(frozen=True, slots=True)
+class ContextConfig:
+    policy: str = "none"
+    keep_last: int = 4
+    budgets: Mapping[str, int] = field(default_factory=lambda: MappingProxyType({}))
+    # 前缀稳定模式：滑动窗口超出预算时一次裁剪到 budget * evict_to，
+    # 窗口起点只在裁剪时移动，其余轮次发送的消息前缀保持不变，可以命中 provider 的前缀缓存
+    prefix_stable: bool = False
+    evict_to: float = 0.5
+
+    def __post_init__(self):
+        if self.policy not in CONTEXT_POLICIES:
+            raise ValueError(
+                f"unknown context policy: {self.policy}, expected one of {CONTEXT_POLICIES}"
+            )
+        if not 0 < self.evict_to <= 1:
+            raise ValueError(f"evict_to must be in (0, 1], got {self.evict_to}")
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "ContextConfig":
+        data = dict(data)
+        data["budgets"] = MappingProxyType(dict(data.get("budgets") or {}))
+        return cls(**data)
+
+
+SCHEDULER_POLICIES = ("round_robin", "hoster_selected", "relevance", "groups")
+
+
+@dataclass(frozen=True, slots=True)
+class SchedulerConfig:
+    policy: str = "round_robin"
+    # 每轮最多发言的人数，None 表示所有人都发言
+    speakers_per_round: Optional[int] = None
+    # 发言时最多看到最近的多少条未读发言，None 表示全部
+    max_unread: Optional[int] = None
+    # policy 为 groups 时的分组：组名 -> 成员，成员只听到同组成员和主持人的发言
+    groups: Mapping[str, Tuple[str, ...]] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+
+    def __post_init__(self):
+        if self.policy not in SCHEDULER_POLICIES:
+            raise ValueError(
+                f"unknown scheduler policy: {self.policy}, "
+                f"expected one of {SCHEDULER_POLICIES}"
+            )
+        if self.speakers_per_round is not None and self.speakers_per_round <= 0:
+            raise ValueError(
+                f"speakers_per_round must be positive, got {self.speakers_per_round}"
+            )
+        if self.max_unread is not None and self.max_unread < 0:
+            raise ValueError(f"max_unread must not be negative, got {self.max_unread}")
+        if self.policy == "groups" and not self.groups:
+            raise ValueError("scheduler policy groups requires scheduler.groups")
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "SchedulerConfig":
+        data = dict(data)
+        data["groups"] = MappingProxyType(
+            {
+                name: tuple(members)
+                for name, members in (data.get("groups") or {}).items()
+            }
+        )
+        return cls(**data)
+
+
+TOKENIZER_PREFIXES = ("tiktoken:", "hf:")
+
+
+@dataclass(frozen=True, slots=True)
+class TokensConfig:
+    # 未单独指定的模型使用的分词器：approx | tiktoken:<编码或模型> | hf:<名称或 tokenizer.json 路径>
+    default_tokenizer: str = "approx"
+    # model_name -> 分词器
+    tokenizers: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    # model_name -> 上下文长度，max_tokens 不超过 prompt 之后剩余的空间
+    context_windows: Mapping[str, int] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    # 一个沙龙可以使用的 prompt + 输出 token 总数，None 表示不限制
+    salon_budget: Optional[int] = None
+    # 自动设定的 max_tokens 不低于这个值
+    min_completion: int = 64
+    # 为分词误差预留的 prompt 比例
+    margin: float = 0.05
+
+    def __post_init__(self):
+        for spec in (self.default_tokenizer, *self.tokenizers.values()):
+            if spec != "approx" and not spec.startswith(TOKENIZER_PREFIXES):
+                raise ValueError(
+                    f"unknown tokenizer: {spec}, expected approx, "
+                    f"tiktoken:<encoding> or hf:<name or path>"
+                )
+        if self.salon_budget is not None and self.salon_budget <= 0:
+            raise ValueError(f"salon_budget must be positive, got {self.salon_budget}")
+        if self.min_completion <= 0:
+            raise ValueError(
+                f"min_completion must be positive, got {self.min_completion}"
+            )
+        if not 0 <= self.margin < 1:
+            raise ValueError(f"margin must be in [0, 1), got {self.margin}")
+
+    def tokenizer_for(self, model_name: str) -> str:
+        return self.tokenizers.get(model_name, self.default_tokenizer)
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "TokensConfig":
+        data = dict(data)
+        data["tokenizers"] = MappingProxyType(dict(data.get("tokenizers") or {}))
+        data["context_windows"] = MappingProxyType(
+            dict(data.get("context_windows") or {})
+        )
+        return cls(**data)
+
+
+CACHE_MODES = ("off", "read_write", "record", "replay")
+CACHE_TIMINGS = ("instant", "recorded")
+
+
+@dataclass(frozen=True, slots=True)
+class CacheConfig:
+    mode: str = "off"
+    backend: str = "disk"
+    directory: str = osp.join(PROJECT_ROOT, "cache", "responses")
+    max_size_mb: float = 512
+    timing: str = "instant"
+
+    def __post_init__(self):
+        if self.mode not in CACHE_MODES:
+            raise ValueError(
+                f"unknown cache mode: {self.mode}, expected one of {CACHE_MODES}"
+            )
+        if self.timing not in CACHE_TIMINGS:
+            raise ValueError(
+                f"unknown cache timing: {self.timing}, expected one of {CACHE_TIMINGS}"
+            )
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "CacheConfig":
+        data = dict(data)
+        if "directory" in data:
+            # 相对路径相对于项目根目录
+            data["directory"] = osp.join(PROJECT_ROOT, data["directory"])
+        return cls(**data)
+
+
+@dataclass(frozen=True, slots=True)
+class TranscriptConfig:
+    enabled: bool = True
+    directory: str = osp.join(PROJECT_ROOT, "transcripts")
+    flush_interval: float = 1.0
+    checkpoint: bool = True
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "TranscriptConfig":
+        data = dict(data)
+        if "directory" in data:
+            data["directory"] = osp.join(PROJECT_ROOT, data["directory"])
+        return cls(**data)
+
+
+@dataclass(frozen=True, slots=True)
+class SalonConfig:
+    topic: str
+    rounds: int
+    providers: Mapping[str, ProviderConfig]
+    template: TemplateConfig
+    chatters: Tuple[ChatterConfig, ...]
+    hoster: ChatterConfig
+    context: ContextConfig = ContextConfig()
+    scheduler: SchedulerConfig = SchedulerConfig()
+    cache: CacheConfig = CacheConfig()
+    transcript: TranscriptConfig = TranscriptConfig()
+    tokens: TokensConfig = TokensConfig()
+    semaphore: int = 30
+    show_hoster: bool = True
+    speaking_mode: str = "sequential"
+    pipeline_hoster: bool = False
+    stream_flush_interval: float = 0.05
+    metrics_port: int = 9464
+    concurrency_limit: int = 32
+    spectator_limit: int = 64
+
+    def __post_init__(self):
+        if self.rounds <= 0:
+            raise ValueError(f"rounds must be positive, got {self.rounds}")
+        if self.concurrency_limit <= 0:
+            raise ValueError(
+                f"concurrency_limit must be positive, got {self.concurrency_limit}"
+            )
+        if self.spectator_limit <= 0:
+            raise ValueError(
+                f"spectator_limit must be positive, got {self.spectator_limit}"
+            )
+        if self.speaking_mode not in ("sequential", "parallel"):
+            raise ValueError(f"unknown speaking_mode: {self.speaking_mode}")
+        for cfg in (*self.chatters, self.hoster):
+            if cfg.provider not in self.providers:
+                raise ValueError(f"{cfg.name} uses unknown provider: {cfg.provider}")
+        names = [cfg.name for cfg in self.chatters]
+        if self.scheduler.policy == "groups":
+            members = [
+                name for group in self.scheduler.groups.values() for name in group
+            ]
+            if sorted(members) != sorted(names):
+                raise ValueError(
+                    f"scheduler groups must list every chatter exactly once, "
+                    f"got {members}, chatters are {names}"
+                )
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "SalonConfig":
+        data = {k.lower(): v for k, v in data.items()}
+        semaphore = data.get("semaphore", 30)
+        return cls(
+            topic=data["topic"],
+            rounds=data["rounds"],
+            providers=MappingProxyType(
+                {
+                    name: ProviderConfig.from_dict(name, cfg, semaphore)
+                    for name, cfg in data["providers"].items()
+                }
+            ),
+            template=TemplateConfig.from_dict(data["template"]),
+            chatters=tuple(
+                ChatterConfig.from_dict(name, cfg)
+                for name, cfg in data["chatters"].items()
+            ),
+            hoster=ChatterConfig.from_dict(data["hoster"]["name"], data["hoster"]),
+            context=ContextConfig.from_dict(data.get("context") or {}),
+            scheduler=SchedulerConfig.from_dict(data.get("scheduler") or {}),
+            cache=CacheConfig.from_dict(data.get("cache") or {}),
+            transcript=TranscriptConfig.from_dict(data.get("transcript") or {}),
+            tokens=TokensConfig.from_dict(data.get("tokens") or {}),
+            semaphore=semaphore,
+            show_hoster=data.get("show_hoster", True),
+            speaking_mode=data.get("speaking_mode", "sequential"),
+            pipeline_hoster=data.get("pipeline_hoster", False),
+            stream_flush_interval=data.get("stream_flush_interval", 0.05),
+            metrics_port=data.get("metrics_port", 9464),
+            concurrency_limit=data.get("concurrency_limit", 32),
+            spectator_limit=data.get("spectator_limit", 64),
+        )
+
+    def override(
+        self,
+        topic: str = None,
+        rounds: int = None,
+        chatters: Dict[str, Dict[str, Any]] = None,
+        hoster: Dict[str, Any] = None,
+    ) -> "SalonConfig":
+        """基于当前快照生成一份修改了部分字段的新快照"""
+        changes = {}
+        if topic:
+            changes["topic"] = topic
+        if rounds:
+            changes["rounds"] = rounds
+        if chatters:
+            changes["chatters"] = tuple(
+                ChatterConfig.from_dict(name, cfg) for name, cfg in chatters.items()
+            )
+        if hoster:
+            changes["hoster"] = ChatterConfig.from_dict(hoster["name"], hoster)
+        return replace(self, **changes)
+
+
+_config: Optional[SalonConfig] = None
+
+
+def load_config() -> SalonConfig:
+    return SalonConfig.from_dict(get_settings().as_dict())
+
+
+def get_config() -> SalonConfig:
+    """返回当前的配置快照，首次调用时从 settings.yaml 构建"""
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
+
+
+def set_config(config: SalonConfig):
+    """直接替换当前快照，供基准测试或嵌入使用；之后开始的沙龙使用新快照"""
+    global _config
+    _config = config
+
+
+def reload_config() -> Tuple[SalonConfig, List[str]]:
+    """重新读取 settings.yaml 并替换当前快照，返回新快照和发生变化的配置项。
 
-# `envvar_prefix` = export envvars with `export DYNACONF_FOO=bar`.
-# `settings_files` = Load these files in the order.
+    新配置校验失败时抛出异常，当前快照保持不变；正在运行的沙龙继续使用各自持有的旧快照。
+    """
+    global _config
+    start = time.perf_counter()
+    get_settings().reload()
+    new_config = load_config()
+    old_config = _config
+    changed = [
+        f.name
+        for f in fields(SalonConfig)
+        if old_config is None
+        or getattr(old_config, f.name) != getattr(new_config, f.name)
+    ]
+    _config = new_config
+    logger.info(
+        f"配置已重新加载，用时 {(time.perf_counter() - start) * 1e3:.1f} ms，"
+        f"变更项: {', '.join(changed) or '无'}"
+    )
+    return new_config, changed
@@ -0,0 +1,139 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import CONTEXT_POLICIES
+from messages import Message
+from prompts import CompiledTemplate
+from tokens import APPROXIMATE, Tokenizer, count_message_tokens
+from utils import logger
+
+
+class ContextWindow:
+    """管理单个 Chatter 的上下文窗口，历史超过 token 预算时按策略压缩"""
+
+    def __init__(
+        self,
+        budget: Optional[int],
+        policy: str = "none",
+        keep_last: int = 4,
+        summary_prefix: Optional[CompiledTemplate] = None,
+        evict_to: Optional[float] = None,
+        tokenizer: Tokenizer = APPROXIMATE,
+    ):
+        """evict_to 不为空时按块裁剪滑动窗口，见 ContextConfig.prefix_stable；
+        tokenizer 为这个模型的分词器，预算按它的计数比较"""
+        if policy not in CONTEXT_POLICIES:
+            raise ValueError(
+                f"unknown context policy: {policy}, expected one of {CONTEXT_POLICIES}"
+            )
+        self._budget = budget
+        self._policy = policy
+        self._keep_last = keep_last
+        self._summary_prefix = summary_prefix or CompiledTemplate(
+            "{summary}", ("summary",)
+        )
+        self._evict_to = evict_to
+        self._tokenizer = tokenizer
+        # 按块裁剪时当前窗口在历史（不含 system）中的起点
+        self._window_start = 0
+        self.summarizer: Optional[Callable[[List[Message]], Awaitable[str]]] = None
+        self.saved_tokens = 0
+        self._summarized_tokens = 0
+
+    @property
+    def budget(self) -> Optional[int]:
+        return self._budget
+
+    @property
+    def policy(self) -> str:
+        return self._policy
+
+    def _count(self, messages: List[Message]) -> int:
+        return count_message_tokens(messages, self._tokenizer)
+
+    def state(self) -> Dict[str, int]:
+        return {
+            "saved_tokens": self.saved_tokens,
+            "summarized_tokens": self._summarized_tokens,
+            "window_start": self._window_start,
+        }
+
+    def restore(self, state: Dict[str, int]):
+        self.saved_tokens = state["saved_tokens"]
+        self._summarized_tokens = state["summarized_tokens"]
+        self._window_start = state.get("window_start", 0)
+
+    async def compact(self, history: List[Message]) -> Tuple[List[Message], int]:
+        """返回本轮实际发送的消息列表，以及相比未压缩的完整历史节省的 token 数"""
+        full_tokens = self._count(history)
+        if self._policy == "none" or not self._budget or full_tokens <= self._budget:
+            messages = history
+        elif self._policy == "sliding_window":
+            messages = self._sliding_window(history)
+        else:
+            messages = await self._summarize(history)
+            # 摘要直接改写了历史，被替换掉的 token 在之后每一轮都算作节省
+            self._summarized_tokens += full_tokens - self._count(history)
+            full_tokens = self._count(history)
+
+        saved = self._summarized_tokens + full_tokens - self._count(messages)
+        self.saved_tokens += saved
+        return messages, saved
+
+    def fit(self, messages: List[Message], budget: int) -> List[Message]:
+        """不论策略，用滑动窗口把 messages 裁剪到 budget 以内（至少保留 keep_last 条）；
+        用于压缩之后的 prompt 仍然放不下模型上下文窗口的情况，结果可能仍超出 budget"""
+        return self._window(messages, budget)
+
+    def _sliding_window(self, history: List[Message]) -> List[Message]:
+        if self._evict_to is not None:
+            return self._chunked_window(history)
+        return self._window(history, self._budget)
+
+    def _window(self, history: List[Message], budget: int) -> List[Message]:
+        system, rest = history[:1], history[1:]
+        tokens = self._count(system)
+        start = len(rest)
+        # 从最新的消息往前保留，直到超出预算（至少保留 keep_last 条）
+        while start > 0:
+            cost = self._count(rest[start - 1 : start])
+            if len(rest) - start >= self._keep_last and tokens + cost > budget:
+                break
+            tokens += cost
+            start -= 1
+        # 窗口必须从 user 消息开始，保证 user/assistant 交替
+        while start < len(rest) - 1 and rest[start].role != "user":
+            start += 1
+        return system + rest[start:]
+
+    def _chunked_window(self, history: List[Message]) -> List[Message]:
+        """窗口起点保持不动直到超出预算，超出时一次裁剪到 budget * evict_to"""
+        system, rest = history[:1], history[1:]
+        start = min(self._window_start, len(rest))
+        tokens = self._count(system) + self._count(rest[start:])
+        if tokens > self._budget:
+            target = self._budget * self._evict_to
+            while len(rest) - start > self._keep_last and tokens > target:
+                tokens -= self._count(rest[start : start + 1])
+                start += 1
+            while start < len(rest) - 1 and rest[start].role != "user":
+                start += 1
+            self._window_start = start
+        return system + rest[start:]
+
+    async def _summarize(self, history: List[Message]) -> List[Message]:
+        if self.summarizer is None:
+            logger.warning("summary policy enabled but no summarizer is set")
+            return self._sliding_window(history)
+        rest = history[1:]
+        cut = max(len(rest) - self._keep_last, 0)
+        # 保留的尾部从 assistant 消息开始，前面接上作为 user 消息的摘要
+        while cut < len(rest) and rest[cut].role != "assistant":
+            cut += 1
+        if cut == 0 or cut >= len(rest):
+            return self._sliding_window(history)
+        summary = await self.summarizer(rest[:cut])
+        summary_message = Message("user", self._summary_prefix.render(summary=summary))
+        # 摘要会替换掉历史中的旧消息，之后的压缩在此基础上滚动进行
+        history[1 : cut + 1] = [summary_message]
+        self._window_start = 0
+        return history
@@ -1,151 +1,225 @@
-import html
-import os
-import pickle
-from datetime import datetime
-
 import gradio as gr
 from loguru import logger
 
-from config import settings
+from broadcast import RESYNC
+from config import get_config
+from renderer import ChatRenderer
 from salon import Salon
+from session import SalonSession, find_live, live_salon_ids
+from transcript import TranscriptStore
+
+STOPPED_TITLE = "# LLM 沙龙已停止"
 
-stop_flag = False
 
+async def run_salon_gradio(session: SalonSession):
+    async for frame in _stream_salon(session, Salon()):
+        yield frame
 
-async def run_salon_gradio():
-    global stop_flag
-    stop_flag = False
-    salon = Salon()
-    chat_history = []
-    current_speaker = None
-    current_cot = ""
-    current_turn = 0
+
+async def resume_salon_gradio(salon_id: str, session: SalonSession):
+    """从所选讨论记录最近的检查点继续讨论"""
+    if not salon_id:
+        yield gr.update(), "# 请选择要继续的讨论记录"
+        return
+    try:
+        salon = Salon.resume(salon_id)
+    except ValueError as e:
+        yield gr.update(), f"# 无法继续: {e}"
+        return
+    store = TranscriptStore(salon.config.transcript.directory)
+    # 先显示已完成轮次的记录，中断那一轮的残留内容会被重新生成
+    chat_history, _ = store.chat_history(salon_id, until_round=salon.start_round)
+    async for frame in _stream_salon(session, salon, chat_history):
+        yield frame
+
+
+async def watch_salon_gradio(salon_id: str):
+    """旁观其他会话正在进行的讨论，只订阅它的事件流，不会再发起一次沙龙"""
+    owner = find_live(salon_id) if salon_id else None
+    if owner is None:
+        yield gr.update(), "# 该讨论已经结束，或者还没有开始"
+        return
+    async for frame in _render(owner.watch(), owner, owner.salon):
+        yield frame
+
+
+async def _stream_salon(session: SalonSession, salon: Salon, chat_history=None):
+    async for frame in _render(session.run(salon), session, salon, chat_history):
+        yield frame
+
+
+async def _render(events, owner: SalonSession, salon: Salon, chat_history=None):
+    def new_renderer() -> ChatRenderer:
+        renderer = ChatRenderer(salon.rounds, salon.config.stream_flush_interval)
+        if chat_history:
+            renderer.chat_history.extend(chat_history)
+        return renderer
+
+    renderer = new_renderer()
+    if chat_history:
+        yield renderer.frame()
 
     try:
-        async for event_type, data in salon.chatting():
-            if stop_flag or event_type == "task_finish":
-                yield (chat_history, "# LLM 沙龙已停止")
+        async for event_type, data in events:
+            if event_type == "task_finish":
+                yield (renderer.frame()[0], STOPPED_TITLE)
                 return
-            if event_type == "speaker_turn":
-                current_speaker = str(data)
-                speaker_label = f"✨ **{current_speaker}** ✨"
-                chat_history.append((speaker_label, ""))
-                yield (
-                    chat_history,
-                    f"# LLM 沙龙（{current_turn}/{settings.rounds}）讨论中...🤖💬",
-                )
-            elif event_type == "content_piece" and current_speaker:
-                current_cot = ""
-                if (
-                    not chat_history
-                    or chat_history[-1][0] != f"✨ **{current_speaker}** ✨"
-                ):
-                    chat_history.append((f"✨ **{current_speaker}** ✨", None))
-
-                last_message = chat_history[-1][1] or ""
-                chat_history[-1] = (chat_history[-1][0], last_message + str(data))
-                yield (
-                    chat_history,
-                    f"# LLM 沙龙（{current_turn}/{settings.rounds}）讨论中...🤖💬",
-                )
-            elif event_type == "reasoning_piece" and current_speaker:
-                if (
-                    not chat_history
-                    or chat_history[-1][0] != f"✨ **{current_speaker}** ✨"
-                ):
-                    chat_history.append((f"✨ **{current_speaker}** ✨", None))
-                current_cot += str(data)
-                formatted_cot = f"<pre style='white-space: pre-wrap; word-wrap: break-word;'>{html.escape(current_cot)}</pre>"
-                foldable_current_cot = f"""
-
-<details open style="margin-top: 10px; border: 1px solid #eee; border-radius: 5px; padding: 5px;">
-  <summary style="cursor: pointer; font-weight: bold; color: #555;">显示/隐藏 推理过程</summary>
-  {formatted_cot}
-</details>
-"""
-                chat_history[-1] = (chat_history[-1][0], foldable_current_cot)
-                yield (
-                    chat_history,
-                    f"# LLM 沙龙（{current_turn}/{settings.rounds}）讨论中...🤖💬",
-                )
-            elif event_type == "new_turn":
-                current_turn = data + 1
-                yield (
-                    chat_history,
-                    f"# LLM 沙龙（{current_turn}/{settings.rounds}）讨论中...🤖💬",
-                )
+            if event_type == RESYNC:
+                # 落后太多，接下来会从头收到全部内容
+                renderer = new_renderer()
+                continue
+            if renderer.handle(event_type, data):
+                yield renderer.frame()
+        if owner.cancelled:
+            yield (renderer.frame()[0], STOPPED_TITLE)
+        else:
+            yield renderer.frame()
 
     except Exception as e:
         logger.error(f"Discussion failed: {str(e)}")
         raise
 
 
-def save_chat_history(history):
-    """保存聊天历史到pkl文件"""
-    if not history:
-        return "没有聊天历史可保存"
+async def stop_discussion(session: SalonSession):
+    """只停止当前会话的沙龙，正在进行的请求会被立即取消"""
+    await session.cancel()
+    return STOPPED_TITLE
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"chat_history_{timestamp}.pkl"
 
-    # 确保history目录存在
-    os.makedirs("history", exist_ok=True)
-    filepath = os.path.join("history", filename)
+def list_transcripts():
+    """讨论记录在运行过程中持续写入磁盘，这里列出所有记录供载入"""
+    store = TranscriptStore(get_config().transcript.directory)
+    return gr.update(choices=store.salon_ids())
 
-    with open(filepath, "wb") as f:
-        pickle.dump(history, f)
 
-    return f"聊天历史已保存到 {filepath}"
+def list_live_salons():
+    return gr.update(choices=live_salon_ids())
 
 
-with gr.Blocks(theme=gr.themes.Soft()) as demo:
-    title = gr.Markdown(f"# LLM 沙龙（0/{settings.rounds}）讨论中...🤖💬")
-    gr.Markdown(settings.topic)
+def load_transcript(salon_id: str):
+    if not salon_id:
+        return gr.update(), "# 请选择要载入的讨论记录"
+    store = TranscriptStore(get_config().transcript.directory)
+    chat_history, _ = store.chat_history(salon_id)
+    return chat_history, f"# LLM 沙龙记录: {salon_id}"
 
-    chatbot_display = gr.Chatbot(
-        label="Conversation Log",
-        height=800,
-        show_copy_button=True,
-        bubble_full_width=False,
-    )
 
-    with gr.Row():
-        run_button = gr.Button(
-            "开始讨论",
-            variant="primary",
+def build_demo() -> gr.Blocks:
+    """构建网页界面；导入本模块不会创建任何组件"""
+    with gr.Blocks(theme=gr.themes.Soft()) as demo:
+        # 每个浏览器会话拥有自己的沙龙，关闭页面时停止
+        session = gr.State(SalonSession(), delete_callback=SalonSession.close)
+        title = gr.Markdown(f"# LLM 沙龙（0/{get_config().rounds}）讨论中...🤖💬")
+        topic_display = gr.Markdown(get_config().topic)
+        # 配置热重载后，刷新页面即可看到新的主题与轮数
+        demo.load(
+            fn=lambda: (
+                f"# LLM 沙龙（0/{get_config().rounds}）讨论中...🤖💬",
+                get_config().topic,
+            ),
+            outputs=[title, topic_display],
+        )
+
+        chatbot_display = gr.Chatbot(
+            label="Conversation Log",
+            height=800,
+            show_copy_button=True,
+            bubble_full_width=False,
+        )
+
+        with gr.Row():
+            run_button = gr.Button(
+                "开始讨论",
+                variant="primary",
+            )
+            stop_button = gr.Button(
+                "停止讨论",
+                variant="stop",
+            )
+
+        with gr.Row():
+            history_select = gr.Dropdown(label="历史记录", choices=[], scale=4)
+            load_button = gr.Button(
+                "载入历史",
+                variant="secondary",
+                scale=1,
+            )
+            resume_button = gr.Button(
+                "继续讨论",
+                variant="secondary",
+                scale=1,
+            )
+
+        with gr.Row():
+            live_select = gr.Dropdown(label="正在进行的讨论", choices=[], scale=4)
+            watch_button = gr.Button(
+                "旁观",
+                variant="secondary",
+                scale=1,
+            )
+
+        run_event = run_button.click(
+            fn=run_salon_gradio,
+            inputs=[session],
+            outputs=[chatbot_display, title],
+            show_progress="hidden",
+        )
+        history_select.focus(fn=list_transcripts, outputs=[history_select])
+        load_button.click(
+            fn=load_transcript,
+            inputs=[history_select],
+            outputs=[chatbot_display, title],
         )
-        stop_button = gr.Button(
-            "停止讨论",
-            variant="stop",
+        resume_event = resume_button.click(
+            fn=resume_salon_gradio,
+            inputs=[history_select, session],
+            outputs=[chatbot_display, title],
+            show_progress="hidden",
         )
-        save_button = gr.Button(
-            "保存历史",
-            variant="secondary",
+        live_select.focus(fn=list_live_salons, outputs=[live_select])
+        watch_event = watch_button.click(
+            fn=watch_salon_gradio,
+            inputs=[live_select],
+            outputs=[chatbot_display, title],
+            show_progress="hidden",
+            # 旁观者共享同一次生成，不占用沙龙的并发名额
+            concurrency_limit=get_config().spectator_limit,
+            concurrency_id="spectators",
+        )
+        # 旁观者点击停止只结束旁观，不影响正在旁观的沙龙
+        stop_button.click(
+            fn=stop_discussion,
+            inputs=[session],
+            outputs=[title],
+            cancels=[run_event, resume_event, watch_event],
+            # 停止不排队，也不受并发上限限制，满载时同样立即生效
+            concurrency_limit=None,
         )
 
-    save_status = gr.Markdown()
+    return demo
 
-    run_button.click(
-        fn=run_salon_gradio,
-        outputs=[chatbot_display, title],
-        show_progress="hidden",
-    )
-    save_button.click(
-        fn=lambda history: save_chat_history(history),
-        inputs=[chatbot_display],
-        outputs=[save_status],
-    )
 
-    def stop_discussion():
-        global stop_flag
-        stop_flag = True
-        return "# LLM 沙龙已停止"
+# Gradio 队列同时执行的事件总数受 max_threads 限制（默认 40），停止、载入记录等事件与讨论共用这些名额，
+# 留出余量，满载时它们也能立即执行
+QUEUE_HEADROOM = 8
+
 
-    stop_button.click(
-        fn=stop_discussion,
-        outputs=[title],
+def launch(**kwargs):
+    """每个会话一个沙龙，同时运行的沙龙数由 concurrency_limit 控制，旁观者数由 spectator_limit 控制"""
+    config = get_config()
+    limit = config.concurrency_limit
+    build_demo().queue(default_concurrency_limit=limit).launch(
+        max_threads=max(40, limit + config.spectator_limit + QUEUE_HEADROOM),
+        **kwargs,
     )
 
 
+def __getattr__(name: str):
+    # 兼容按模块属性查找 demo 的用法，例如 `gradio interface.py` 的热重载模式
+    if name == "demo":
+        return build_demo()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == "__main__":
-    demo.queue().launch()
+    launch()
@@ -0,0 +1,187 @@
+"""沙龙内共享的发言记录与对话消息。
+
+每条发言只保存一份，发言者通过游标读取自己上次发言以来别人说的话。每条记录带有引用计数，
+即还没有读到它的读者数，所有读者都读过之后从队首释放，内存只与尚未读完的发言数有关，
+不再随参与人数平方增长。
+
+发言者的历史由不可变的 Message 组成。别人的发言以 UserTurn 的形式进入历史，只引用发言的原文，
+第一次发送请求时才按模板拼成 user 消息并缓存，之后的请求不再重复渲染。
+"""
+
+from collections import abc, deque
+from dataclasses import dataclass
+from typing import (TYPE_CHECKING, Collection, Deque, Dict, List, Optional,
+                    Tuple)
+
+if TYPE_CHECKING:
+    from prompts import PromptFormatter
+    from tokens import Tokenizer
+
+
+class Message(abc.Mapping):
+    """一条对话消息，创建后不再修改，可以被多个历史共享。
+
+    可以像 {"role": ..., "content": ...} 一样按键读取；发送请求或写入检查点时用 as_dict() 转换。
+    """
+
+    __slots__ = ("role", "_content", "_tokens")
+
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self._content = content
+        # (分词器, token 数)，内容不变，计数只需做一次
+        self._tokens: Optional[Tuple["Tokenizer", int]] = None
+
+    @property
+    def content(self) -> str:
+        return self._content
+
+    def __getitem__(self, key: str) -> str:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(("role", "content"))
+
+    def __len__(self) -> int:
+        return 2
+
+    def as_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+    def strings(self) -> Tuple[str, ...]:
+        """消息实际保存的字符串，用于估计内存占用"""
+        return (self._content,)
+
+    def tokens(self, tokenizer: "Tokenizer") -> int:
+        """按 tokenizer 计算的 token 数，含每条消息的固定开销"""
+        if self._tokens is None or self._tokens[0] is not tokenizer:
+            self._tokens = (
+                tokenizer,
+                tokenizer.count(self.content) + tokenizer.message_overhead,
+            )
+        return self._tokens[1]
+
+
+class UserTurn(Message):
+    """发言者上次发言以来听到的发言与轮次信息，content 在第一次读取时由模板生成并缓存。
+
+    发言与轮次信息创建后不再改变，渲染结果可以一直复用；否则每次请求都要把整个历史重新渲染一遍，
+    开销随历史长度平方增长。
+    """
+
+    __slots__ = ("_entries", "_round", "_total", "_formatter")
+
+    def __init__(
+        self,
+        entries: Tuple[Tuple[str, str], ...],
+        current_round: int,
+        total_rounds: int,
+        formatter: "PromptFormatter",
+    ):
+        # _content 为 None 表示尚未渲染
+        super().__init__("user", None)
+        self._entries = entries
+        self._round = current_round
+        self._total = total_rounds
+        self._formatter = formatter
+
+    @property
+    def content(self) -> str:
+        if self._content is None:
+            self._content = self._formatter.salon_cache(
+                self._entries, self._round, self._total
+            )
+        return self._content
+
+    def strings(self) -> Tuple[str, ...]:
+        rendered = () if self._content is None else (self._content,)
+        return tuple(message for _, message in self._entries) + rendered
+
+
+@dataclass(slots=True)
+class _Entry:
+    speaker: str
+    message: str
+    # None 表示所有读者都能看到，否则只有 audience 中的读者能看到
+    audience: Optional[Collection[str]]
+    refs: int
+
+    def visible_to(self, reader: str) -> bool:
+        return reader != self.speaker and (
+            self.audience is None or reader in self.audience
+        )
+
+
+class MessageLog:
+    def __init__(self):
+        self._entries: Deque[_Entry] = deque()
+        # _entries[0] 的绝对序号
+        self._offset = 0
+        # 读者 -> 下一条未读记录的绝对序号
+        self._cursors: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        """尚未被所有读者读完的记录数"""
+        return len(self._entries)
+
+    @property
+    def readers(self) -> List[str]:
+        return list(self._cursors)
+
+    def subscribe(self, reader: str):
+        """读者只能读到订阅之后的发言"""
+        if reader not in self._cursors:
+            self._cursors[reader] = self._offset + len(self._entries)
+
+    def append(
+        self, speaker: str, message: str, audience: Optional[Collection[str]] = None
+    ):
+        """记录一次发言，发言者自己不会读到；没有读者需要的发言不会保存"""
+        if audience is None:
+            refs = len(self._cursors) - (speaker in self._cursors)
+        else:
+            refs = sum(
+                1
+                for reader in audience
+                if reader != speaker and reader in self._cursors
+            )
+        if refs:
+            self._entries.append(_Entry(speaker, message, audience, refs))
+
+    def _unread(self, reader: str):
+        # 游标之前的记录可能已经释放：它们对这个读者不可见，或已经被读过
+        start = max(self._cursors[reader] - self._offset, 0)
+        for index in range(start, len(self._entries)):
+            entry = self._entries[index]
+            if entry.visible_to(reader):
+                yield entry
+
+    def peek(self, reader: str) -> List[Tuple[str, str]]:
+        """读者的未读发言，不移动游标"""
+        return [(entry.speaker, entry.message) for entry in self._unread(reader)]
+
+    def read(self, reader: str, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """读出并消费读者的未读发言；limit 不为空时只返回最近的 limit 条，更早的视为已读"""
+        entries = list(self._unread(reader))
+        for entry in entries:
+            entry.refs -= 1
+        self._cursors[reader] = self._offset + len(self._entries)
+        self._release()
+        if limit is not None:
+            entries = entries[-limit:] if limit else []
+        return [(entry.speaker, entry.message) for entry in entries]
+
+    def reset(self, reader: str, unread: List[Tuple[str, str]]):
+        """把读者的未读发言替换为 unread，用于从检查点恢复"""
+        self.read(reader)
+        for speaker, message in unread:
+            self._entries.append(_Entry(speaker, message, (reader,), 1))
+
+    def _release(self):
+        while self._entries and self._entries[0].refs <= 0:
+            self._entries.popleft()
+            self._offset += 1
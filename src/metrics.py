@@ -0,0 +1,358 @@
+"""轻量的运行指标：Prometheus 文本格式导出 + 每个沙龙结束时的汇总表。
+
+每次观测只是一次 bisect 加几次整数累加，可以在生产环境常开。
+"""
+
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import (TYPE_CHECKING, Callable, Dict, List, Optional, Sequence,
+                    Tuple)
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# 指标在事件循环中更新，在 HTTP 线程中读取
+_lock = threading.Lock()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DURATION_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self._documentation = documentation
+        self._labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *labels: str):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self._documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self._labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self._documentation = documentation
+        self._labels = tuple(labels)
+        self._buckets = tuple(buckets)
+        # labels -> [每个桶的计数..., +Inf 桶的计数, sum, count]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        with _lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self._buckets) + 3)
+            series[bisect_left(self._buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self._documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self._buckets, "+Inf"), series):
+                cumulative += count
+                le = _format_labels(self._labels, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_str = _format_labels(self._labels, labels)
+            lines.append(f"{self.name}_sum{label_str} {series[-2]}")
+            lines.append(f"{self.name}_count{label_str} {series[-1]}")
+        return lines
+
+
+QUEUE_WAIT = Histogram(
+    "salon_queue_wait_seconds",
+    "Time a request waited for the global and per-provider semaphores",
+    ("provider",),
+)
+TTFT = Histogram(
+    "salon_ttft_seconds",
+    "Time from sending a request to its first streamed token",
+    ("provider", "model"),
+)
+INTER_TOKEN = Histogram(
+    "salon_inter_token_seconds",
+    "Gap between consecutive streamed chunks",
+    ("provider",),
+)
+TOKENS = Counter(
+    "salon_tokens_total",
+    "Tokens reported in the usage block of the stream",
+    ("provider", "model", "kind"),
+)
+TURN_SECONDS = Histogram(
+    "salon_turn_seconds",
+    "Wall-clock duration of one speaker turn",
+    ("role",),
+    DURATION_BUCKETS,
+)
+ROUND_SECONDS = Histogram(
+    "salon_round_seconds",
+    "Wall-clock duration of one salon round",
+    (),
+    DURATION_BUCKETS,
+)
+PIPELINE_SAVED = Counter(
+    "salon_pipeline_saved_seconds_total",
+    "Wall-clock time a prefetched turn overlapped with the hidden hoster",
+)
+PIPELINE_CANCELLED = Counter(
+    "salon_pipeline_cancelled_total",
+    "Prefetched turns discarded because the hoster ended the salon",
+)
+
+_metrics = [
+    QUEUE_WAIT,
+    TTFT,
+    INTER_TOKEN,
+    TOKENS,
+    TURN_SECONDS,
+    ROUND_SECONDS,
+    PIPELINE_SAVED,
+    PIPELINE_CANCELLED,
+]
+# 额外的导出函数，例如 SSEClient 的重试与限速统计
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def register_collector(collector: Callable[[], List[str]]):
+    _collectors.append(collector)
+
+
+def render() -> str:
+    with _lock:
+        lines = [line for metric in _metrics for line in metric.render()]
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> "ThreadingHTTPServer":
+    """在后台线程中提供 /metrics，供 Prometheus 抓取"""
+    # 只有启动指标服务的进程才需要 http.server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@dataclass(slots=True)
+class TurnMetrics:
+    round: int
+    speaker: str
+    duration: float
+    queue_wait: Optional[float] = None
+    ttft: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    # provider 声明了多个端点时，实际响应的端点
+    endpoint: Optional[str] = None
+    # 发送前本地计算的 prompt token 数，以及据此设定的 max_tokens
+    predicted_prompt_tokens: Optional[int] = None
+    max_tokens: Optional[int] = None
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if not self.completion_tokens or self.ttft is None:
+            return None
+        generating = self.duration - (self.queue_wait or 0) - self.ttft
+        return self.completion_tokens / generating if generating > 0 else None
+
+
+class SalonMetrics:
+    """单个沙龙的每次发言与每轮耗时，结束时输出汇总表"""
+
+    def __init__(self):
+        self.turns: List[TurnMetrics] = []
+        self.rounds: List[float] = []
+        # pipeline_hoster 开启时，每次提前发言节省的时间；None 表示被取消
+        self.prefetches: List[Optional[float]] = []
+
+    def add_turn(
+        self,
+        round_index: int,
+        speaker: str,
+        duration: float,
+        stats: Optional[Dict] = None,
+        role: str = "chatter",
+    ):
+        stats = stats or {}
+        self.turns.append(
+            TurnMetrics(
+                round_index,
+                speaker,
+                duration,
+                stats.get("queue_wait"),
+                stats.get("ttft"),
+                stats.get("prompt_tokens"),
+                stats.get("cached_tokens"),
+                stats.get("completion_tokens"),
+                stats.get("endpoint"),
+                stats.get("predicted_prompt_tokens"),
+                stats.get("max_tokens"),
+            )
+        )
+        TURN_SECONDS.observe(duration, role)
+
+    def add_round(self, duration: float):
+        self.rounds.append(duration)
+        ROUND_SECONDS.observe(duration)
+
+    def add_prefetch(self, saved: Optional[float]):
+        self.prefetches.append(saved)
+        if saved is None:
+            PIPELINE_CANCELLED.inc()
+        else:
+            PIPELINE_SAVED.inc(saved)
+
+    @property
+    def saved_seconds(self) -> float:
+        return sum(saved for saved in self.prefetches if saved is not None)
+
+    def summary(self) -> List[Dict]:
+        """按发言者汇总: 发言次数、平均耗时/排队/TTFT/输出速度、token 总数（含命中前缀缓存的部分）"""
+
+        def mean(values):
+            values = [v for v in values if v is not None]
+            return sum(values) / len(values) if values else None
+
+        rows = []
+        speakers = dict.fromkeys(turn.speaker for turn in self.turns)
+        for speaker in speakers:
+            turns = [turn for turn in self.turns if turn.speaker == speaker]
+            rows.append(
+                {
+                    "speaker": speaker,
+                    "turns": len(turns),
+                    "avg_turn": mean(turn.duration for turn in turns),
+                    "avg_queue_wait": mean(turn.queue_wait for turn in turns),
+                    "avg_ttft": mean(turn.ttft for turn in turns),
+                    "tokens_per_second": mean(turn.tokens_per_second for turn in turns),
+                    "prompt_tokens": sum(turn.prompt_tokens or 0 for turn in turns),
+                    "cached_tokens": sum(turn.cached_tokens or 0 for turn in turns),
+                    "completion_tokens": sum(
+                        turn.completion_tokens or 0 for turn in turns
+                    ),
+                }
+            )
+        return rows
+
+    def format_table(self) -> str:
+        def fmt(value, spec=".2f", suffix="s"):
+            return "-" if value is None else f"{value:{spec}}{suffix}"
+
+        # 发言者名字多为中文，放在最后一列以免破坏对齐
+        header = (
+            f"{'turns':>6}{'avg turn':>10}{'queue':>9}{'ttft':>9}"
+            f"{'tok/s':>9}{'prompt':>9}{'cached':>9}{'output':>9}  speaker"
+        )
+        lines = [header]
+        for row in self.summary():
+            lines.append(
+                f"{row['turns']:>6}{fmt(row['avg_turn']):>10}"
+                f"{fmt(row['avg_queue_wait']):>9}{fmt(row['avg_ttft']):>9}"
+                f"{fmt(row['tokens_per_second'], '.1f', ''):>9}"
+                f"{row['prompt_tokens']:>9}{row['cached_tokens']:>9}"
+                f"{row['completion_tokens']:>9}"
+                f"  {row['speaker']}"
+            )
+        if self.rounds:
+            lines.append(
+                f"{len(self.rounds)} rounds, {sum(self.rounds):.1f}s total, "
+                f"{sum(self.rounds) / len(self.rounds):.1f}s per round"
+            )
+        prompt_tokens = sum(turn.prompt_tokens or 0 for turn in self.turns)
+        cached_tokens = sum(turn.cached_tokens or 0 for turn in self.turns)
+        if cached_tokens:
+            lines.append(
+                f"provider prompt cache hits: {cached_tokens}/{prompt_tokens} tokens "
+                f"({cached_tokens / prompt_tokens:.0%})"
+            )
+        # 只比较 provider 返回了 usage 的发言
+        compared = [
+            turn
+            for turn in self.turns
+            if turn.prompt_tokens and turn.predicted_prompt_tokens
+        ]
+        if compared:
+            predicted = sum(turn.predicted_prompt_tokens for turn in compared)
+            reported = sum(turn.prompt_tokens for turn in compared)
+            error = sum(
+                abs(turn.predicted_prompt_tokens - turn.prompt_tokens)
+                / turn.prompt_tokens
+                for turn in compared
+            ) / len(compared)
+            lines.append(
+                f"prompt tokens predicted {predicted}, reported {reported} "
+                f"({predicted / reported - 1:+.1%} overall, {error:.1%} mean error "
+                f"per turn)"
+            )
+        sized = [turn.max_tokens for turn in self.turns if turn.max_tokens]
+        if sized:
+            lines.append(
+                f"max_tokens sized per turn: min {min(sized)}, max {max(sized)}"
+            )
+        endpoints: Dict[str, int] = {}
+        for turn in self.turns:
+            if turn.endpoint:
+                endpoints[turn.endpoint] = endpoints.get(turn.endpoint, 0) + 1
+        if endpoints:
+            lines.append(
+                "endpoints: "
+                + ", ".join(f"{name} {count}" for name, count in endpoints.items())
+            )
+        if self.prefetches:
+            cancelled = self.prefetches.count(None)
+            lines.append(
+                f"hoster pipelining saved {self.saved_seconds:.1f}s over "
+                f"{len(self.prefetches) - cancelled} turns, {cancelled} cancelled"
+            )
+        return "\n".join(lines)
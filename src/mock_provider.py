@@ -0,0 +1,268 @@
+"""本地 OpenAI 兼容的流式 mock 服务，用于在没有 API key 和网络的情况下运行和压测沙龙。
+
+    python mock_provider.py --port 8765 --ttft 0.2 --token-rate 100
+
+然后在 settings.yaml 中把发言者的 provider 设为 ``mock``。相同的请求总是得到相同的回复。
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+
+from aiohttp import web
+
+WORDS = [
+    "周末", "河北", "这么近", "那么美", "江城子", "长城", "燕山", "白洋淀", "秋风",
+    "明月", "归途", "山河", "故人", "烟雨", "晚霞", "，", "。", "\n",
+]  # fmt: skip
+
+
+PREFIX_CACHE_SIZE = 100_000
+
+
+@dataclass
+class MockOptions:
+    ttft: float = 0.2  # 首 token 延迟（秒）
+    token_rate: float = 100.0  # 每秒输出的 token 数，<= 0 表示不限速
+    reasoning_tokens: int = 0  # 每次回复先输出的 reasoning_content token 数
+    content_tokens: int = 60  # 每次回复的正文 token 数
+    # 主持人在第几轮调用 mark_task_as_completed(all_steps_done=true)，0 表示从不
+    complete_after: int = 3
+    tool_call_position: str = "end"  # start: 先输出工具调用再输出正文；end: 正文之后
+    error_rate: float = 0.0  # 首字节前直接返回 error_status 的概率
+    error_status: int = 429
+    stream_error_rate: float = 0.0  # 在流中间返回 error 事件的概率
+    disconnect_rate: float = 0.0  # 在流中间直接断开连接的概率
+    slow_rate: float = 0.0  # 首 token 延迟变为 slow_ttft 的请求比例，模拟偶发的慢请求
+    slow_ttft: float = 5.0
+    # 正文变为 runaway_tokens 个 token 的回复比例，模拟停不下来的发言者
+    runaway_rate: float = 0.0
+    runaway_tokens: int = 2000
+    seed: int = 0
+
+
+def _chunk(model: str, created: int, delta: dict, finish_reason=None, **extra) -> bytes:
+    chunk = {
+        "id": f"mock-{created}",
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        **extra,
+    }
+    return b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n"
+
+
+def _wants_completion_tool(payload: dict) -> bool:
+    return any(
+        tool.get("function", {}).get("name") == "mark_task_as_completed"
+        for tool in payload.get("tools") or []
+    )
+
+
+def _selection_tool(payload: dict):
+    for tool in payload.get("tools") or []:
+        if tool.get("function", {}).get("name") == "select_next_speakers":
+            return tool["function"]
+    return None
+
+
+def _prefix_cache_hit(cache: OrderedDict, messages: list) -> int:
+    """模拟 provider 的前缀缓存：与之前的请求相同的最长消息前缀计为命中"""
+    digest = hashlib.sha256()
+    hit, matched = 0, True
+    for message in messages:
+        digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True).encode())
+        key = digest.digest()
+        if matched and key in cache:
+            hit += len(message.get("content") or "") // 2
+            cache.move_to_end(key)
+        else:
+            matched = False
+            cache[key] = None
+    while len(cache) > PREFIX_CACHE_SIZE:
+        cache.popitem(last=False)
+    return hit
+
+
+async def _write_completion_call(
+    response: web.StreamResponse,
+    model: str,
+    created: int,
+    messages: list,
+    options: MockOptions,
+):
+    current_round = sum(1 for m in messages if m.get("role") == "user")
+    done = 0 < options.complete_after <= current_round
+    arguments = json.dumps({"all_steps_done": done})
+    call = {
+        "index": 0,
+        "id": f"call_{created}",
+        "type": "function",
+        "function": {"name": "mark_task_as_completed", "arguments": ""},
+    }
+    await response.write(_chunk(model, created, {"tool_calls": [call]}))
+    # 参数分片发送，和真实 provider 一样需要客户端拼接
+    for start in range(0, len(arguments), 8):
+        fragment = {"index": 0, "function": {"arguments": arguments[start : start + 8]}}
+        await response.write(_chunk(model, created, {"tool_calls": [fragment]}))
+
+
+async def _write_selection_call(
+    response: web.StreamResponse,
+    model: str,
+    created: int,
+    tool: dict,
+    rng: random.Random,
+):
+    """按请求内容确定地点名下一轮的发言者"""
+    speakers = tool["parameters"]["properties"]["speakers"]
+    names = speakers["items"]["enum"]
+    count = min(speakers.get("maxItems", len(names)), len(names))
+    arguments = json.dumps({"speakers": rng.sample(names, count)}, ensure_ascii=False)
+    call = {
+        "index": 1,
+        "id": f"call_{created}_select",
+        "type": "function",
+        "function": {"name": "select_next_speakers", "arguments": arguments},
+    }
+    await response.write(_chunk(model, created, {"tool_calls": [call]}))
+
+
+async def chat_completions(request: web.Request) -> web.StreamResponse:
+    options: MockOptions = request.app["options"]
+    payload = await request.json()
+    messages = payload.get("messages", [])
+    model = payload.get("model", "mock")
+    # 以请求内容为种子，保证相同请求得到相同的回复；
+    # 错误注入使用按 seed 初始化的独立随机序列，重试同一请求时不会每次都失败
+    digest = hashlib.sha256(
+        json.dumps(messages, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).digest()
+    rng = random.Random(int.from_bytes(digest[:8], "big") ^ options.seed)
+
+    faults: random.Random = request.app["faults"]
+    cache_hit = _prefix_cache_hit(request.app["prefix_cache"], messages)
+
+    if faults.random() < options.error_rate:
+        return web.json_response(
+            {"error": {"message": "mock injected error", "type": "mock_error"}},
+            status=options.error_status,
+        )
+
+    response = web.StreamResponse(
+        headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+    )
+    await response.prepare(request)
+    created = int(time.time())
+    interval = 1 / options.token_rate if options.token_rate > 0 else 0
+    content_tokens = options.content_tokens
+    # 只在开启时抽样，相同的请求仍然得到相同的回复
+    if options.runaway_rate and rng.random() < options.runaway_rate:
+        content_tokens = options.runaway_tokens
+    total = options.reasoning_tokens + content_tokens
+    # 与真实 API 一样，输出达到 max_tokens 时截断，finish_reason 为 length
+    finish_reason = "stop"
+    if payload.get("max_tokens") and total > payload["max_tokens"]:
+        total, finish_reason = payload["max_tokens"], "length"
+    fail_at, failure = -1, None
+    roll = faults.random()
+    if roll < options.stream_error_rate:
+        failure = "error"
+    elif roll < options.stream_error_rate + options.disconnect_rate:
+        failure = "disconnect"
+    if failure:
+        fail_at = faults.randrange(max(total, 1))
+
+    ttft = options.ttft
+    # 只在开启时抽样，不改变错误注入的随机序列
+    if options.slow_rate and faults.random() < options.slow_rate:
+        ttft = options.slow_ttft
+    await asyncio.sleep(ttft)
+    if _wants_completion_tool(payload) and options.tool_call_position == "start":
+        await _write_completion_call(response, model, created, messages, options)
+    for i in range(total):
+        if i == fail_at:
+            if failure == "disconnect":
+                request.transport.close()
+                return response
+            await response.write(
+                b"data: "
+                + json.dumps(
+                    {"error": {"message": "mock stream error", "type": "server_error"}}
+                ).encode()
+                + b"\n\n"
+            )
+            return response
+        word = rng.choice(WORDS)
+        if i < options.reasoning_tokens:
+            delta = {"role": "assistant", "content": None, "reasoning_content": word}
+        else:
+            delta = {"content": word}
+        await response.write(_chunk(model, created, delta))
+        if interval:
+            await asyncio.sleep(interval)
+
+    if _wants_completion_tool(payload) and options.tool_call_position == "end":
+        await _write_completion_call(response, model, created, messages, options)
+    selection = _selection_tool(payload)
+    if selection:
+        await _write_selection_call(response, model, created, selection, rng)
+
+    # 与真实 API 一样，工具定义也计入 prompt
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+    if payload.get("tools"):
+        prompt_chars += len(json.dumps(payload["tools"], ensure_ascii=False))
+    prompt_tokens = prompt_chars // 2
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "prompt_cache_hit_tokens": cache_hit,
+        "prompt_cache_miss_tokens": prompt_tokens - cache_hit,
+        "completion_tokens": total,
+        "total_tokens": prompt_tokens + total,
+    }
+    await response.write(_chunk(model, created, {}, finish_reason, usage=usage))
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+def create_app(options: MockOptions = None) -> web.Application:
+    app = web.Application()
+    app["options"] = options = options or MockOptions()
+    app["faults"] = random.Random(options.seed)
+    app["prefix_cache"] = OrderedDict()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/health", health)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible SSE provider")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    defaults = MockOptions()
+    for f in fields(MockOptions):
+        parser.add_argument(
+            f"--{f.name.replace('_', '-')}",
+            type=f.type,
+            default=getattr(defaults, f.name),
+        )
+    args = parser.parse_args()
+    options = MockOptions(
+        **{f.name: getattr(args, f.name) for f in fields(MockOptions)}
+    )
+    web.run_app(create_app(options), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
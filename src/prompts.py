@@ -0,0 +1,146 @@
+"""预编译的提示模板。
+
+settings.yaml 中的模板在构建配置快照时解析一次，未知字段在加载配置时就会报错；渲染时只拼接
+字面量和字段值。整条消息先收集到列表中再一次 join，长讨论中不会反复复制越来越长的字符串。
+"""
+
+from string import Formatter
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+
+class CompiledTemplate:
+    """str.format 风格的模板，只允许 fields 中列出的字段"""
+
+    __slots__ = ("_literal", "_parts", "source")
+
+    def __init__(self, source: str, fields: Iterable[str] = ()):
+        allowed = set(fields)
+        self.source = source
+        # (字面量, 字段名, 转换, 格式说明)，字段名为 None 表示只有字面量
+        parts: List[Tuple[str, Optional[str], Optional[str], str]] = []
+        for literal, name, spec, conversion in Formatter().parse(source):
+            if name is not None and name not in allowed:
+                raise ValueError(
+                    f"unknown field {{{name}}} in template, expected one of "
+                    f"{sorted(allowed)}: {source!r}"
+                )
+            parts.append((literal, name, conversion, spec or ""))
+        self._parts = tuple(parts)
+        # 没有字段的模板直接返回字面量
+        self._literal = (
+            "".join(literal for literal, *_ in parts)
+            if all(name is None for _, name, _, _ in parts)
+            else None
+        )
+
+    def render(self, **values) -> str:
+        if self._literal is not None:
+            return self._literal
+        buffer: List[str] = []
+        self.render_into(buffer, values)
+        return "".join(buffer)
+
+    def render_into(self, buffer: List[str], values: dict):
+        """把渲染结果的各个片段追加到 buffer"""
+        if self._literal is not None:
+            buffer.append(self._literal)
+            return
+        for literal, name, conversion, spec in self._parts:
+            if literal:
+                buffer.append(literal)
+            if name is None:
+                continue
+            value = values[name]
+            if conversion == "s":
+                value = str(value)
+            elif conversion == "r":
+                value = repr(value)
+            elif conversion == "a":
+                value = ascii(value)
+            buffer.append(format(value, spec) if spec else str(value))
+
+
+class PromptFormatter:
+    """某份配置快照的全部提示模板，随 TemplateConfig 一起构建"""
+
+    def __init__(self, template):
+        salon_cache = template.salon_cache
+        # prefix 与 suffix 一直按原文使用，不做格式化
+        self._cache_prefix = salon_cache.prefix
+        self._cache_suffix = salon_cache.suffix
+        self._cache_speaker = CompiledTemplate(
+            salon_cache.speaker, ("speaker", "message")
+        )
+        self._round_index = CompiledTemplate(
+            salon_cache.round_index, ("current_round", "total_rounds")
+        )
+        self._system_prompt = self._compile_prompt(template.system_prompt)
+        self._hoster_prompt = self._compile_prompt(template.hoster_prompt)
+        self.summary_prompt = CompiledTemplate(template.summary.prompt, ("history",))
+        self.summary_prefix = CompiledTemplate(template.summary.prefix, ("summary",))
+
+    @staticmethod
+    def _compile_prompt(prompt_template) -> Tuple[CompiledTemplate, ...]:
+        return (
+            CompiledTemplate(prompt_template.prefix, ("role", "role_prompt", "topic")),
+            CompiledTemplate(prompt_template.chatter, ("role", "role_prompt")),
+            CompiledTemplate(prompt_template.suffix),
+        )
+
+    @staticmethod
+    def _render_prompt(
+        templates: Tuple[CompiledTemplate, ...],
+        role: str,
+        role_prompt: str,
+        topic: str,
+        participants: Iterable[Tuple[str, str]],
+    ) -> str:
+        prefix, chatter, suffix = templates
+        buffer: List[str] = []
+        prefix.render_into(
+            buffer, {"role": role, "role_prompt": role_prompt, "topic": topic}
+        )
+        for name, prompt in participants:
+            chatter.render_into(buffer, {"role": name, "role_prompt": prompt})
+        suffix.render_into(buffer, {})
+        return "".join(buffer)
+
+    def system_prompt(
+        self,
+        role: str,
+        role_prompt: str,
+        topic: str,
+        participants: Iterable[Tuple[str, str]],
+    ) -> str:
+        """普通发言者的系统提示，participants 为其他参与者的 (名字, 角色设定)"""
+        return self._render_prompt(
+            self._system_prompt, role, role_prompt, topic, participants
+        )
+
+    def hoster_prompt(
+        self,
+        role: str,
+        role_prompt: str,
+        topic: str,
+        participants: Iterable[Tuple[str, str]],
+    ) -> str:
+        return self._render_prompt(
+            self._hoster_prompt, role, role_prompt, topic, participants
+        )
+
+    def salon_cache(
+        self,
+        entries: Sequence[Tuple[str, str]],
+        current_round: int,
+        total_rounds: int,
+    ) -> str:
+        """把上次发言以来其他人的发言拼成一条 user 消息，current_round 从 1 开始"""
+        buffer: List[str] = [self._cache_prefix]
+        speaker = self._cache_speaker
+        for name, message in entries:
+            speaker.render_into(buffer, {"speaker": name, "message": message})
+        buffer.append(self._cache_suffix)
+        self._round_index.render_into(
+            buffer, {"current_round": current_round, "total_rounds": total_rounds}
+        )
+        return "".join(buffer)
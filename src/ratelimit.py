@@ -0,0 +1,132 @@
+import asyncio
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+# 首字节之前出现这些状态码时可以安全重试
+RETRYABLE_STATUS = frozenset({408, 409, 425, 429, 500, 502, 503, 504, 529})
+
+
+# 流中 error 事件没有数字状态码时，按 type/code 识别的瞬时错误：限流、过载、服务端错误
+RETRYABLE_ERROR_TYPES = frozenset(
+    {
+        "rate_limit_error",
+        "rate_limit_exceeded",
+        "overloaded",
+        "overloaded_error",
+        "server_error",
+        "internal_error",
+        "internal_server_error",
+        "service_unavailable",
+        "api_error",
+        "timeout",
+    }
+)
+
+
+class RetryableError(Exception):
+    """可以重试的传输错误：限流、服务端 5xx、连接中断、流中表示瞬时错误的 error 事件"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ProviderError(Exception):
+    """流中 provider 明确拒绝请求的 error 事件（参数错误、鉴权、内容审核、超出上下文长度等），重试不会成功"""
+
+
+def is_retryable_error(error: Any) -> bool:
+    """按流中 error 事件的状态码或 type/code 判断是否为瞬时错误，与 HTTP 状态码使用同一标准；
+    无法识别的错误不重试"""
+    if not isinstance(error, dict):
+        return False
+    for key in ("status", "status_code", "code"):
+        value = error.get(key)
+        if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+            return int(value) in RETRYABLE_STATUS
+    return any(
+        str(error.get(key)).lower() in RETRYABLE_ERROR_TYPES for key in ("type", "code")
+    )
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头，只支持秒数形式"""
+    try:
+        return max(float(value), 0.0) if value else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(
+    attempt: int, base: float, cap: float, retry_after: Optional[float] = None
+) -> float:
+    """带 full jitter 的指数退避；服务端给出 Retry-After 时至少等待这么久"""
+    delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, cap))
+    return delay
+
+
+class TokenBucket:
+    """按分钟配额匀速补充的令牌桶。
+
+    ``rate_per_minute`` 为 None 时不限速。余额允许透支：请求结束后按实际用量补扣，
+    透支部分由之后的请求等待偿还。
+    """
+
+    def __init__(self, rate_per_minute: Optional[float]):
+        self._rate = rate_per_minute / 60 if rate_per_minute else None
+        self._capacity = rate_per_minute or 0
+        self._tokens = float(self._capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    async def acquire(self, amount: float = 1) -> float:
+        """取出 amount 个令牌，返回为此等待的秒数"""
+        if self._rate is None:
+            return 0.0
+        # 单次请求超过桶容量时按满桶处理，避免永远等不到
+        amount = min(amount, self._capacity)
+        waited = 0.0
+        # 加锁保证先来先得，不会被后到的小请求插队饿死
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                delay = (amount - self._tokens) / self._rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= amount
+        return waited
+
+    def consume(self, amount: float):
+        """事后补扣令牌（例如按 usage 补扣输出 token），余额可以为负"""
+        if self._rate is not None:
+            self._refill()
+            self._tokens -= amount
+
+
+@dataclass(slots=True)
+class TransportStats:
+    """单个 provider 的传输统计，供日志与监控导出"""
+
+    requests: int = 0
+    retries: int = 0
+    resumes: int = 0
+    restarts: int = 0
+    failures: int = 0
+    cancelled: int = 0
+    retry_wait: float = 0.0
+    rate_limit_wait: float = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return asdict(self)
@@ -0,0 +1,130 @@
+import html
+import time
+from typing import Dict, List, Optional, Tuple
+
+COT_PREFIX = """
+
+<details open style="margin-top: 10px; border: 1px solid #eee; border-radius: 5px; padding: 5px;">
+  <summary style="cursor: pointer; font-weight: bold; color: #555;">显示/隐藏 推理过程</summary>
+  <pre style='white-space: pre-wrap; word-wrap: break-word;'>"""
+COT_SUFFIX = """</pre>
+</details>
+"""
+
+
+class _Row:
+    """聊天记录中一位发言者的一次发言，推理过程与正文分别增量累积"""
+
+    __slots__ = ("index", "label", "cot", "content", "pending_cot", "pending_content")
+
+    def __init__(self, index: int, label: str):
+        self.index = index
+        self.label = label
+        # 已转义的推理过程与正文；pending_* 为尚未刷新到界面的片段
+        self.cot = ""
+        self.content = ""
+        self.pending_cot: List[str] = []
+        self.pending_content: List[str] = []
+
+    def render(self) -> str:
+        if self.pending_cot:
+            # html.escape 逐字符替换，分段转义后拼接与整体转义结果一致
+            self.cot += html.escape("".join(self.pending_cot))
+            self.pending_cot.clear()
+        if self.pending_content:
+            self.content += "".join(self.pending_content)
+            self.pending_content.clear()
+        if self.cot:
+            return COT_PREFIX + self.cot + COT_SUFFIX + self.content
+        return self.content
+
+
+class ChatRenderer:
+    """把 Salon.chatting 的事件流渲染为 Gradio Chatbot 的消息列表。
+
+    片段先缓存在各自的行里，每隔 flush_interval 秒才刷新一次界面；
+    刷新时只重新渲染有变化的行，每帧的开销与讨论记录的总长度无关。
+    """
+
+    def __init__(self, rounds: int, flush_interval: float = 0.05):
+        self.chat_history: List[Tuple[str, Optional[str]]] = []
+        self._rounds = rounds
+        self._flush_interval = flush_interval
+        self._rows: Dict[str, _Row] = {}
+        self._dirty: Dict[int, _Row] = {}
+        self._current_speaker: Optional[str] = None
+        self._last_flush = 0.0
+        self._force = False
+        self.title = self._format_title(0)
+
+    def _format_title(self, current_turn: int) -> str:
+        return f"# LLM 沙龙（{current_turn}/{self._rounds}）讨论中...🤖💬"
+
+    @staticmethod
+    def _format_token_limit(data: Dict) -> str:
+        where = "中途" if data["mid_round"] else "开始前"
+        reason = "token 预算不足" if data["limit"] == "budget" else "上下文窗口已满"
+        if data.get("total") is not None:
+            reason += f"（已用 {data['used']}/{data['total']}）"
+        return f"# LLM 沙龙在第 {data['round'] + 1} 轮{where}停止：{reason}"
+
+    def _new_row(self, speaker: str) -> _Row:
+        label = f"✨ **{speaker}** ✨"
+        row = _Row(len(self.chat_history), label)
+        self.chat_history.append((label, ""))
+        self._rows[speaker] = row
+        return row
+
+    def _row(self, speaker: str) -> _Row:
+        return self._rows.get(speaker) or self._new_row(speaker)
+
+    def handle(self, event_type: str, data) -> bool:
+        """处理一个事件，返回是否到了应该向界面推送一帧的时候"""
+        if event_type == "speaker_turn":
+            self._current_speaker = str(data)
+            self._new_row(self._current_speaker)
+            self._force = True
+        elif event_type == "new_turn":
+            self.title = self._format_title(data + 1)
+            self._force = True
+        elif event_type == "token_limit":
+            self.title = self._format_token_limit(data)
+            self._force = True
+        elif event_type in ("content_piece", "reasoning_piece"):
+            if self._current_speaker is None:
+                return False
+            self._append(self._current_speaker, event_type, data)
+        elif event_type in ("speaker_content_piece", "speaker_reasoning_piece"):
+            speaker, piece = data
+            self._append(speaker, event_type[len("speaker_") :], piece)
+        elif event_type == "speaker_restart":
+            row = self._rows.get(data)
+            if row is None:
+                return False
+            row.cot = row.content = ""
+            row.pending_cot.clear()
+            row.pending_content.clear()
+            self._dirty[row.index] = row
+            self._force = True
+        else:
+            return False
+        return self._force or time.monotonic() - self._last_flush >= (
+            self._flush_interval
+        )
+
+    def _append(self, speaker: str, piece_type: str, piece: str):
+        row = self._row(speaker)
+        if piece_type == "content_piece":
+            row.pending_content.append(str(piece))
+        else:
+            row.pending_cot.append(str(piece))
+        self._dirty[row.index] = row
+
+    def frame(self) -> Tuple[List[Tuple[str, Optional[str]]], str]:
+        """把缓存的片段刷新到 chat_history，返回 (chat_history, title)"""
+        for row in self._dirty.values():
+            self.chat_history[row.index] = (row.label, row.render())
+        self._dirty.clear()
+        self._force = False
+        self._last_flush = time.monotonic()
+        return self.chat_history, self.title
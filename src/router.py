@@ -0,0 +1,269 @@
+"""多端点路由与对冲请求。
+
+provider 可以在 settings.yaml 中用 endpoints 声明多个等价的端点（不同的 url、key 或模型）。
+Router 为每个端点维护首 token 延迟（从发起请求算起，包含排队和限速等待）与输出速率的指数滑动平均，
+每个请求发给预计最快的健康端点，没有样本的端点先各试一次。端点在重试用尽后失败时暂时视为不健康，
+请求改发给下一个端点。
+
+设置 hedge_after 后，首个 token 超过这么多秒还没有到达时，同一请求再发给排名第二的端点，
+先产出 token 的一方胜出，另一方的请求被取消。
+"""
+
+import asyncio
+import time
+from contextlib import aclosing, suppress
+from dataclasses import dataclass
+from typing import AsyncGenerator, Dict, List, Optional, Sequence, Tuple
+
+from config import ProviderConfig
+from metrics import Counter, register_collector
+from ratelimit import ProviderError
+from streaming import StopStream, stop_stream
+from utils import SSEClient, logger
+
+HEDGES = Counter(
+    "salon_router_hedges_total",
+    "Hedged duplicate requests fired because the first token was late",
+    ["provider"],
+)
+HEDGE_WINS = Counter(
+    "salon_router_hedge_wins_total",
+    "Hedged requests that produced the first token before the original",
+    ["provider"],
+)
+FAILOVERS = Counter(
+    "salon_router_failovers_total",
+    "Requests moved to another endpoint after one failed before any output",
+    ["provider"],
+)
+
+
+@dataclass(slots=True)
+class EndpointEstimate:
+    # 从发起请求到第一个 token 的秒数
+    ttft: Optional[float] = None
+    # 第一个 token 之后每秒输出的 token 数
+    tokens_per_second: Optional[float] = None
+    samples: int = 0
+    # 失败后在此之前不再优先选择这个端点（time.monotonic()）
+    down_until: float = 0.0
+
+
+def _ewma(previous: Optional[float], value: float, alpha: float) -> float:
+    return value if previous is None else previous + alpha * (value - previous)
+
+
+class Router:
+    # 指数滑动平均中新样本的权重
+    ALPHA = 0.3
+    # 用来把输出速率折算成时间的典型回复长度（token）
+    REFERENCE_TOKENS = 256
+    # 端点失败后暂停优先选择的秒数
+    COOLDOWN = 30.0
+
+    def __init__(self):
+        self._estimates: Dict[str, EndpointEstimate] = {}
+
+    def estimate(self, endpoint: ProviderConfig) -> EndpointEstimate:
+        estimate = self._estimates.get(endpoint.name)
+        if estimate is None:
+            estimate = self._estimates[endpoint.name] = EndpointEstimate()
+        return estimate
+
+    def estimates(self) -> Dict[str, EndpointEstimate]:
+        return dict(self._estimates)
+
+    def expected_latency(self, endpoint: ProviderConfig) -> float:
+        """预计完成一次典型回复的秒数，没有样本时为 0，保证每个端点都会被试到"""
+        estimate = self.estimate(endpoint)
+        if estimate.ttft is None:
+            return 0.0
+        latency = estimate.ttft
+        if estimate.tokens_per_second:
+            latency += self.REFERENCE_TOKENS / estimate.tokens_per_second
+        return latency
+
+    def rank(self, pool: Sequence[ProviderConfig]) -> List[ProviderConfig]:
+        """健康的端点按预计延迟排序，延迟相同时保持配置顺序；都不健康时全部参与排序"""
+        now = time.monotonic()
+        healthy = [e for e in pool if self.estimate(e).down_until <= now] or list(pool)
+        return sorted(healthy, key=self.expected_latency)
+
+    def observe_first_token(self, endpoint: ProviderConfig, seconds: float):
+        estimate = self.estimate(endpoint)
+        estimate.ttft = _ewma(estimate.ttft, seconds, self.ALPHA)
+        estimate.samples += 1
+        estimate.down_until = 0.0
+
+    def observe_late(self, endpoint: ProviderConfig, seconds: float):
+        """被取消的请求等了 seconds 秒仍没有输出，真实的首 token 延迟至少这么长"""
+        estimate = self.estimate(endpoint)
+        if estimate.ttft is None or estimate.ttft < seconds:
+            self.observe_first_token(endpoint, seconds)
+
+    def observe_throughput(
+        self, endpoint: ProviderConfig, tokens: Optional[int], seconds: float
+    ):
+        if tokens and seconds > 0:
+            estimate = self.estimate(endpoint)
+            estimate.tokens_per_second = _ewma(
+                estimate.tokens_per_second, tokens / seconds, self.ALPHA
+            )
+
+    def fail(self, endpoint: ProviderConfig):
+        self.estimate(endpoint).down_until = time.monotonic() + self.COOLDOWN
+
+
+router = Router()
+
+
+def _endpoint_payload(endpoint: ProviderConfig, payload: Dict) -> Dict:
+    if endpoint.model_name:
+        return {**payload, "model": endpoint.model_name}
+    return payload
+
+
+async def send_routed(
+    provider: ProviderConfig, payload: Dict
+) -> AsyncGenerator[Dict, None]:
+    """与 SSEClient.send_sse 相同的接口；provider 没有声明 endpoints 时直接调用 send_sse"""
+    if not provider.endpoints:
+        stats = None
+        async with aclosing(
+            SSEClient.send_sse(provider=provider, payload=payload)
+        ) as stream:
+            try:
+                async for chunk in stream:
+                    yield chunk
+            except StopStream:
+                stats = await stop_stream(stream)
+        if stats is not None:
+            yield stats
+        return
+
+    candidates = router.rank(provider.pool)
+    start = time.perf_counter()
+    # 已发出的请求：(端点, 流, 等待第一个 chunk 的任务, 发出时间)
+    racing: List[Tuple[ProviderConfig, AsyncGenerator, asyncio.Future, float]] = []
+    winner = stream = first = None
+    hedged = False
+    failed: Optional[ProviderConfig] = None
+    last_error: Optional[BaseException] = None
+
+    def launch():
+        endpoint = candidates[len(racing)]
+        gen = SSEClient.send_sse(
+            provider=endpoint, payload=_endpoint_payload(endpoint, payload)
+        )
+        racing.append(
+            (endpoint, gen, asyncio.ensure_future(anext(gen)), time.perf_counter())
+        )
+
+    try:
+        launch()
+        while winner is None:
+            pending = [task for _, _, task, _ in racing if not task.done()]
+            if not pending:
+                if len(racing) == len(candidates):
+                    raise last_error
+                FAILOVERS.inc(1, provider.name)
+                logger.warning(
+                    f"{failed.name} failed, trying {candidates[len(racing)].name}"
+                )
+                launch()
+                continue
+            timeout = None
+            if provider.hedge_after is not None and len(racing) == 1 < len(candidates):
+                timeout = max(provider.hedge_after - (time.perf_counter() - start), 0)
+            done, _ = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                hedged = True
+                HEDGES.inc(1, provider.name)
+                logger.info(
+                    f"{racing[0][0].name} sent no token in {provider.hedge_after}s, "
+                    f"hedging to {candidates[1].name}"
+                )
+                launch()
+                continue
+            for endpoint, gen, task, launched in racing:
+                if task not in done or winner is not None:
+                    continue
+                try:
+                    first = task.result()
+                except StopAsyncIteration:
+                    last_error = RuntimeError(f"{endpoint.name} returned no output")
+                    failed = endpoint
+                    continue
+                except ProviderError:
+                    # 请求本身被拒绝，换端点也不会成功，端点仍然是健康的
+                    raise
+                except Exception as e:
+                    # send_sse 已经用尽了重试，换下一个端点
+                    router.fail(endpoint)
+                    last_error, failed = e, endpoint
+                    continue
+                winner, stream, winner_launched = endpoint, gen, launched
+    finally:
+        # 取消输掉的请求；调用方提前结束时也会走到这里
+        now = time.perf_counter()
+        for endpoint, gen, task, launched in racing:
+            if gen is stream:
+                continue
+            if not task.done():
+                task.cancel()
+                router.observe_late(endpoint, now - launched)
+            with suppress(BaseException):
+                await task
+            await gen.aclose()
+
+    first_token = time.perf_counter()
+    router.observe_first_token(winner, first_token - winner_launched)
+    if hedged and winner is not racing[0][0]:
+        HEDGE_WINS.inc(1, provider.name)
+    async with aclosing(stream):
+        chunk = first
+        while chunk is not None:
+            if chunk["type"] == "stats":
+                router.observe_throughput(
+                    winner,
+                    chunk["data"].get("completion_tokens"),
+                    time.perf_counter() - first_token,
+                )
+                chunk["data"]["endpoint"] = winner.name
+            try:
+                yield chunk
+            except StopStream:
+                # 调用方按停止条件结束：让 send_sse 结束请求并交回本次的 stats
+                chunk = await stop_stream(stream)
+                if chunk is None or chunk["type"] != "stats":
+                    return
+                continue
+            chunk = await anext(stream, None)
+
+
+def _router_metrics() -> List[str]:
+    lines = []
+    for field, name, documentation in (
+        (
+            "ttft",
+            "salon_router_ttft_seconds",
+            "Moving average of the time to first token per endpoint",
+        ),
+        (
+            "tokens_per_second",
+            "salon_router_tokens_per_second",
+            "Moving average of the output rate per endpoint",
+        ),
+    ):
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        for endpoint, estimate in router.estimates().items():
+            value = getattr(estimate, field)
+            if value is not None:
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {value}')
+    return lines
+
+
+register_collector(_router_metrics)
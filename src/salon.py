@@ -1,49 +1,219 @@
+import asyncio
 import json
+import sys
+import time
 from collections import OrderedDict
-from typing import Any, AsyncGenerator, Dict, Tuple
+from functools import partial
+from typing import (Any, AsyncGenerator, Collection, Dict, List, Optional,
+                    Tuple, Union)
 
 from chatter import Chatter
-from config import settings
-from utils import logger
+from config import ChatterConfig, SalonConfig, get_config
+from messages import MessageLog
+from metrics import SalonMetrics
+from scheduler import TurnScheduler, create_scheduler
+from streaming import ToolCall
+from tokens import TokenBudget, TokenLimitExceeded
+from transcript import TranscriptStore, new_salon_id
+from utils import SSEClient, logger
+
+
+def _completion_confirmed(calls: List[ToolCall]) -> bool:
+    """主持人的参数流中已经出现 all_steps_done=true，不必等待响应的剩余部分"""
+    return any(
+        call.name == "mark_task_as_completed"
+        and call.arguments.fields.get("all_steps_done") is True
+        for call in calls
+    )
+
+
+def _task_completed(function_calling: List[Dict]) -> bool:
+    for call in function_calling:
+        try:
+            if call["function"]["name"] != "mark_task_as_completed":
+                continue
+            if json.loads(call["function"]["arguments"])["all_steps_done"]:
+                return True
+        except Exception as e:
+            logger.error(call)
+            logger.error(e)
+            return True
+    return False
+
+
+class _PrefetchedTurn:
+    """主持人隐藏时，下一轮第一位发言者在主持人判断是否结束的同时提前发言。
+
+    输出先缓存在队列中，确认讨论继续后再按原来的顺序产出；主持人宣布结束时取消请求并恢复发言者状态。
+    """
+
+    def __init__(
+        self, speaker_name: str, speaker: Chatter, current_round: int, total_rounds: int
+    ):
+        self.speaker_name = speaker_name
+        self.speaker = speaker
+        # 提前发言前的状态，取消时恢复，写检查点时代替发言者的当前状态
+        self.snapshot = speaker.state()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.hoster_done: Optional[float] = None
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._pump(current_round, total_rounds))
+
+    async def _pump(self, current_round: int, total_rounds: int):
+        try:
+            async for piece in self.speaker.speaking(current_round, total_rounds):
+                self._queue.put_nowait(piece)
+        except Exception as e:
+            self._queue.put_nowait(e)
+        else:
+            self._queue.put_nowait(None)
+        finally:
+            self.end = time.perf_counter()
+
+    async def pieces(self) -> AsyncGenerator[Dict, None]:
+        while (piece := await self._queue.get()) is not None:
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+
+    @property
+    def saved(self) -> float:
+        """与主持人重叠、因而不在关键路径上的时间"""
+        return max(0.0, min(self.hoster_done, self.end) - self.start)
+
+    async def cancel(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.speaker.restore(self.snapshot)
 
 
 class Salon:
-    def __init__(self):
+    def __init__(self, config: SalonConfig = None, salon_id: str = None):
+        """config 为空时使用当前 settings.yaml 的配置快照"""
+        self._config = config or get_config()
+        self._salon_id = salon_id or new_salon_id()
+        self._scheduler = create_scheduler(
+            [cfg.name for cfg in self._config.chatters],
+            self._config.hoster.name,
+            self._config.scheduler,
+            {cfg.name: cfg.system_prompt for cfg in self._config.chatters},
+        )
+        # 所有发言只保存一份，每个发言者通过游标读取自己的未读发言
+        self._log = MessageLog()
+        # 所有发言者（含主持人）共用的 token 预算
+        self._budget = TokenBudget(
+            self._config.tokens.salon_budget, self._planned_turns(0)
+        )
         self._chatters: OrderedDict[str, Chatter] = OrderedDict()
-        chatters_cfg = settings.chatters
-        for name, cfg in chatters_cfg.items():
-            system_prompt = self._genereate_system_prompt(name, chatters_cfg)
-
-            self._chatters[name] = Chatter(
-                provider=cfg.provider,
-                model_name=cfg.model_name,
-                system_prompt=system_prompt,
-                **{
-                    k: v
-                    for k, v in cfg.items()
-                    if k not in ["model_name", "system_prompt", "provider"]
-                },
+        for cfg in self._config.chatters:
+            # 分组时系统提示中只介绍同组的参与者
+            system_prompt = self._genereate_system_prompt(
+                cfg, self._config, self._scheduler.audience(cfg.name)
+            )
+            self._chatters[cfg.name] = Chatter(
+                cfg, system_prompt, self._config, self._log, self._budget
             )
 
-        hoster_cfg = settings.hoster
-        system_prompt = self._generate_hoster_system_prompt(hoster_cfg, chatters_cfg)
+        hoster_cfg = self._config.hoster
+        system_prompt = self._generate_hoster_system_prompt(self._config)
         self._hoster = (
             hoster_cfg.name,
-            Chatter(
-                provider=hoster_cfg.provider,
-                model_name=hoster_cfg.model_name,
-                system_prompt=system_prompt,
-                **{
-                    k: v
-                    for k, v in cfg.items()
-                    if k not in ["name", "model_name", "system_prompt", "provider"]
-                },
-            ),
+            Chatter(hoster_cfg, system_prompt, self._config, self._log, self._budget),
         )
+        # 上下文超出预算时由主持人生成滚动摘要
+        for name, chatter in [*self._chatters.items(), self._hoster]:
+            chatter.context.summarizer = partial(self.hoster.summarize, speaker=name)
+        self._store = (
+            TranscriptStore(self._config.transcript.directory)
+            if self._config.transcript.enabled
+            else None
+        )
+        # 从检查点恢复时，从 _start_round 开始继续讨论
+        self._start_round = 0
+        self._resumed = False
+        self._completed = False
+        self._metrics = SalonMetrics()
+        self._prefetch: Optional[_PrefetchedTurn] = None
+
+    @property
+    def config(self) -> SalonConfig:
+        return self._config
+
+    @property
+    def salon_id(self) -> str:
+        return self._salon_id
+
+    @property
+    def metrics(self) -> SalonMetrics:
+        return self._metrics
+
+    @property
+    def token_budget(self) -> TokenBudget:
+        return self._budget
+
+    def _planned_turns(self, start_round: int) -> int:
+        """从 start_round 到结束预计的发言次数，每轮含主持人一次"""
+        per_round = len(self._config.chatters)
+        if self._config.scheduler.speakers_per_round:
+            per_round = min(per_round, self._config.scheduler.speakers_per_round)
+        return (self._config.rounds - start_round) * (per_round + 1)
+
+    @property
+    def scheduler(self) -> TurnScheduler:
+        return self._scheduler
+
+    @property
+    def log(self) -> MessageLog:
+        return self._log
+
+    def memory_report(self) -> Dict[str, int]:
+        """估计发言者历史占用的内存（字节）。
+
+        history_bytes 为所有历史中的消息对象及其引用的字符串，被多个历史共享的只算一次；
+        unshared_bytes 为每个历史各自保存一份完整文本时字符串的大小。
+        """
+        seen = set()
+        messages = history_bytes = unshared_bytes = 0
+        for chatter in (*self._chatters.values(), self.hoster):
+            for message in chatter.messages:
+                messages += 1
+                unshared_bytes += sys.getsizeof(message.content)
+                if id(message) in seen:
+                    continue
+                seen.add(id(message))
+                history_bytes += sys.getsizeof(message)
+                for text in message.strings():
+                    if id(text) not in seen:
+                        seen.add(id(text))
+                        history_bytes += sys.getsizeof(text)
+        return {
+            "messages": messages,
+            "history_bytes": history_bytes,
+            "unshared_bytes": unshared_bytes,
+            "unread_entries": len(self._log),
+        }
+
+    def _format_memory(self) -> str:
+        report = self.memory_report()
+        return (
+            f"{report['messages']} history messages use "
+            f"{report['history_bytes'] / 1024:.1f} KiB "
+            f"({report['unshared_bytes'] / 1024:.1f} KiB if unshared), "
+            f"{report['unread_entries']} unread log entries"
+        )
+
+    @property
+    def start_round(self) -> int:
+        return self._start_round
 
     @property
     def topic(self) -> str:
-        return self._topic
+        return self._config.topic
+
+    @property
+    def rounds(self) -> int:
+        return self._config.rounds
 
     @property
     def chatters(self) -> Dict[str, Chatter]:
@@ -58,87 +228,356 @@ class Salon:
         return self._hoster[0]
 
     @staticmethod
-    def _generate_hoster_system_prompt(hoster_cfg: Dict, chatters_cfg: Dict):
-        prompt_template = settings.template.hoster_prompt
-        system_prompt = prompt_template.prefix.format(
-            role=hoster_cfg.name,
-            role_prompt=hoster_cfg.system_prompt,
-            topic=settings.topic,
+    def _generate_hoster_system_prompt(config: SalonConfig) -> str:
+        return config.template.formatter.hoster_prompt(
+            role=config.hoster.name,
+            role_prompt=config.hoster.system_prompt,
+            topic=config.topic,
+            participants=[(cfg.name, cfg.system_prompt) for cfg in config.chatters],
         )
-        participants = [
-            prompt_template.chatter.format(role=role, role_prompt=cfg.system_prompt)
-            for role, cfg in chatters_cfg.items()
-        ]
-        system_prompt += "".join(participants)
-        system_prompt += prompt_template.suffix.format()
-        return system_prompt
 
     @staticmethod
     def _genereate_system_prompt(
-        name: str,
-        chatters_cfg: Dict,
+        chatter_cfg: ChatterConfig,
+        config: SalonConfig,
+        peers: Optional[Collection[str]] = None,
     ) -> str:
-        prompt_template = settings.template.system_prompt
-        system_prompt = prompt_template.prefix.format(
-            role=name,
-            role_prompt=chatters_cfg[name].system_prompt,
-            topic=settings.topic,
+        return config.template.formatter.system_prompt(
+            role=chatter_cfg.name,
+            role_prompt=chatter_cfg.system_prompt,
+            topic=config.topic,
+            participants=[
+                (cfg.name, cfg.system_prompt)
+                for cfg in config.chatters
+                if cfg.name != chatter_cfg.name and (peers is None or cfg.name in peers)
+            ],
         )
-        participants = [
-            prompt_template.chatter.format(role=role, role_prompt=cfg.system_prompt)
-            for role, cfg in chatters_cfg.items()
-            if role != name
+
+    def checkpoint(self, next_round: int, completed: bool = False) -> Dict:
+        """第 next_round 轮开始前的完整状态，可 JSON 序列化"""
+        chatters = {name: chatter.state() for name, chatter in self.chatters.items()}
+        if self._prefetch:
+            # 已经提前开始下一轮发言的人，记录的是发言前的状态
+            chatters[self._prefetch.speaker_name] = self._prefetch.snapshot
+        return {
+            "salon_id": self._salon_id,
+            "topic": self.topic,
+            "rounds": self.rounds,
+            "next_round": next_round,
+            "completed": completed,
+            "chatters": chatters,
+            "hoster_name": self.hoster_name,
+            "hoster": self.hoster.state(),
+            "scheduler": self._scheduler.state(),
+            "tokens": self._budget.state(),
+        }
+
+    @classmethod
+    def resume(
+        cls, checkpoint: Union[Dict, str], config: SalonConfig = None
+    ) -> "Salon":
+        """从检查点恢复沙龙，chatting() 从中断的那一轮继续，已完成的发言不会重新生成。
+
+        checkpoint 可以是 Salon.checkpoint() 的返回值，也可以是讨论记录中的 salon_id。
+        config 为空时使用当前配置，主题和轮数以检查点为准。
+        """
+        config = config or get_config()
+        if isinstance(checkpoint, str):
+            salon_id = checkpoint
+            checkpoint = TranscriptStore(config.transcript.directory).load_checkpoint(
+                salon_id
+            )
+            if checkpoint is None:
+                raise ValueError(f"no checkpoint found for salon {salon_id}")
+        config = config.override(topic=checkpoint["topic"], rounds=checkpoint["rounds"])
+        names = [cfg.name for cfg in config.chatters]
+        if (
+            names != list(checkpoint["chatters"])
+            or config.hoster.name != checkpoint["hoster_name"]
+        ):
+            raise ValueError(
+                f"checkpoint participants {list(checkpoint['chatters'])} / "
+                f"{checkpoint['hoster_name']} do not match config {names} / "
+                f"{config.hoster.name}"
+            )
+        salon = cls(config, checkpoint["salon_id"])
+        for name, state in checkpoint["chatters"].items():
+            salon.chatters[name].restore(state)
+        salon.hoster.restore(checkpoint["hoster"])
+        salon._scheduler.restore(checkpoint.get("scheduler"))
+        salon._start_round = checkpoint["next_round"]
+        salon._budget.restore(
+            checkpoint.get("tokens"), salon._planned_turns(salon._start_round)
+        )
+        salon._completed = checkpoint["completed"]
+        salon._resumed = True
+        logger.info(f"resumed salon {salon.salon_id} at round {salon.start_round + 1}")
+        return salon
+
+    def _save_checkpoint(self, next_round: int, completed: bool = False):
+        if self._store and self._config.transcript.checkpoint:
+            self._store.save_checkpoint(
+                self._salon_id, self.checkpoint(next_round, completed)
+            )
+
+    def _token_limit_event(
+        self, round_index: int, limit: str, message: str, mid_round: bool
+    ) -> Tuple[str, Dict]:
+        """沙龙因 token 预算或上下文窗口提前停止时产出的事件，界面、记录和批量输出据此区分正常结束"""
+        return (
+            "token_limit",
+            {
+                "round": round_index,
+                "limit": limit,
+                "mid_round": mid_round,
+                "used": self._budget.used,
+                "total": self._budget.total,
+                "message": message,
+            },
+        )
+
+    def _broadcast(self, speaker_name: str, utterance: str):
+        self._log.append(
+            speaker_name, utterance, self._scheduler.audience(speaker_name)
+        )
+        self._scheduler.observe(speaker_name, utterance)
+
+    async def _parallel_speaking(
+        self, current_round: int, speakers: List[str]
+    ) -> AsyncGenerator[Tuple[str, Any], None]:
+        """本轮的发言者基于同一份沙龙缓存同时发言，输出按发言者打标签后交错产出"""
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump(speaker_name: str, speaker: Chatter):
+            start = time.perf_counter()
+            stats = None
+            try:
+                async for piece in speaker.speaking(current_round, self._config.rounds):
+                    if piece["type"] == "stats":
+                        stats = piece["data"]
+                    else:
+                        await queue.put((speaker_name, piece))
+            except Exception as e:
+                await queue.put((speaker_name, e))
+            else:
+                self._metrics.add_turn(
+                    current_round, speaker_name, time.perf_counter() - start, stats
+                )
+                await queue.put((speaker_name, None))
+
+        for speaker_name in speakers:
+            yield ("speaker_turn", speaker_name)
+        tasks = [
+            asyncio.create_task(pump(speaker_name, self.chatters[speaker_name]))
+            for speaker_name in speakers
         ]
+        try:
+            running = len(tasks)
+            while running:
+                speaker_name, piece = await queue.get()
+                if piece is None:
+                    running -= 1
+                elif isinstance(piece, Exception):
+                    raise piece
+                elif piece["type"] == "content":
+                    yield ("speaker_content_piece", (speaker_name, piece["data"]))
+                elif piece["type"] == "reasoning":
+                    yield ("speaker_reasoning_piece", (speaker_name, piece["data"]))
+                elif piece["type"] == "restart":
+                    yield ("speaker_restart", speaker_name)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
-        system_prompt += "".join(participants)
-        system_prompt += prompt_template.suffix.format()
-        return system_prompt
+        # 所有人都发言完毕后再互相同步，保证本轮发言基于同一份快照
+        for speaker_name in speakers:
+            self._broadcast(speaker_name, self.chatters[speaker_name].last_utterance)
 
     async def chatting(self) -> AsyncGenerator[Tuple[str, Any], None]:
-        for i in range(settings.rounds):
+        if self._completed:
+            return
+        transcript = None
+        if self._store:
+            transcript = await self._store.writer(
+                self._salon_id,
+                self._config,
+                self._config.transcript.flush_interval,
+                self._start_round if self._resumed else None,
+            )
+        try:
+            async with SSEClient.pool():
+                current_round = self._start_round
+                try:
+                    async for event in self._chatting():
+                        if event[0] == "new_turn":
+                            current_round = event[1]
+                        if transcript:
+                            transcript.write(*event)
+                        yield event
+                except TokenLimitExceeded as e:
+                    # 预测失准时的兜底：这一轮没有写检查点，调高预算后从这一轮重新开始
+                    logger.warning(f"salon {self._salon_id} stopped mid-round: {e}")
+                    event = self._token_limit_event(
+                        current_round, e.limit, str(e), True
+                    )
+                    if transcript:
+                        transcript.write(*event)
+                    yield event
+                finally:
+                    # 调用方提前停止或出错时，取消仍在进行的提前发言
+                    if self._prefetch:
+                        await self._prefetch.cancel()
+                        self._prefetch = None
+        finally:
+            if transcript:
+                # 等写盘线程落盘后再结束，之后读取记录或续跑都能看到完整的内容；
+                # 检查点在同一个线程中更早提交，此时也已写完
+                await asyncio.wrap_future(transcript.close())
+            if self._metrics.turns:
+                logger.info(
+                    f"salon {self._salon_id} metrics:\n{self._metrics.format_table()}"
+                )
+                logger.opt(lazy=True).info(
+                    "salon {} memory: {}", lambda: self._salon_id, self._format_memory
+                )
+            if self._budget.total is not None:
+                logger.info(
+                    f"salon {self._salon_id} used {self._budget.used}/"
+                    f"{self._budget.total} tokens"
+                )
+
+    async def _sequential_turn(
+        self,
+        current_round: int,
+        speaker_name: str,
+        pieces: AsyncGenerator[Dict, None],
+        turn_start: float,
+    ) -> AsyncGenerator[Tuple[str, Any], None]:
+        stats = None
+        async for piece in pieces:
+            if piece["type"] == "content":
+                yield ("content_piece", piece["data"])
+            elif piece["type"] == "reasoning":
+                yield ("reasoning_piece", piece["data"])
+            elif piece["type"] == "restart":
+                # 流断开后重新生成，界面与记录丢弃这位发言者已输出的部分
+                yield ("speaker_restart", speaker_name)
+            elif piece["type"] == "stats":
+                stats = piece["data"]
+        self._metrics.add_turn(
+            current_round, speaker_name, time.perf_counter() - turn_start, stats
+        )
+        # 广播发言者历史中的同一个字符串，听众的历史不再各自保存一份
+        self._broadcast(speaker_name, self.chatters[speaker_name].last_utterance)
+
+    async def _chatting(self) -> AsyncGenerator[Tuple[str, Any], None]:
+        show_hoster = self._config.show_hoster
+        # 主持人不显示时，它的轮末判断与下一轮第一位发言者重叠进行
+        pipeline = (
+            self._config.pipeline_hoster
+            and not show_hoster
+            and self._config.speaking_mode == "sequential"
+            and self._scheduler.predictable
+        )
+        # 前两轮用掉的 token；历史越来越长，下一轮按前两轮之间的增长外推，剩余预算不够时在轮次之间停止
+        round_tokens = previous_tokens = 0
+        for i in range(self._start_round, self._config.rounds):
+            growth = round_tokens - previous_tokens if previous_tokens else 0
+            expected = round_tokens + max(growth, 0)
+            if not self._budget.affords(expected):
+                # 检查点停在这一轮之前，调高预算后可以继续
+                message = (
+                    f"salon {self._salon_id} has {self._budget.remaining} of its "
+                    f"{self._budget.total}-token budget left, the next round is "
+                    f"expected to use {expected}; stopping before round {i + 1}"
+                )
+                logger.warning(message)
+                yield self._token_limit_event(i, "budget", message, False)
+                break
+            used_before = self._budget.used
+            round_start = time.perf_counter()
             yield ("new_turn", i)
-            for speaker_name, speaker in self.chatters.items():
-                yield ("speaker_turn", speaker_name)
-                current_utterance = ""
-                async for piece in speaker.speaking(i, settings.rounds):
-                    if piece["type"] == "content":
-                        yield ("content_piece", piece["data"])
-                        current_utterance += piece["data"]
-                    elif piece["type"] == "reasoning":
-                        yield ("reasoning_piece", piece["data"])
-                for k, v_chatter in self._chatters.items():
-                    if k == speaker_name:
-                        continue
-                    v_chatter.add_salon_cache(speaker_name, current_utterance)
-                self.hoster.add_salon_cache(speaker_name, current_utterance)
-            hoster_utterance = ""
+            speakers = self._scheduler.plan()
+            if self._config.speaking_mode == "parallel":
+                async for event in self._parallel_speaking(i, speakers):
+                    yield event
+            else:
+                for speaker_name in speakers:
+                    speaker = self.chatters[speaker_name]
+                    yield ("speaker_turn", speaker_name)
+                    prefetch = self._prefetch
+                    if prefetch and prefetch.speaker_name == speaker_name:
+                        pieces, turn_start = prefetch.pieces(), prefetch.start
+                    else:
+                        pieces = speaker.speaking(i, self._config.rounds)
+                        turn_start = time.perf_counter()
+                    async for event in self._sequential_turn(
+                        i, speaker_name, pieces, turn_start
+                    ):
+                        yield event
+                    if prefetch:
+                        self._metrics.add_prefetch(prefetch.saved)
+                        self._prefetch = None
+            upcoming = self._scheduler.upcoming() if pipeline else None
+            if upcoming and i + 1 < self._config.rounds:
+                self._prefetch = _PrefetchedTurn(
+                    upcoming, self.chatters[upcoming], i + 1, self._config.rounds
+                )
             task_completed = False
-            if settings.show_hoster:
+            if show_hoster:
                 yield ("speaker_turn", self.hoster_name)
-            async for piece in self.hoster.speaking(i, settings.rounds, True):
+            turn_start = time.perf_counter()
+            stats = None
+            async for piece in self.hoster.speaking(
+                i,
+                self._config.rounds,
+                True,
+                stop_when=_completion_confirmed,
+                extra_tools=self._scheduler.tools,
+            ):
                 if piece["type"] == "content":
-                    if settings.show_hoster:
+                    if show_hoster:
                         yield ("content_piece", piece["data"])
-                    hoster_utterance += piece["data"]
                 elif piece["type"] == "reasoning":
-                    if settings.show_hoster:
+                    if show_hoster:
                         yield ("reasoning_piece", piece["data"])
+                elif piece["type"] == "restart":
+                    if show_hoster:
+                        yield ("speaker_restart", self.hoster_name)
+                elif piece["type"] == "stats":
+                    stats = piece["data"]
+            now = time.perf_counter()
+            self._metrics.add_turn(
+                i, self.hoster_name, now - turn_start, stats, role="hoster"
+            )
+            self._metrics.add_round(now - round_start)
+            previous_tokens, round_tokens = (
+                round_tokens,
+                self._budget.used - used_before,
+            )
+            if self._prefetch:
+                self._prefetch.hoster_done = now
             if self.hoster._function_calling:
-                try:
-                    if (
-                        self.hoster._function_calling["function"]["name"]
-                        == "mark_task_as_completed"
-                    ):
-                        arguments = json.loads(
-                            self.hoster._function_calling["function"]["arguments"]
-                        )
-                        task_completed = arguments["all_steps_done"]
-                except Exception as e:
-                    logger.error(self.hoster._function_calling)
-                    logger.error(e)
-                    task_completed = True
+                yield ("tool_call", self.hoster._function_calling)
+                task_completed = _task_completed(self.hoster._function_calling)
             if task_completed:
+                if self._prefetch:
+                    await self._prefetch.cancel()
+                    self._prefetch = None
+                    self._metrics.add_prefetch(None)
+                # 调用方收到 task_finish 后通常直接停止迭代，所以先写检查点
+                self._completed = True
+                self._save_checkpoint(i + 1, completed=True)
                 yield ("task_finish", None)
                 break
-            for k, v_chatter in self._chatters.items():
-                v_chatter.add_salon_cache(self.hoster_name, hoster_utterance)
+            hoster_utterance = self.hoster.last_utterance
+            self._log.append(self.hoster_name, hoster_utterance)
+            self._scheduler.observe(self.hoster_name, hoster_utterance)
+            self._scheduler.end_round(self.hoster._function_calling)
+            if self._prefetch:
+                # 提前发言的人在下一次发言时才会看到这段主持人发言
+                self._prefetch.snapshot["salon_cache"].append(
+                    (self.hoster_name, hoster_utterance)
+                )
+            self._save_checkpoint(i + 1, completed=i + 1 == self._config.rounds)
@@ -0,0 +1,240 @@
+"""发言调度：决定每一轮由谁发言，以及谁能听到这些发言。
+
+默认的 round_robin 让所有发言者按配置顺序依次发言，每条发言广播给所有人，一轮的 prompt 长度随人数
+平方增长。参与者很多时可以限制每轮发言的人数（speakers_per_round），由主持人点名（hoster_selected）
+或按与最近讨论的相关度挑选（relevance），也可以把发言者分成只听到同组发言的小组（groups）。
+"""
+
+import json
+import math
+from typing import Collection, Dict, List, Optional, Sequence
+
+from config import SchedulerConfig
+from utils import logger
+
+SELECT_TOOL_NAME = "select_next_speakers"
+
+
+class TurnScheduler:
+    """按配置顺序轮流发言；每轮只发言 speakers_per_round 人时，下一轮从没轮到的人继续"""
+
+    # 主持人发言前就能确定下一轮的发言者时，才能与主持人流水线重叠
+    predictable = True
+
+    def __init__(self, names: Sequence[str], hoster: str, config: SchedulerConfig):
+        self._names = tuple(names)
+        self._hoster = hoster
+        self._per_round = min(config.speakers_per_round or len(names), len(names))
+        # 下一轮从 _names[_position] 开始轮
+        self._position = 0
+
+    def plan(self) -> List[str]:
+        """本轮的发言者，按发言顺序排列；在 end_round 之前多次调用结果相同"""
+        return self._rotation(self._position)
+
+    def upcoming(self) -> Optional[str]:
+        """下一轮的第一位发言者，不可预测时为 None"""
+        if not self._names:
+            return None
+        return self._names[(self._position + self._per_round) % len(self._names)]
+
+    def audience(self, speaker: str) -> Optional[Collection[str]]:
+        """能听到 speaker 发言的人，None 表示所有人"""
+        return None
+
+    def observe(self, speaker: str, utterance: str):
+        """每次发言（包括主持人）结束后调用"""
+
+    @property
+    def tools(self) -> List[Dict]:
+        """主持人额外可用的工具"""
+        return []
+
+    def end_round(self, function_calling: List[Dict]):
+        """主持人发言结束后调用，function_calling 为主持人本轮的工具调用"""
+        self._advance()
+
+    def _advance(self):
+        if self._names:
+            self._position = (self._position + self._per_round) % len(self._names)
+
+    def _rotation(self, start: int) -> List[str]:
+        count = len(self._names)
+        return [self._names[(start + i) % count] for i in range(self._per_round)]
+
+    def state(self) -> Dict:
+        return {"position": self._position}
+
+    def restore(self, state: Optional[Dict]):
+        """旧检查点没有调度状态，从头开始轮"""
+        self._position = (state or {}).get("position", 0)
+
+
+class HosterSelectedScheduler(TurnScheduler):
+    """主持人每轮结束时调用 select_next_speakers 点名下一轮的发言者，没有点名时按顺序轮流"""
+
+    predictable = False
+
+    def __init__(self, names: Sequence[str], hoster: str, config: SchedulerConfig):
+        super().__init__(names, hoster, config)
+        self._selected: List[str] = []
+        self._tools = [
+            {
+                "type": "function",
+                "function": {
+                    "name": SELECT_TOOL_NAME,
+                    "description": "Choose who speaks in the next round, in speaking order.",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "speakers": {
+                                "type": "array",
+                                "items": {"type": "string", "enum": list(self._names)},
+                                "maxItems": self._per_round,
+                                "description": "Names of the next speakers.",
+                            },
+                        },
+                        "required": ["speakers"],
+                    },
+                },
+            }
+        ]
+
+    @property
+    def tools(self) -> List[Dict]:
+        return self._tools
+
+    def plan(self) -> List[str]:
+        return self._selected or super().plan()
+
+    def end_round(self, function_calling: List[Dict]):
+        if not self._selected:
+            self._advance()
+        self._selected = self._parse_selection(function_calling)
+
+    def _parse_selection(self, function_calling: List[Dict]) -> List[str]:
+        for call in function_calling:
+            if call["function"]["name"] != SELECT_TOOL_NAME:
+                continue
+            try:
+                speakers = json.loads(call["function"]["arguments"])["speakers"]
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"ignored malformed speaker selection {call}: {e}")
+                return []
+            # 忽略不存在的名字和重复的名字
+            selected = list(dict.fromkeys(s for s in speakers if s in self._names))
+            return selected[: self._per_round]
+        return []
+
+    def state(self) -> Dict:
+        return {"position": self._position, "selected": self._selected}
+
+    def restore(self, state: Optional[Dict]):
+        super().restore(state)
+        self._selected = list((state or {}).get("selected", []))
+
+
+def _bigrams(text: str) -> frozenset:
+    """字符二元组，中英文都适用，不需要分词"""
+    text = "".join(text.lower().split())
+    return frozenset(text[i : i + 2] for i in range(len(text) - 1))
+
+
+class RelevanceScheduler(TurnScheduler):
+    """下一轮由角色设定与本轮讨论最相关的 speakers_per_round 人发言。
+
+    相关度是角色设定与本轮所有发言（包括主持人）的字符二元组余弦相似度；被点到名字的人优先。
+    每多等一轮加 FAIRNESS 分，长期不相关的人也会轮到。
+    """
+
+    predictable = False
+    FAIRNESS = 0.1
+
+    def __init__(
+        self,
+        names: Sequence[str],
+        hoster: str,
+        config: SchedulerConfig,
+        profiles: Dict[str, str],
+    ):
+        super().__init__(names, hoster, config)
+        self._profiles = {name: _bigrams(profiles.get(name, "")) for name in names}
+        self._round_text: List[str] = []
+        self._selected: List[str] = []
+        # 距离上次发言的轮数
+        self._idle = {name: 0 for name in names}
+
+    def plan(self) -> List[str]:
+        return self._selected or super().plan()
+
+    def observe(self, speaker: str, utterance: str):
+        self._round_text.append(utterance)
+
+    def _score(self, name: str, text: str, grams: frozenset) -> float:
+        profile = self._profiles[name]
+        score = self.FAIRNESS * self._idle[name]
+        if name in text:
+            score += 1
+        if profile and grams:
+            score += len(profile & grams) / math.sqrt(len(profile) * len(grams))
+        return score
+
+    def end_round(self, function_calling: List[Dict]):
+        spoken = set(self.plan())
+        if not self._selected:
+            self._advance()
+        for name in self._names:
+            self._idle[name] = 0 if name in spoken else self._idle[name] + 1
+        text = "".join(self._round_text)
+        self._round_text.clear()
+        grams = _bigrams(text)
+        ranked = sorted(
+            self._names, key=lambda name: self._score(name, text, grams), reverse=True
+        )
+        # 保持配置中的先后顺序发言
+        chosen = set(ranked[: self._per_round])
+        self._selected = [name for name in self._names if name in chosen]
+
+    def state(self) -> Dict:
+        return {
+            "position": self._position,
+            "selected": self._selected,
+            "idle": self._idle,
+        }
+
+    def restore(self, state: Optional[Dict]):
+        super().restore(state)
+        state = state or {}
+        self._selected = list(state.get("selected", []))
+        self._idle.update(state.get("idle", {}))
+
+
+class GroupScheduler(TurnScheduler):
+    """每轮所有人按组依次发言，组员只听到同组成员的发言，主持人听到所有人并向所有人发言"""
+
+    def __init__(self, names: Sequence[str], hoster: str, config: SchedulerConfig):
+        groups = list(config.groups.values())
+        super().__init__([name for group in groups for name in group], hoster, config)
+        self._per_round = len(self._names)
+        self._audience = {
+            name: frozenset((*group, hoster)) for group in groups for name in group
+        }
+
+    def audience(self, speaker: str) -> Optional[Collection[str]]:
+        return self._audience.get(speaker)
+
+
+def create_scheduler(
+    names: Sequence[str],
+    hoster: str,
+    config: SchedulerConfig,
+    profiles: Dict[str, str],
+) -> TurnScheduler:
+    """profiles 为发言者的角色设定，relevance 用来计算相关度"""
+    if config.policy == "hoster_selected":
+        return HosterSelectedScheduler(names, hoster, config)
+    if config.policy == "relevance":
+        return RelevanceScheduler(names, hoster, config, profiles)
+    if config.policy == "groups":
+        return GroupScheduler(names, hoster, config)
+    return TurnScheduler(names, hoster, config)
@@ -0,0 +1,98 @@
+"""单个用户会话拥有的沙龙。
+
+沙龙在会话自己的任务中运行，事件发布到 EventBus，会话的界面和其他会话的旁观者都从中订阅，
+旁观不会再发起一次沙龙。停止时直接取消这个任务，正在进行的 SSE 请求随之中断，不必等到下一个事件；
+不同会话之间互不影响。
+"""
+
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from broadcast import EventBus
+from salon import Salon
+
+# salon_id -> 正在运行这个沙龙的会话
+_live: Dict[str, "SalonSession"] = {}
+
+
+def live_salon_ids() -> List[str]:
+    """正在运行、可以旁观的沙龙"""
+    return list(_live)
+
+
+def find_live(salon_id: str) -> Optional["SalonSession"]:
+    return _live.get(salon_id)
+
+
+class SalonSession:
+    def __init__(self):
+        self._salon: Optional[Salon] = None
+        self._task: Optional[asyncio.Task] = None
+        self._bus: Optional[EventBus] = None
+        self._cancelled = False
+
+    @property
+    def salon(self) -> Optional[Salon]:
+        """正在运行的沙龙"""
+        return self._salon
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def cancelled(self) -> bool:
+        """最近一次运行是否被 cancel() 停止"""
+        return self._cancelled
+
+    async def run(self, salon: Salon) -> AsyncGenerator[Tuple[str, Any], None]:
+        """运行 salon 并产出它的事件；同一会话同时只运行一个沙龙，开始新沙龙时会停止旧的"""
+        await self.cancel()
+        self._cancelled = False
+        bus = EventBus()
+
+        async def pump():
+            try:
+                async for event_type, data in salon.chatting():
+                    bus.publish(event_type, data)
+            except Exception as e:
+                bus.close(e)
+            finally:
+                bus.close()
+                if _live.get(salon.salon_id) is self:
+                    del _live[salon.salon_id]
+                # 结束的沙龙已经完整写入讨论记录，会话不再持有它，长时间打开的页面也不会占着内存
+                if self._salon is salon:
+                    self._salon = self._bus = None
+
+        task = asyncio.create_task(pump())
+        self._salon, self._task, self._bus = salon, task, bus
+        _live[salon.salon_id] = self
+        try:
+            async with aclosing(bus.subscribe()) as events:
+                async for event in events:
+                    yield event
+        finally:
+            # 调用方提前停止迭代（例如界面取消了这次事件）时，一并停止沙龙
+            if self._task is task:
+                await self.cancel()
+
+    def watch(self) -> AsyncGenerator[Tuple[str, Any], None]:
+        """旁观这个会话最近一次运行的沙龙：先产出已有的内容，再跟随直播，停止迭代不影响沙龙"""
+        if self._bus is None:
+            raise RuntimeError("session has not run a salon")
+        return self._bus.subscribe()
+
+    async def cancel(self):
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            self._cancelled = True
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def close(self):
+        """会话结束（例如关闭浏览器标签页）时调用，不等待任务结束"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
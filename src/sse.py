@@ -0,0 +1,120 @@
+import json
+from typing import AsyncIterator, List, Optional
+
+try:
+    # orjson 直接解析 bytes，比 json.loads 快数倍；未安装时退回标准库
+    import orjson
+
+    loads = orjson.loads
+except ImportError:  # pragma: no cover
+
+    def loads(data: bytes):
+        # json.loads 直接处理 bytes 时需要先探测编码，手动 decode 更快
+        return json.loads(data.decode("utf-8"))
+
+
+DONE = b"[DONE]"
+
+
+class SSEEvent:
+    __slots__ = ("event", "data", "id")
+
+    def __init__(self, event: str, data: bytes, id: Optional[str]):
+        self.event = event
+        self.data = data
+        self.id = id
+
+    def json(self):
+        return loads(self.data)
+
+    def __repr__(self) -> str:
+        return f"SSEEvent(event={self.event!r}, data={self.data!r}, id={self.id!r})"
+
+
+class SSEParser:
+    """增量式 SSE 解析器，直接处理原始字节流。
+
+    按照 https://html.spec.whatwg.org/multipage/server-sent-events.html 的规则，
+    支持 CRLF/LF/CR 换行、多行 ``data:``、``event:``、``id:`` 字段和注释行。
+    """
+
+    __slots__ = ("_buffer", "_data", "_event", "_last_id", "_started")
+
+    def __init__(self):
+        self._buffer = b""
+        self._data: List[bytes] = []
+        self._event = ""
+        self._last_id: Optional[str] = None
+        self._started = False
+
+    @property
+    def last_event_id(self) -> Optional[str]:
+        return self._last_id
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        buf = self._buffer + chunk if self._buffer else chunk
+        if not self._started and buf:
+            self._started = True
+            if buf.startswith(b"\xef\xbb\xbf"):
+                buf = buf[3:]
+        if b"\r" in buf:
+            # 结尾的 CR 可能与下一块开头的 LF 组成 CRLF，先留在缓冲区
+            tail = b""
+            if buf.endswith(b"\r"):
+                buf, tail = buf[:-1], b"\r"
+            buf = buf.replace(b"\r\n", b"\n").replace(b"\r", b"\n") + tail
+        lines = buf.split(b"\n")
+        self._buffer = lines.pop()
+        return self._process(lines)
+
+    def close(self) -> List[SSEEvent]:
+        """流结束时调用；按规范，未以空行结束的事件会被丢弃"""
+        events = self.feed(b"\n") if self._buffer.endswith(b"\r") else []
+        self._buffer = b""
+        self._data = []
+        self._event = ""
+        return events
+
+    def _process(self, lines: List[bytes]) -> List[SSEEvent]:
+        events = []
+        data = self._data
+        for line in lines:
+            if not line:
+                if data:
+                    events.append(
+                        SSEEvent(
+                            self._event or "message",
+                            data[0] if len(data) == 1 else b"\n".join(data),
+                            self._last_id,
+                        )
+                    )
+                    data = self._data = []
+                self._event = ""
+                continue
+            if line[:6] == b"data: ":
+                # 快速路径：绝大多数行都是单行 data
+                data.append(line[6:])
+                continue
+            if line[0] == 0x3A:  # ":" 开头为注释
+                continue
+            field, sep, value = line.partition(b":")
+            if sep and value[:1] == b" ":
+                value = value[1:]
+            if field == b"data":
+                data.append(value)
+            elif field == b"event":
+                self._event = value.decode("utf-8")
+            elif field == b"id":
+                if b"\x00" not in value:
+                    self._last_id = value.decode("utf-8")
+        return events
+
+
+async def iter_sse(stream, parser: SSEParser = None) -> AsyncIterator[SSEEvent]:
+    """从 aiohttp 的 StreamReader 中逐个读出 SSE 事件"""
+    parser = parser or SSEParser()
+    async for chunk in stream.iter_any():
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.close():
+        yield event
@@ -0,0 +1,196 @@
+"""流式输出的增量处理：工具调用参数的增量解析与客户端停止条件。
+
+provider 把工具调用拆成多个 delta 下发，每个 delta 用 index 区分并行的多个调用，函数名和参数 JSON
+都可能被切成任意长度的片段。ToolCallAccumulator 按 index 累积片段，参数到达时即扫描，顶层字段一旦完整
+就可以读取，调用方不必等整个响应结束就能做出判断。
+
+StopMatcher 在客户端检查正文，命中停止字符串或超过字数上限时截断。调用方确认不再需要后续输出时，
+向流 athrow(StopStream())，send_cached 会保存已消费的部分并结束请求；StopStream 沿 send_cached、
+send_routed 一直传到 SSEClient.send_sse，后者结束请求并产出本次的 stats chunk，作为 athrow 的返回值逐层交回。
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Dict, List, Optional, Sequence
+
+
+class StopStream(Exception):
+    """调用方按停止条件主动结束流，与出错或被取消区分开"""
+
+
+async def stop_stream(stream: AsyncGenerator[Dict, None]) -> Optional[Dict]:
+    """向流 athrow(StopStream())，返回流结束前产出的最后一个 chunk（通常是 stats），没有时返回 None"""
+    try:
+        return await stream.athrow(StopStream())
+    except StopAsyncIteration:
+        return None
+
+
+class ArgumentParser:
+    """增量扫描函数参数 JSON，每个字符只处理一次；顶层的 "key": value 结束时立即解析"""
+
+    def __init__(self):
+        self._fragments: List[str] = []
+        # 当前顶层字段已到达的字符
+        self._item: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._fragments)
+
+    def feed(self, fragment: str) -> bool:
+        """返回是否有新的顶层字段解析完成"""
+        self._fragments.append(fragment)
+        updated = False
+        for char in fragment:
+            if self.complete:
+                break
+            if self._in_string:
+                self._item.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    continue
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    updated |= self._finish_item()
+                    self.complete = True
+                    continue
+            elif char == "," and self._depth == 1:
+                updated |= self._finish_item()
+                continue
+            elif char == '"':
+                self._in_string = True
+            if self._depth:
+                self._item.append(char)
+        return updated
+
+    def _finish_item(self) -> bool:
+        item = "".join(self._item).strip()
+        self._item.clear()
+        if not item:
+            return False
+        try:
+            self.fields.update(json.loads("{" + item + "}"))
+        except json.JSONDecodeError:
+            # 格式错误留给调用方在完整解析 text 时处理
+            return False
+        return True
+
+    def value(self) -> Any:
+        """完整解析所有参数，格式错误时抛出 json.JSONDecodeError"""
+        return json.loads(self.text)
+
+
+@dataclass(slots=True)
+class ToolCall:
+    index: int
+    id: str = ""
+    type: str = "function"
+    name: str = ""
+    arguments: ArgumentParser = field(default_factory=ArgumentParser)
+
+    def as_dict(self) -> Dict:
+        """OpenAI 格式的完整工具调用，可 JSON 序列化"""
+        return {
+            "index": self.index,
+            "id": self.id,
+            "type": self.type,
+            "function": {"name": self.name, "arguments": self.arguments.text},
+        }
+
+
+class ToolCallAccumulator:
+    def __init__(self):
+        self._calls: Dict[int, ToolCall] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._calls)
+
+    @property
+    def calls(self) -> List[ToolCall]:
+        return [self._calls[index] for index in sorted(self._calls)]
+
+    def feed(self, deltas: List[Dict]) -> List[ToolCall]:
+        """累积一个 chunk 中的 tool_calls delta，返回有新参数字段完成的调用"""
+        updated = []
+        for delta in deltas:
+            index = delta.get("index", 0)
+            call = self._calls.get(index)
+            if call is None:
+                call = self._calls[index] = ToolCall(index)
+            if delta.get("id"):
+                call.id = delta["id"]
+            if delta.get("type"):
+                call.type = delta["type"]
+            function = delta.get("function") or {}
+            if function.get("name"):
+                call.name += function["name"]
+            if function.get("arguments") and call.arguments.feed(function["arguments"]):
+                updated.append(call)
+        return updated
+
+    def as_dicts(self) -> List[Dict]:
+        return [call.as_dict() for call in self.calls]
+
+
+class StopMatcher:
+    """正文出现任一停止字符串或累计超过 max_chars 时截断。
+
+    停止字符串可能跨片段出现，所以末尾最多保留 (最长停止字符串长度 - 1) 个字符暂不输出，
+    停止字符串本身不会被输出。
+    """
+
+    def __init__(self, stop: Sequence[str] = (), max_chars: Optional[int] = None):
+        self._stop = tuple(s for s in stop if s)
+        self._holdback = max((len(s) for s in self._stop), default=1) - 1
+        self._max_chars = max_chars
+        self._pending = ""
+        self._emitted = 0
+        self.stopped = False
+
+    def feed(self, text: str) -> str:
+        """返回可以输出的部分；触发停止后 stopped 为 True，之后的输入都被丢弃"""
+        if self.stopped:
+            return ""
+        buffer = self._pending + text
+        cut = -1
+        for stop in self._stop:
+            position = buffer.find(stop)
+            if position != -1 and (cut == -1 or position < cut):
+                cut = position
+        if cut != -1:
+            self.stopped = True
+            self._pending = ""
+            return self._limit(buffer[:cut])
+        keep = min(self._holdback, len(buffer))
+        self._pending = buffer[len(buffer) - keep :]
+        return self._limit(buffer[: len(buffer) - keep])
+
+    def flush(self) -> str:
+        """流正常结束时输出暂存的末尾"""
+        if self.stopped:
+            return ""
+        pending, self._pending = self._pending, ""
+        return self._limit(pending)
+
+    def _limit(self, text: str) -> str:
+        if self._max_chars is not None and self._emitted + len(text) >= self._max_chars:
+            text = text[: self._max_chars - self._emitted]
+            self.stopped = True
+            self._pending = ""
+        self._emitted += len(text)
+        return text
@@ -0,0 +1,247 @@
+"""本地 token 计数、max_tokens 的自动设定与沙龙的 token 预算。
+
+发送请求之前用本地分词器计算 prompt 的 token 数，不必等 provider 在流的末尾返回 usage。
+每个 model_name 可以在 settings.yaml 的 tokens.tokenizers 中指定分词器：
+
+* approx：按字符类别估算，不依赖任何包，是默认值，也是其他分词器不可用时的回退；
+* tiktoken:<编码名或模型名>：需要安装 tiktoken；
+* hf:<tokenizer.json 的路径或 Hugging Face 上的名称>：需要安装 tokenizers。
+
+预测值与 usage 中的实际值按模型记录比例的指数滑动平均，之后的预测乘以这个比例修正，
+即使用的是估算分词器，max_tokens 的计算也会逐渐贴近实际。
+"""
+
+import json
+import math
+import os.path as osp
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Union
+
+from messages import Message
+from metrics import Counter, register_collector
+from utils import logger
+
+PREDICTED_TOKENS = Counter(
+    "salon_prompt_tokens_predicted_total",
+    "Prompt tokens predicted locally before sending",
+    ("model",),
+)
+OVERFLOWS = Counter(
+    "salon_context_overflows_predicted_total",
+    "Requests whose prompt left less than min_completion tokens of the context window",
+    ("model",),
+)
+
+
+class TokenLimitExceeded(Exception):
+    """上下文窗口或沙龙的剩余预算放不下 prompt 加上最少 min_completion 个输出 token，请求没有发出；
+    limit 为 budget 或 context_window，表示是哪一项放不下"""
+
+    def __init__(self, message: str, limit: str):
+        super().__init__(message)
+        self.limit = limit
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩等非 ASCII 字符约 0.6 token/字，ASCII 约 0.3 token/字符"""
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil((len(text) - ascii_chars) * 0.6 + ascii_chars * 0.3)
+
+
+class Tokenizer:
+    """按字符类别估算 token 数；子类用真实的分词器覆盖 count"""
+
+    name = "approx"
+    # 每条消息的 role/分隔符等固定开销
+    message_overhead = 4
+
+    def count(self, text: str) -> int:
+        return estimate_tokens(text)
+
+
+class TiktokenTokenizer(Tokenizer):
+    def __init__(self, encoding: str):
+        import tiktoken
+
+        try:
+            self._encoding = tiktoken.get_encoding(encoding)
+        except ValueError:
+            self._encoding = tiktoken.encoding_for_model(encoding)
+        self.name = f"tiktoken:{encoding}"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class HuggingFaceTokenizer(Tokenizer):
+    def __init__(self, source: str):
+        from tokenizers import Tokenizer as _Tokenizer
+
+        if osp.isfile(source):
+            self._tokenizer = _Tokenizer.from_file(source)
+        else:
+            self._tokenizer = _Tokenizer.from_pretrained(source)
+        self.name = f"hf:{source}"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+TOKENIZER_KINDS = {"tiktoken": TiktokenTokenizer, "hf": HuggingFaceTokenizer}
+
+APPROXIMATE = Tokenizer()
+_tokenizers: Dict[str, Tokenizer] = {"approx": APPROXIMATE}
+
+
+def get_tokenizer(spec: Optional[str]) -> Tokenizer:
+    """按 "approx"、"tiktoken:<编码>"、"hf:<名称>" 返回分词器，同一 spec 只加载一次；
+    依赖的包没有安装或加载失败时回退到估算并给出一次警告"""
+    spec = spec or "approx"
+    tokenizer = _tokenizers.get(spec)
+    if tokenizer is None:
+        kind, _, source = spec.partition(":")
+        if kind not in TOKENIZER_KINDS or not source:
+            raise ValueError(
+                f"unknown tokenizer: {spec}, expected approx, tiktoken:<encoding> "
+                f"or hf:<name or path>"
+            )
+        try:
+            tokenizer = TOKENIZER_KINDS[kind](source)
+        except Exception as e:
+            logger.warning(
+                f"tokenizer {spec} unavailable ({str(e) or type(e).__name__}), "
+                f"falling back to approximate counts"
+            )
+            tokenizer = APPROXIMATE
+        _tokenizers[spec] = tokenizer
+    return tokenizer
+
+
+def count_message_tokens(
+    messages: Sequence[Union[Message, Mapping[str, str]]],
+    tokenizer: Tokenizer = APPROXIMATE,
+) -> int:
+    """Message 的计数缓存在消息上，同一段历史在之后的轮次中不再重复分词"""
+    total = 0
+    for message in messages:
+        if isinstance(message, Message):
+            total += message.tokens(tokenizer)
+        else:
+            total += (
+                tokenizer.count(message.get("content") or "")
+                + tokenizer.message_overhead
+            )
+    return total
+
+
+def count_tools_tokens(tools: Optional[Sequence[Dict]], tokenizer: Tokenizer) -> int:
+    """工具定义也计入 prompt，按其 JSON 文本估算"""
+    if not tools:
+        return 0
+    return tokenizer.count(json.dumps(tools, ensure_ascii=False))
+
+
+class Calibration:
+    """每个模型 usage 中实际的 prompt token 数与本地预测之比的指数滑动平均"""
+
+    ALPHA = 0.3
+
+    def __init__(self):
+        self._ratios: Dict[str, float] = {}
+
+    def ratio(self, model: str) -> float:
+        return self._ratios.get(model, 1.0)
+
+    def ratios(self) -> Dict[str, float]:
+        return dict(self._ratios)
+
+    def observe(self, model: str, counted: int, actual: Optional[int]):
+        """counted 为本地分词器未经修正的计数"""
+        if not counted or not actual:
+            return
+        ratio = actual / counted
+        previous = self._ratios.get(model)
+        self._ratios[model] = (
+            ratio if previous is None else previous + self.ALPHA * (ratio - previous)
+        )
+
+    def correct(self, model: str, counted: int) -> int:
+        return math.ceil(counted * self.ratio(model))
+
+
+calibration = Calibration()
+
+
+class TokenBudget:
+    """一个沙龙可以使用的 token 总数（prompt + 输出）。
+
+    剩余的预算在剩余的发言之间平分，每次发言的 max_tokens 不超过它的份额减去 prompt，
+    一个停不下来的发言者不会用掉其他人的份额。请求进行期间预留 prompt 与 max_tokens，
+    同时进行的请求（并行发言、提前发言、摘要）合起来也不会超出剩余的预算。total 为 None 时不限制。
+    """
+
+    def __init__(self, total: Optional[int], turns: int):
+        """turns 为预计的发言次数（含主持人）"""
+        self.total = total
+        self.used = 0
+        self.reserved = 0
+        self._turns_left = max(turns, 1)
+
+    @property
+    def remaining(self) -> Optional[int]:
+        """扣除已用和进行中请求的预留之后剩余的 token 数"""
+        return None if self.total is None else self.total - self.used - self.reserved
+
+    def affords(self, tokens: int) -> bool:
+        """剩余的预算是否不少于 tokens，例如预计下一轮要用的 token 数"""
+        return self.total is None or self.remaining >= max(tokens, 1)
+
+    @contextmanager
+    def reserve(self, tokens: int) -> Iterator[None]:
+        """请求进行期间预留 tokens，结束（包括取消）时释放；实际用量由 charge 记录"""
+        self.reserved += tokens
+        try:
+            yield
+        finally:
+            self.reserved -= tokens
+
+    def share(self) -> Optional[int]:
+        """下一次发言可以使用的 token 数（prompt + 输出）"""
+        if self.total is None:
+            return None
+        return max(self.remaining, 0) // self._turns_left
+
+    def charge(self, tokens: int, turn: bool = True):
+        """记录一次请求用掉的 token；turn 为 False 时（例如生成摘要）不计为一次发言"""
+        self.used += tokens
+        if turn and self._turns_left > 1:
+            self._turns_left -= 1
+
+    def state(self) -> Dict[str, int]:
+        return {"used": self.used, "turns_left": self._turns_left}
+
+    def restore(self, state: Optional[Dict[str, int]], turns: int):
+        """旧检查点没有记录预算时，从零开始计算剩余的 turns 次发言"""
+        state = state or {}
+        self.used = state.get("used", 0)
+        self._turns_left = max(state.get("turns_left", turns), 1)
+
+
+def _token_metrics() -> List[str]:
+    name = "salon_prompt_token_ratio"
+    lines = [
+        f"# HELP {name} Moving average of reported / locally predicted prompt tokens",
+        f"# TYPE {name} gauge",
+    ]
+    for model, ratio in calibration.ratios().items():
+        lines.append(f'{name}{{model="{model}"}} {ratio}')
+    return lines
+
+
+register_collector(_token_metrics)
@@ -0,0 +1,344 @@
+"""只追加的讨论记录存储。
+
+每个沙龙一个 JSONL 文件（``<directory>/<salon_id>.jsonl``），Salon.chatting 产出的事件边运行边写入，
+同一发言者连续的 token 片段合并为一条记录；每条记录带有自沙龙开始以来的秒数 ``t``。
+写入经过缓冲，每隔 flush_interval 秒以及每轮开始时 fsync 一次，进程崩溃时最多丢失最后一个间隔的内容。
+写盘和 fsync 在单独的线程中按提交顺序进行，事件循环只负责序列化和入队。
+
+旁边的 ``<salon_id>.idx`` 记录每一轮在 JSONL 中的字节偏移，按轮次读取时直接 seek，不用扫描整个文件；
+``<salon_id>.ckpt.json`` 是最近一个完整轮次结束时的检查点，用于 Salon.resume；
+续跑时先按索引截掉中断那一轮已写入的记录，再接着追加。
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+from config import SalonConfig
+from renderer import ChatRenderer
+from utils import logger
+
+# 所有讨论记录共用一个写盘线程，同一文件的写入、fsync 与关闭保持提交时的顺序
+_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcript-io")
+
+
+def _submit(fn, *args) -> Future:
+    future = _io.submit(fn, *args)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def _log_failure(future: Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"transcript write failed: {future.exception()}")
+
+
+def _replace_file(path: str, data: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def new_salon_id() -> str:
+    return f"{datetime.now():%Y%m%d_%H%M%S}_{uuid4().hex[:6]}"
+
+
+class TranscriptWriter:
+    def __init__(
+        self,
+        path: str,
+        salon_id: str,
+        config: SalonConfig,
+        flush_interval: float = 1.0,
+        resume_round: int = None,
+    ):
+        self._file = open(path, "ab")
+        self._index = open(f"{path[: -len('.jsonl')]}.idx", "a", encoding="utf-8")
+        self._offset = self._file.tell()
+        self._flush_interval = flush_interval
+        self._buffer: List[bytes] = []
+        self._last_flush = time.monotonic()
+        self._start = time.monotonic()
+        self._seq = 0
+        self._round = 0
+        self._speaker: Optional[str] = None
+        # (speaker, "content" | "reasoning") -> 尚未写出的片段
+        self._pending: Dict[Tuple[str, str], List[str]] = {}
+        self._completed = False
+        self._closed = False
+        if resume_round is not None:
+            # 续跑时接着写同一个文件，TranscriptStore 已经截掉了中断那一轮的残留内容
+            self._round = resume_round
+            self._append("salon_resume", data={"round": resume_round})
+            return
+        self._append(
+            "salon_start",
+            data={
+                "salon_id": salon_id,
+                "topic": config.topic,
+                "rounds": config.rounds,
+                "chatters": [cfg.name for cfg in config.chatters],
+                "hoster": config.hoster.name,
+                "speaking_mode": config.speaking_mode,
+                "created": datetime.now().isoformat(timespec="seconds"),
+            },
+        )
+
+    def _append(self, record_type: str, speaker: str = None, data: Any = None):
+        record = {
+            "seq": self._seq,
+            "t": round(time.monotonic() - self._start, 3),
+            "round": self._round,
+            "type": record_type,
+        }
+        if speaker is not None:
+            record["speaker"] = speaker
+        if data is not None:
+            record["data"] = data
+        self._seq += 1
+        self._buffer.append(
+            json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        )
+
+    def _drain_pending(self):
+        for (speaker, kind), pieces in self._pending.items():
+            self._append(kind, speaker, "".join(pieces))
+        self._pending.clear()
+
+    def _write_file(self, data: bytes):
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _write_index(self, line: str):
+        self._index.write(line)
+        self._index.flush()
+
+    def _close_files(self):
+        self._file.close()
+        self._index.close()
+
+    def flush(self):
+        """把缓冲的记录交给写盘线程，不等待写入完成"""
+        self._drain_pending()
+        if self._buffer:
+            data = b"".join(self._buffer)
+            self._buffer.clear()
+            self._offset += len(data)
+            _submit(self._write_file, data)
+        self._last_flush = time.monotonic()
+
+    def write(self, event_type: str, data: Any):
+        if event_type == "new_turn":
+            self.flush()
+            self._round = data
+            _submit(self._write_index, f"{data} {self._offset}\n")
+            self._append("new_turn")
+        elif event_type == "speaker_turn":
+            self._drain_pending()
+            self._speaker = data
+            self._append("speaker_turn", data)
+        elif event_type in ("content_piece", "reasoning_piece"):
+            kind = event_type[: -len("_piece")]
+            self._pending.setdefault((self._speaker, kind), []).append(data)
+        elif event_type in ("speaker_content_piece", "speaker_reasoning_piece"):
+            speaker, piece = data
+            kind = event_type[len("speaker_") : -len("_piece")]
+            self._pending.setdefault((speaker, kind), []).append(piece)
+        elif event_type == "speaker_restart":
+            # 尚未写出的片段直接丢弃，已写出的由读取时的 speaker_restart 记录作废
+            self._pending.pop((data, "content"), None)
+            self._pending.pop((data, "reasoning"), None)
+            self._drain_pending()
+            self._append("speaker_restart", data)
+        else:
+            self._drain_pending()
+            if event_type == "task_finish":
+                self._completed = True
+            self._append(event_type, data=data)
+        if time.monotonic() - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def close(self) -> Optional[Future]:
+        """返回文件关闭时完成的 Future，之前提交的写入都已落盘；已经关闭过时返回 None"""
+        if self._closed:
+            return None
+        self._closed = True
+        self._drain_pending()
+        self._append(
+            "salon_end",
+            data={
+                "completed": self._completed,
+                "elapsed": round(time.monotonic() - self._start, 3),
+            },
+        )
+        self.flush()
+        return _submit(self._close_files)
+
+
+class TranscriptStore:
+    def __init__(self, directory: str):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, salon_id: str) -> str:
+        return os.path.join(self._directory, f"{salon_id}.jsonl")
+
+    async def writer(
+        self,
+        salon_id: str,
+        config: SalonConfig,
+        flush_interval: float = 1.0,
+        resume_round: int = None,
+    ) -> TranscriptWriter:
+        """续跑时先在写盘线程上截掉中断那一轮的残留内容，排在上一个 writer 尚未写完的记录之后，
+        截断完成后再打开新的 writer"""
+        if resume_round is not None:
+            await asyncio.wrap_future(_submit(self._truncate, salon_id, resume_round))
+        return TranscriptWriter(
+            self.path(salon_id), salon_id, config, flush_interval, resume_round
+        )
+
+    def _truncate(self, salon_id: str, round_index: int):
+        """续跑前截掉 round_index 及之后已写入的记录和索引，重跑的轮次不会在记录中出现两次"""
+        offsets = self._round_offsets(salon_id)
+        offset = offsets.get(round_index)
+        if offset is None:
+            return
+        with open(self.path(salon_id), "r+b") as f:
+            if offset < f.seek(0, os.SEEK_END):
+                f.truncate(offset)
+        with open(self.index_path(salon_id), "w", encoding="utf-8") as f:
+            f.writelines(
+                f"{index} {start}\n"
+                for index, start in offsets.items()
+                if index < round_index
+            )
+
+    def checkpoint_path(self, salon_id: str) -> str:
+        return os.path.join(self._directory, f"{salon_id}.ckpt.json")
+
+    def index_path(self, salon_id: str) -> str:
+        return os.path.join(self._directory, f"{salon_id}.idx")
+
+    def save_checkpoint(self, salon_id: str, checkpoint: Dict) -> Future:
+        """原子地覆盖检查点，中途崩溃时旧检查点仍然完整。
+
+        在事件循环中序列化，写盘与 fsync 交给记录的写盘线程，排在之前提交的记录写入之后；
+        返回写入完成时完成的 Future。
+        """
+        data = json.dumps(checkpoint, ensure_ascii=False, separators=(",", ":"))
+        return _submit(_replace_file, self.checkpoint_path(salon_id), data)
+
+    def load_checkpoint(self, salon_id: str) -> Optional[Dict]:
+        try:
+            with open(self.checkpoint_path(salon_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def salon_ids(self) -> List[str]:
+        """所有记录过的沙龙，最近写入的在前"""
+        names = [
+            name[: -len(".jsonl")]
+            for name in os.listdir(self._directory)
+            if name.endswith(".jsonl")
+        ]
+        return sorted(
+            names, key=lambda name: os.path.getmtime(self.path(name)), reverse=True
+        )
+
+    def _round_offsets(self, salon_id: str) -> Dict[int, int]:
+        offsets = {}
+        try:
+            with open(self.index_path(salon_id)) as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2:
+                        offsets[int(parts[0])] = int(parts[1])
+        except FileNotFoundError:
+            pass
+        return offsets
+
+    def read(self, salon_id: str, round_index: int = None) -> Iterator[Dict]:
+        """按顺序读取记录；指定 round_index 时只读取这一轮"""
+        offset = 0
+        if round_index is not None:
+            offset = self._round_offsets(salon_id).get(round_index)
+            if offset is None:
+                return
+        with open(self.path(salon_id), "rb") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程崩溃时最后一行可能只写了一半
+                    logger.warning(f"skipping truncated record in {salon_id}")
+                    break
+                if round_index is not None and record["round"] != round_index:
+                    break
+                yield record
+
+    def header(self, salon_id: str) -> Dict:
+        return next(self.read(salon_id))["data"]
+
+    def events(
+        self, salon_id: str, round_index: int = None
+    ) -> Iterator[Tuple[str, Any]]:
+        """把记录还原为 Salon.chatting 的事件流"""
+        for record in self.read(salon_id, round_index):
+            record_type = record["type"]
+            if record_type == "new_turn":
+                yield ("new_turn", record["round"])
+            elif record_type in ("speaker_turn", "speaker_restart"):
+                yield (record_type, record["speaker"])
+            elif record_type in ("content", "reasoning"):
+                yield (
+                    f"speaker_{record_type}_piece",
+                    (record["speaker"], record["data"]),
+                )
+            elif record_type not in ("salon_start", "salon_resume", "salon_end"):
+                yield (record_type, record.get("data"))
+
+    def utterances(self, salon_id: str, round_index: int = None) -> List[Dict]:
+        """每次发言的完整内容: [{round, speaker, content, reasoning}, ...]"""
+        utterances: List[Dict] = []
+        current: Dict[str, Dict] = {}
+        for record in self.read(salon_id, round_index):
+            record_type = record["type"]
+            if record_type == "speaker_turn":
+                current[record["speaker"]] = {
+                    "round": record["round"],
+                    "speaker": record["speaker"],
+                    "content": "",
+                    "reasoning": "",
+                }
+                utterances.append(current[record["speaker"]])
+            elif record_type == "speaker_restart":
+                current[record["speaker"]].update(content="", reasoning="")
+            elif record_type in ("content", "reasoning"):
+                current[record["speaker"]][record_type] += record["data"]
+        return utterances
+
+    def chat_history(
+        self, salon_id: str, until_round: int = None
+    ) -> Tuple[List[Tuple[str, str]], str]:
+        """重建界面上的聊天记录，返回 (chat_history, title)；until_round 之后的轮次不包含在内"""
+        renderer = ChatRenderer(self.header(salon_id)["rounds"], flush_interval=0)
+        current_round = 0
+        for event_type, data in self.events(salon_id):
+            if event_type == "new_turn":
+                current_round = data
+            if until_round is not None and current_round >= until_round:
+                continue
+            renderer.handle(event_type, data)
+        return renderer.frame()
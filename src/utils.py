@@ -1,18 +1,41 @@
 import asyncio
 import json
-from typing import AsyncGenerator, Dict
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncGenerator, Dict, List, Optional, Tuple
 
-import aiohttp_client
 # import richuru
 from loguru import logger
 
-from config import settings
+from config import ProviderConfig, get_config
+from metrics import INTER_TOKEN, QUEUE_WAIT, TOKENS, TTFT, register_collector
+from ratelimit import (RETRYABLE_STATUS, ProviderError, RetryableError,
+                       TokenBucket, TransportStats, backoff_delay,
+                       is_retryable_error, parse_retry_after)
+from sse import DONE, iter_sse
+from streaming import StopStream
+
+if TYPE_CHECKING:
+    import aiohttp
 
 # richuru.install()
 
 
 class SSEClient:
-    sem = asyncio.Semaphore(settings.semaphore)
+    sem: asyncio.Semaphore = None
+    # 创建 sem 时的 semaphore 配置，重新加载后配置不同时换一个新的；直接赋值的 sem 不受影响
+    _sem_limit: Optional[int] = None
+    # 以下缓存以 ProviderConfig 本身为键：重新加载配置后 provider 的设置变了，
+    # 新的沙龙自然拿到按新设置创建的对象，仍在运行的沙龙继续使用旧快照对应的对象。
+    # 每个 provider 一个长连接的 ClientSession，复用 TCP/TLS 连接与 DNS 缓存
+    _sessions: Dict[ProviderConfig, "aiohttp.ClientSession"] = {}
+    _pool_users = 0
+    # 每个 provider 的并发请求上限，与全局 sem 同时生效；_provider_limits 为按名称覆盖的上限
+    _provider_sems: Dict[ProviderConfig, asyncio.Semaphore] = {}
+    _provider_limits: Dict[str, int] = {}
+    # 每个 provider 的 (requests/min, tokens/min) 令牌桶；传输统计按名称累计
+    _limiters: Dict[ProviderConfig, Tuple[TokenBucket, TokenBucket]] = {}
+    _stats: Dict[str, TransportStats] = {}
     tools = [
         {
             "type": "function",
@@ -33,75 +56,355 @@ class SSEClient:
         }
     ]
 
+    @classmethod
+    def _get_session(cls, provider: ProviderConfig) -> "aiohttp.ClientSession":
+        session = cls._sessions.get(provider)
+        if session is None or session.closed:
+            # aiohttp 在第一次发起请求时才导入，只创建沙龙、不发请求的进程不必付出这部分时间
+            import aiohttp
+
+            connector = aiohttp.TCPConnector(
+                limit=provider.pool_size,
+                keepalive_timeout=provider.keepalive_timeout,
+                ttl_dns_cache=provider.dns_cache_ttl,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=provider.connect_timeout,
+                sock_read=provider.read_timeout,
+            )
+            session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            cls._sessions[provider] = session
+            logger.info(f"created connection pool for provider: {provider.name}")
+        return session
+
+    @classmethod
+    def set_provider_limit(cls, provider: str, limit: int):
+        cls._provider_limits[provider] = limit
+        for config in list(cls._provider_sems):
+            if config.name == provider:
+                del cls._provider_sems[config]
+
+    @classmethod
+    def _get_provider_sem(cls, provider: ProviderConfig) -> asyncio.Semaphore:
+        sem = cls._provider_sems.get(provider)
+        if sem is None:
+            sem = cls._provider_sems[provider] = asyncio.Semaphore(
+                cls._provider_limits.get(provider.name, provider.max_concurrency)
+            )
+        return sem
+
+    @classmethod
+    def _get_sem(cls) -> asyncio.Semaphore:
+        limit = get_config().semaphore
+        if cls.sem is None or cls._sem_limit not in (None, limit):
+            # 正在进行的请求仍在旧的 sem 上释放，之后的请求使用新的上限
+            cls.sem = asyncio.Semaphore(limit)
+            cls._sem_limit = limit
+        return cls.sem
+
+    @classmethod
+    async def close(cls):
+        sessions = list(cls._sessions.values())
+        cls._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+    @classmethod
+    @asynccontextmanager
+    async def pool(cls):
+        """在沙龙运行期间保持连接池，最后一个使用者退出时关闭所有连接"""
+        cls._pool_users += 1
+        try:
+            yield
+        finally:
+            cls._pool_users -= 1
+            if cls._pool_users == 0:
+                await cls.close()
+
+    @classmethod
+    def _get_limiters(cls, provider: ProviderConfig) -> Tuple[TokenBucket, TokenBucket]:
+        limiters = cls._limiters.get(provider)
+        if limiters is None:
+            limiters = cls._limiters[provider] = (
+                TokenBucket(provider.requests_per_minute),
+                TokenBucket(provider.tokens_per_minute),
+            )
+        return limiters
+
+    @classmethod
+    def stats(cls) -> Dict[str, Dict[str, float]]:
+        """各 provider 的请求数、重试次数、续写次数与等待时间"""
+        return {name: stats.as_dict() for name, stats in cls._stats.items()}
+
+    @staticmethod
+    def _resume_payload(payload: Dict, partial: str) -> Dict:
+        # 把已经输出的部分作为 assistant 前缀发回去（DeepSeek beta 的 prefix 续写约定），
+        # 模型从断点接着写，调用方看到的仍是一条连续的流；只用于 prefix_completion 的 provider
+        messages = [
+            *payload["messages"],
+            {"role": "assistant", "content": partial, "prefix": True},
+        ]
+        return {**payload, "messages": messages}
+
     @classmethod
     async def send_sse(
-        cls, url: str, payload: Dict, api_key: str
+        cls, provider: ProviderConfig, payload: Dict
     ) -> AsyncGenerator[str, None]:
+        import aiohttp
+
+        # tokens 依赖本模块的 logger，延迟导入以避免循环引用
+        from tokens import count_message_tokens, estimate_tokens
+
         headers = {
             "Accept": "text/event-stream",
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
+            "Authorization": f"Bearer {provider.api_key}",
         }
-        async with cls.sem:
-            try:
-                async with aiohttp_client.post(
-                    url, json=payload, headers=headers
-                ) as resp:
-                    resp.raise_for_status()
+        stats = cls._stats.setdefault(provider.name, TransportStats())
+        request_bucket, token_bucket = cls._get_limiters(provider)
+        prompt_tokens = count_message_tokens(payload.get("messages", []))
+        if payload.get("stream") and provider.stream_usage:
+            # OpenAI 兼容的接口默认不在流中返回 usage，需要显式要求
+            payload = {**payload, "stream_options": {"include_usage": True}}
+        request = payload
+        attempt = 0
+        # 已经交给调用方的输出：正文用于断线续写，续写时推理过程跳过已输出的部分
+        content: List[str] = []
+        reasoning_sent = 0
+        tool_calls_sent = False
+        model = payload.get("model", "")
+        queue_wait = 0.0
+        ttft = None
 
-                    async for line in resp.content:
-                        if not line:
-                            continue
-
-                        decoded_line = line.decode("utf-8").strip()
+        while True:
+            stats.requests += 1
+            stats.rate_limit_wait += await request_bucket.acquire()
+            stats.rate_limit_wait += await token_bucket.acquire(prompt_tokens)
+            usage = None
+            reasoning_seen = 0
+            last_chunk = None
+            queued = time.perf_counter()
+            try:
+                async with cls._get_sem(), cls._get_provider_sem(provider):
+                    sent = time.perf_counter()
+                    queue_wait += sent - queued
+                    QUEUE_WAIT.observe(sent - queued, provider.name)
+                    session = cls._get_session(provider)
+                    async with session.post(
+                        provider.url, json=request, headers=headers
+                    ) as resp:
+                        if resp.status in RETRYABLE_STATUS:
+                            raise RetryableError(
+                                f"HTTP {resp.status}",
+                                parse_retry_after(resp.headers.get("Retry-After")),
+                            )
+                        resp.raise_for_status()
 
-                        if not decoded_line.startswith("data:"):
-                            continue
-                        json_data_str = decoded_line[len("data:") :].strip()
-                        if json_data_str == "[DONE]":
-                            break
-                        try:
-                            chunk = json.loads(json_data_str)
+                        async for event in iter_sse(resp.content):
+                            if event.data == DONE:
+                                break
+                            try:
+                                chunk = event.json()
+                            except json.JSONDecodeError as e:
+                                logger.warning(
+                                    f"JSON decode error: {e}, data:\n{event.data!r}"
+                                )
+                                continue
 
-                            if "choices" in chunk and chunk["choices"]:
-                                delta = chunk["choices"][0].get("delta", {})
+                            if chunk.get("usage"):
+                                usage = chunk["usage"]
+                            if chunk.get("choices"):
+                                delta = chunk["choices"][0].get("delta") or {}
+                                if (
+                                    delta.get("content")
+                                    or delta.get("reasoning_content")
+                                    or delta.get("tool_calls")
+                                ):
+                                    now = time.perf_counter()
+                                    if ttft is None:
+                                        ttft = now - sent
+                                        TTFT.observe(ttft, provider.name, model)
+                                    elif last_chunk is not None:
+                                        INTER_TOKEN.observe(
+                                            now - last_chunk, provider.name
+                                        )
+                                    last_chunk = now
 
-                                if "tool_calls" in delta and delta["tool_calls"]:
+                                if delta.get("tool_calls"):
+                                    tool_calls_sent = True
                                     yield {
                                         "type": "tool_calls",
                                         "data": delta["tool_calls"],
                                     }
                                 elif delta.get("content"):
+                                    content.append(delta["content"])
                                     yield {"type": "content", "data": delta["content"]}
-                                elif (
-                                    "reasoning_content" in delta
-                                    and delta["reasoning_content"]
-                                ):
-                                    yield {
-                                        "type": "reasoning",
-                                        "data": delta["reasoning_content"],
-                                    }
+                                elif delta.get("reasoning_content"):
+                                    piece = delta["reasoning_content"]
+                                    offset = reasoning_sent - reasoning_seen
+                                    reasoning_seen += len(piece)
+                                    if reasoning_seen > reasoning_sent:
+                                        reasoning_sent = reasoning_seen
+                                        yield {
+                                            "type": "reasoning",
+                                            "data": piece[max(offset, 0) :],
+                                        }
 
-                            elif chunk.get("error"):
-                                error_info = chunk["error"]
+                            elif chunk.get("error") or event.event == "error":
+                                error_info = chunk.get("error", chunk)
                                 error_message = (
                                     error_info.get("message")
                                     if isinstance(error_info, dict)
                                     else str(error_info)
                                 )
-                                logger.error(
-                                    f"API Error:\n{json.dumps(error_message, indent=4)}"
-                                )
-                                raise Exception(
+                                detail = (
                                     f"API Error:\n{json.dumps(error_message, indent=4)}"
                                 )
+                                # 只重试限流、过载和服务端错误，其余错误重发也不会成功
+                                if is_retryable_error(error_info):
+                                    raise RetryableError(detail)
+                                raise ProviderError(detail)
 
-                        except json.JSONDecodeError as e:
-                            logger.warning(
-                                f"JSON decode error: {e}, data:\n{json.dumps(json_data_str, indent=4)}"
-                            )
-                            continue
-
+            except StopStream:
+                # 调用方按停止条件结束：关闭连接，照常补扣配额并产出本次的 stats
+                pass
+            except (GeneratorExit, asyncio.CancelledError):
+                # 调用方提前结束或请求被取消，按已输出的内容补扣 tokens/min 配额
+                stats.cancelled += 1
+                token_bucket.consume(
+                    estimate_tokens("".join(content)) + reasoning_sent // 2
+                )
+                raise
+            except (
+                RetryableError,
+                aiohttp.ClientConnectionError,
+                aiohttp.ClientPayloadError,
+                asyncio.TimeoutError,
+            ) as e:
+                attempt += 1
+                # 工具调用的参数已经分片交给调用方，无法安全续写
+                if tool_calls_sent or attempt > provider.max_retries:
+                    stats.failures += 1
+                    logger.error(f"SSE request failed: {str(e) or type(e).__name__}")
+                    raise
+                delay = backoff_delay(
+                    attempt,
+                    provider.retry_base_delay,
+                    provider.retry_max_delay,
+                    getattr(e, "retry_after", None),
+                )
+                stats.retries += 1
+                stats.retry_wait += delay
+                message = (
+                    f"{provider.name} request failed: {str(e) or type(e).__name__}, "
+                    f"retry {attempt}/{provider.max_retries} in {delay:.2f}s"
+                )
+                restart = False
+                if content and provider.prefix_completion:
+                    stats.resumes += 1
+                    partial = "".join(content)
+                    request = cls._resume_payload(payload, partial)
+                    message += f", resuming after {len(partial)} chars"
+                elif content or reasoning_sent:
+                    # 不支持 prefix 续写时重新生成，调用方收到 restart 后丢弃已输出的部分
+                    stats.restarts += 1
+                    token_bucket.consume(
+                        estimate_tokens("".join(content)) + reasoning_sent // 2
+                    )
+                    content = []
+                    reasoning_sent = 0
+                    restart = True
+                    message += ", restarting the stream"
+                logger.warning(message)
+                await asyncio.sleep(delay)
+                if restart:
+                    yield {"type": "restart"}
+                continue
             except Exception as e:
+                stats.failures += 1
                 logger.error(f"SSE request failed: {str(e)}")
                 raise
+
+            # 按实际输出补扣 tokens/min 配额
+            usage = usage or {}
+            token_bucket.consume(
+                usage.get("completion_tokens")
+                or estimate_tokens("".join(content)) + reasoning_sent // 2
+            )
+            cached_tokens = _cached_tokens(usage)
+            if usage:
+                TOKENS.inc(
+                    usage.get("prompt_tokens", 0), provider.name, model, "prompt"
+                )
+                TOKENS.inc(cached_tokens or 0, provider.name, model, "cached")
+                TOKENS.inc(
+                    usage.get("completion_tokens", 0),
+                    provider.name,
+                    model,
+                    "completion",
+                )
+            # 本次请求的计时与用量，供 Salon 汇总每次发言的指标
+            yield {
+                "type": "stats",
+                "data": {
+                    "queue_wait": queue_wait,
+                    "ttft": ttft,
+                    "retries": attempt,
+                    "prompt_tokens": usage.get("prompt_tokens"),
+                    "cached_tokens": cached_tokens,
+                    "completion_tokens": usage.get("completion_tokens"),
+                },
+            }
+            return
+
+
+def _cached_tokens(usage: Dict):
+    """命中 provider 前缀缓存的 prompt token 数：DeepSeek 为 prompt_cache_hit_tokens，
+    OpenAI 为 prompt_tokens_details.cached_tokens，都没有时返回 None"""
+    if "prompt_cache_hit_tokens" in usage:
+        return usage["prompt_cache_hit_tokens"]
+    details = usage.get("prompt_tokens_details") or {}
+    return details.get("cached_tokens")
+
+
+def _transport_metrics() -> List[str]:
+    lines = []
+    for field, name, documentation in (
+        (
+            "requests",
+            "salon_provider_requests_total",
+            "Requests sent, including retries",
+        ),
+        ("retries", "salon_provider_retries_total", "Retried requests"),
+        ("resumes", "salon_provider_resumes_total", "Streams resumed after a break"),
+        (
+            "restarts",
+            "salon_provider_restarts_total",
+            "Broken streams regenerated from the start, partial output discarded",
+        ),
+        ("failures", "salon_provider_failures_total", "Requests that gave up"),
+        (
+            "cancelled",
+            "salon_provider_cancelled_total",
+            "Streams closed early by a stop condition or a stopped salon",
+        ),
+        (
+            "retry_wait",
+            "salon_provider_retry_wait_seconds_total",
+            "Time spent in retry backoff",
+        ),
+        (
+            "rate_limit_wait",
+            "salon_provider_rate_limit_wait_seconds_total",
+            "Time spent waiting on token buckets",
+        ),
+    ):
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} counter")
+        for provider, stats in SSEClient.stats().items():
+            lines.append(f'{name}{{provider="{provider}"}} {stats[field]}')
+    return lines
+
+
+register_collector(_transport_metrics)